@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import threading
+from math import pi
+from random import random
+from time import sleep, time
+
+from numpy import argpartition, arange, concatenate, empty
+
+# acima deste numero de corpos Nbody.make_stars usa NivelDetalhe
+LIMITE_LOD = 300
+
+def raio_esfera(m, rho):
+    '''(float, float) -> float
+    Raio da esfera desenhada para um corpo de massa m
+    '''
+    return 15 * (m * 3. / rho / 4. / (pi**2))**(1/3)
+
+class Quadro(object):
+    """Copia do estado publicada pela fisica para o renderizador"""
+
+    def __init__(self):
+        self.r = empty((0, 3))
+        self.m = empty(0)
+        # particulas de teste
+        self.rt = empty((0, 3))
+        self.labels = []
+        self.ids = empty(0, dtype=int)
+        self.t = 0.
+        self.passos = 0
+
+    def copia(self, corpos):
+        '''(Quadro, Nbody) -> None
+        Copia posicoes e massas para os arrays do quadro, realocando
+        (e relendo ids e rotulos) apenas quando os corpos mudam; com
+        NivelDetalhe os corpos sao identificados so pelos ids
+        '''
+        e = corpos.estado
+        if len(e) != len(self.m) or (e.ids != self.ids).any():
+            if len(e) != len(self.m):
+                self.r = empty((len(e), 3))
+                self.m = empty(len(e))
+            self.ids = e.ids.copy()
+            self.labels = e.labels() if corpos.lod is None else []
+        self.r[:] = e.r
+        self.m[:] = e.m
+        if len(corpos.testes) != len(self.rt):
+            self.rt = empty((len(corpos.testes), 3))
+        self.rt[:] = corpos.testes.r
+        self.t = corpos.t
+        self.passos = corpos.passos
+
+class BufferDuplo(object):
+    """Dois quadros: a fisica escreve no de tras e troca, o renderizador
+    le o da frente; a fisica nunca espera, se o renderizador ainda
+    estiver lendo o quadro de tras a publicacao e descartada"""
+
+    def __init__(self):
+        self.quadros = [Quadro(), Quadro()]
+        self.frente = 0
+        self.seq = 0
+        self.lendo = None
+        self.trava = threading.Lock()
+        self.publicados = 0
+        self.descartados = 0
+
+    def publica(self, corpos):
+        '''(BufferDuplo, Nbody) -> bool
+        Copia o estado atual para o quadro de tras e o torna o da frente
+        '''
+        tras = 1 - self.frente
+        with self.trava:
+            if self.lendo == tras:
+                self.descartados += 1
+                return False
+        # a copia e feita fora da trava: o renderizador so le a frente
+        self.quadros[tras].copia(corpos)
+        with self.trava:
+            self.frente = tras
+            self.seq += 1
+        self.publicados += 1
+        return True
+
+    def pega(self):
+        '''(BufferDuplo) -> (Quadro, int)
+        Reserva o quadro da frente para leitura; devolver com solta()
+        '''
+        with self.trava:
+            self.lendo = self.frente
+            return self.quadros[self.frente], self.seq
+
+    def solta(self):
+        with self.trava:
+            self.lendo = None
+
+class Renderizador(object):
+    """Desenha o quadro mais recente no seu proprio ritmo enquanto a
+    integracao roda em outra thread"""
+
+    def __init__(self, corpos, fps=60, a_cada=1, ritmo=None):
+        '''(Renderizador, Nbody, int, int, float) -> None
+        fps: quadros desenhados por segundo
+        a_cada: a fisica publica um quadro a cada a_cada passos
+        ritmo: maximo de passos por segundo da fisica (None: sem limite)
+        '''
+        from nbody import carrega_visual, RHO
+        self.visual = carrega_visual()
+        self.rho = RHO
+        self.corpos = corpos
+        self.fps = fps
+        self.a_cada = a_cada
+        self.ritmo = ritmo
+        self.buffer = BufferDuplo()
+        self.visto = -1
+        # ids do ultimo quadro desenhado
+        self.ids = corpos.estado.ids.copy()
+        self.quadros = 0
+        self.erro = None
+        self.referencia = None
+
+    def publica(self, corpos):
+        '''(Renderizador, Nbody) -> None
+        Gancho da integracao: segura a fisica durante a pausa e no
+        limite de ritmo, e publica o estado no buffer
+        '''
+        if corpos.pause:
+            while corpos.pause:
+                sleep(0.05)
+            self.referencia = None
+        if self.ritmo:
+            agora = time()
+            if self.referencia is None:
+                self.referencia = (agora, corpos.passos)
+            alvo = self.referencia[0] + (corpos.passos - self.referencia[1]) / self.ritmo
+            if alvo > agora:
+                sleep(alvo - agora)
+        self.buffer.publica(corpos)
+
+    def raio(self, m):
+        '''(Renderizador, float) -> float
+        Raio da esfera, o mesmo usado em Nbody.make_stars
+        '''
+        return raio_esfera(m, self.rho)
+
+    def desenha(self):
+        '''(Renderizador) -> None
+        Atualiza as esferas com o quadro mais recente, se houver um novo
+        '''
+        q, seq = self.buffer.pega()
+        try:
+            if seq == self.visto:
+                return
+            self.visto = seq
+            visual = self.visual
+            pontos = self.corpos.pontos
+            lod = self.corpos.lod
+
+            # fusoes e binarias: esconde quem sumiu, mostra quem voltou (o
+            # segundo componente de uma binaria desfeita) e atualiza os raios
+            if lod is not None:
+                lod.atualiza(q.r, q.m, q.ids)
+            elif len(q.ids) != len(self.ids) or (q.ids != self.ids).any():
+                vivos = set(q.labels)
+                for lbl in pontos:
+                    pontos[lbl].visible = lbl in vivos
+                for lbl, m in zip(q.labels, q.m.tolist()):
+                    pontos[lbl].radius = self.raio(m)
+            self.ids = q.ids.copy()
+
+            if self.corpos.verbose:
+                print("::%d Corpos - (%.2f anos)::" % (len(q.m), q.t))
+                self.corpos.verbose = False
+
+            r = q.r
+            if lod is None:
+                for i, lbl in enumerate(q.labels):
+                    pontos[lbl].pos = visual.vector(r[i, 0], r[i, 1], r[i, 2])
+            if self.corpos.nuvem is not None:
+                self.corpos.nuvem.pos = q.rt
+
+            if self.corpos.center == 1:
+                visual.scene.center = (q.m.dot(r) / q.m.sum()).tolist()
+            elif self.corpos.center == 2:
+                visual.scene.center = r[q.m.argmax()].tolist()
+            self.quadros += 1
+        finally:
+            self.buffer.solta()
+
+    def _fisica(self, tempo):
+        try:
+            self.corpos.integracao(tempo)
+        except BaseException as erro:
+            self.erro = erro
+
+    def roda(self, tempo):
+        '''(Renderizador, float) -> None
+        Integra por tempo em uma thread separada, desenhando na thread
+        atual (a do VPython, que tambem trata as teclas) ate o fim
+        '''
+        corpos = self.corpos
+        corpos.renderizador = self
+        corpos.a_cada(self.a_cada, self.publica)
+        self.buffer.publica(corpos)
+        fisica = threading.Thread(target=self._fisica, args=(tempo,))
+        fisica.daemon = True
+        t0 = time()
+        fisica.start()
+        while fisica.is_alive():
+            self.visual.rate(self.fps)
+            self.desenha()
+        fisica.join()
+        self.desenha()
+        corpos.ganchos.remove((self.a_cada, self.publica))
+        corpos.renderizador = None
+        if self.erro is not None:
+            raise self.erro
+        dt = max(time() - t0, 1e-12)
+        print("Renderizacao: %d quadros (%.1f/s), %d publicados, %d descartados" % (
+              self.quadros, self.quadros / dt, self.buffer.publicados,
+              self.buffer.descartados))
+
+class NivelDetalhe(object):
+    """Desenho para N grande: todos os corpos em um unico objeto points,
+    atualizado de uma vez a partir do array de posicoes; esferas so para
+    os k corpos de maior massa e, com rastro ligado, o rastro desses k
+    como curvas com um ponto a cada `decimacao` quadros, redesenhadas
+    em lote"""
+
+    def __init__(self, visual, rho, k=20, trail=False, decimacao=5, rastro=200):
+        '''(NivelDetalhe, module, float, int, bool, int, int) -> None
+        k: corpos desenhados como esferas
+        rastro: maximo de pontos de cada rastro
+        '''
+        self.visual = visual
+        self.rho = rho
+        self.k = k
+        self.trail = trail
+        self.decimacao = decimacao
+        self.rastro = rastro
+        self.nuvem = None
+        # esferas, curvas e rastros (buffer circular, pontos gravados)
+        # pelo id do corpo
+        self.esferas = {}
+        self.curvas = {}
+        self.rastros = {}
+        self.indices = empty(0, dtype=int)
+        self.ids = []
+        self.n = -1
+        self.quadros = 0
+
+    def seleciona(self, r, m, ids):
+        '''(NivelDetalhe, array, array, array) -> None
+        Escolhe os k corpos de maior massa, reaproveitando as esferas
+        de quem continua entre eles e escondendo as dos demais
+        '''
+        visual = self.visual
+        k = min(self.k, len(m))
+        if k < len(m):
+            self.indices = argpartition(-m, k - 1)[:k]
+        else:
+            self.indices = arange(len(m))
+        self.ids = ids[self.indices].tolist()
+        escolhidos = set(self.ids)
+        for i in list(self.esferas):
+            if i not in escolhidos:
+                self.esferas.pop(i).visible = False
+                self._apaga_rastro(i)
+        for i, j in zip(self.indices.tolist(), self.ids):
+            if j not in self.esferas:
+                self.esferas[j] = visual.sphere(
+                    pos=tuple(r[i]), color=(random(), random(), random()),
+                    material=visual.materials.marble)
+            self.esferas[j].radius = raio_esfera(m[i], self.rho)
+        if self.nuvem is None:
+            self.nuvem = visual.points(pos=r, size=2, color=(1, 0.9, 0.7))
+        self.n = len(m)
+
+    def atualiza(self, r, m, ids):
+        '''(NivelDetalhe, array, array, array) -> None
+        Desenha o quadro: a nuvem inteira de uma vez, as k esferas e, a
+        cada `decimacao` quadros, os rastros
+        '''
+        if len(m) != self.n or ids[self.indices].tolist() != self.ids:
+            self.seleciona(r, m, ids)
+        self.nuvem.pos = r
+        vector = self.visual.vector
+        sel = r[self.indices]
+        for j, x in zip(self.ids, sel.tolist()):
+            self.esferas[j].pos = vector(*x)
+        self.quadros += 1
+        if self.trail and self.quadros % self.decimacao == 0:
+            for j, x in zip(self.ids, sel):
+                self._estende_rastro(j, x)
+
+    def _estende_rastro(self, j, x):
+        if j not in self.rastros:
+            self.rastros[j] = [empty((self.rastro, 3)), 0]
+            self.curvas[j] = self.visual.curve(color=self.esferas[j].color)
+        buf, c = self.rastros[j]
+        buf[c % self.rastro] = x
+        c += 1
+        self.rastros[j][1] = c
+        if c <= self.rastro:
+            self.curvas[j].pos = buf[:c]
+        else:
+            # do ponto mais antigo ao mais novo
+            i = c % self.rastro
+            self.curvas[j].pos = concatenate((buf[i:], buf[:i]))
+
+    def _apaga_rastro(self, j):
+        if j in self.curvas:
+            self.curvas.pop(j).visible = False
+            del self.rastros[j]
+
+    def set_trail(self, trail):
+        '''(NivelDetalhe, bool) -> None
+        Liga ou desliga (apagando) os rastros
+        '''
+        self.trail = trail
+        if not trail:
+            for j in list(self.curvas):
+                self._apaga_rastro(j)
+
+    def esconde(self):
+        '''(NivelDetalhe) -> None
+        Remove da cena tudo o que foi desenhado
+        '''
+        self.set_trail(False)
+        for j in list(self.esferas):
+            self.esferas.pop(j).visible = False
+        if self.nuvem is not None:
+            self.nuvem.visible = False
+            self.nuvem = None
+        self.n = -1
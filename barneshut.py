@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+from time import time
+
+from numpy import (add, arange, argsort, bincount, concatenate, cumsum, empty,
+                   flatnonzero, maximum, minimum, ones, percentile, r_,
+                   repeat, sqrt, uint64, zeros)
+
+from forcas import acel_direta
+
+# profundidade maxima da octree (bits por eixo da chave de Morton)
+PROF = 16
+
+def _espalha(x):
+    '''(array of uint64) -> array of uint64
+    Intercala dois bits zero entre cada bit de x (ate 21 bits)
+    '''
+    x = x & uint64(0x1fffff)
+    x = (x | (x << uint64(32))) & uint64(0x1f00000000ffff)
+    x = (x | (x << uint64(16))) & uint64(0x1f0000ff0000ff)
+    x = (x | (x << uint64(8))) & uint64(0x100f00f00f00f00f)
+    x = (x | (x << uint64(4))) & uint64(0x10c30c30c30c30c3)
+    x = (x | (x << uint64(2))) & uint64(0x1249249249249249)
+    return x
+
+def morton(r, prof=PROF):
+    '''(array, int) -> array of uint64
+    Retorna a chave de Morton de cada posicao dentro do cubo envolvente
+    '''
+    lo = r.min(axis=0)
+    lado = (r.max(axis=0) - lo).max()
+    if lado == 0:
+        lado = 1.
+    c = ((r - lo) * ((2**prof - 1) / lado)).astype(uint64)
+    return (_espalha(c[:, 0]) | (_espalha(c[:, 1]) << uint64(1)) |
+            (_espalha(c[:, 2]) << uint64(2)))
+
+def _expande(alvo, ini, cont):
+    '''(array, array, array) -> (array, array)
+    Repete cada alvo cont vezes, pareando com ini, ini+1, ..., ini+cont-1
+    '''
+    a = repeat(alvo, cont)
+    desl = repeat(ini - (cumsum(cont) - cont), cont)
+    return a, desl + arange(len(a))
+
+class Octree(object):
+    """Classe Octree, arvore de Barnes-Hut guardada em arrays planos"""
+
+    def __init__(self, r, m, folha=8, prof=PROF):
+        '''(Octree, array, array, int, int) -> None
+        Constroi a arvore ordenando os corpos pela chave de Morton,
+        cada no e um intervalo [ini, fim) dos corpos ordenados
+        '''
+        n = len(m)
+        chaves = morton(r, prof)
+        self.ordem = argsort(chaves, kind='mergesort')
+        chaves = chaves[self.ordem]
+
+        # por nivel: inicio de todos os segmentos e quais deles sao nos
+        self.niveis = []
+        ini, fim = [], []
+        ativo = ones(n, dtype=bool)
+        for L in range(prof + 1):
+            k = chaves >> uint64(3 * (prof - L))
+            todos = flatnonzero(r_[True, k[1:] != k[:-1]])
+            sel = flatnonzero(ativo[todos])
+            if len(sel) == 0:
+                break
+            a = todos[sel]
+            b = r_[todos[1:], n][sel]
+            self.niveis.append((todos, sel))
+            ini.append(a)
+            fim.append(b)
+            # nos com poucos corpos viram folhas
+            f = b - a <= folha
+            marca = bincount(a[f], minlength=n+1) - bincount(b[f], minlength=n+1)
+            ativo &= cumsum(marca[:-1]) == 0
+        self.ini = concatenate(ini)
+        self.fim = concatenate(fim)
+        self.folha = ones(len(self.ini), dtype=bool)
+        self.filho_ini = zeros(len(self.ini), dtype=int)
+        self.nfilhos = zeros(len(self.ini), dtype=int)
+
+        # filhos de cada no interno sao contiguos no nivel seguinte
+        base = 0
+        for L in range(len(ini) - 1):
+            prox = base + len(ini[L])
+            pais = ini[L].searchsorted(ini[L+1], side='right') - 1
+            cont = bincount(pais, minlength=len(ini[L]))
+            self.folha[base:prox] = cont == 0
+            self.nfilhos[base:prox] = cont
+            self.filho_ini[base:prox] = prox + cumsum(cont) - cont
+            base = prox
+        self.interacoes = 0
+        self.refaz(r, m)
+
+    def refaz(self, r, m):
+        '''(Octree, array, array) -> None
+        Recalcula massa, centro de massa e tamanho dos nos
+        mantendo a topologia da arvore
+        '''
+        rs = r[self.ordem]
+        ms = m[self.ordem]
+        mr = rs * ms[:, None]
+        massa, cm, lado = [], [], []
+        for todos, sel in self.niveis:
+            mt = add.reduceat(ms, todos)[sel]
+            massa.append(mt)
+            cm.append(add.reduceat(mr, todos, axis=0)[sel] / mt[:, None])
+            ext = (maximum.reduceat(rs, todos, axis=0)[sel] -
+                   minimum.reduceat(rs, todos, axis=0)[sel])
+            lado.append(ext.max(axis=1))
+        self.massa = concatenate(massa)
+        self.cm = concatenate(cm)
+        self.lado = concatenate(lado)
+        self.rs = rs
+        self.ms = ms
+
+    def aceleracoes(self, G, theta, alvos=None, potencial=False):
+        '''(Octree, float, float, array, bool) -> array
+        Percorre a arvore para todos os corpos (ou so os alvos) ao mesmo
+        tempo, retornando as aceleracoes na ordem original;
+        com potencial=True retorna tambem o potencial de cada corpo
+        '''
+        rs = self.rs
+        n = len(self.ms)
+        acel = zeros((n, 3))
+        self.phi = zeros(n) if potencial else None
+        if alvos is None:
+            alvo = arange(n)
+        else:
+            pos = empty(n, dtype=int)
+            pos[self.ordem] = arange(n)
+            alvo = pos[alvos]
+        alvo_inicial = alvo
+        no = zeros(len(alvo), dtype=int)
+        theta2 = theta * theta
+        self.interacoes = 0
+        while len(alvo):
+            d = self.cm[no] - rs[alvo]
+            d2 = (d * d).sum(axis=1)
+            # um no que contem o proprio alvo nunca e aproximado
+            dentro = (self.ini[no] <= alvo) & (alvo < self.fim[no])
+            longe = ~dentro & (self.lado[no]**2 < theta2 * d2)
+
+            # aproximacao de monopolo para nos distantes
+            self._acumula(acel, alvo[longe], d[longe], d2[longe],
+                          self.massa[no[longe]])
+
+            # folhas proximas: soma direta com os corpos da folha
+            perto = flatnonzero(~longe & self.folha[no])
+            a, j = _expande(alvo[perto], self.ini[no[perto]],
+                            self.fim[no[perto]] - self.ini[no[perto]])
+            outro = a != j
+            a, j = a[outro], j[outro]
+            d = rs[j] - rs[a]
+            self._acumula(acel, a, d, (d * d).sum(axis=1), self.ms[j])
+
+            # nos internos proximos: desce para os filhos
+            abre = flatnonzero(~longe & ~self.folha[no])
+            alvo, no = _expande(alvo[abre], self.filho_ini[no[abre]],
+                                self.nfilhos[no[abre]])
+        acel *= G
+        if alvos is not None:
+            saida = acel[alvo_inicial]
+            if potencial:
+                return saida, G * self.phi[alvo_inicial]
+            return saida
+        saida = empty((n, 3))
+        saida[self.ordem] = acel
+        if potencial:
+            phi = empty(n)
+            phi[self.ordem] = G * self.phi
+            return saida, phi
+        return saida
+
+    def _acumula(self, acel, a, d, d2, massa):
+        '''(Octree, array, array, array, array, array) -> None
+        Soma em acel[a] as contribuicoes massa * d / |d|^3
+        '''
+        if len(a) == 0:
+            return
+        d1 = sqrt(d2)
+        w = massa / (d2 * d1)
+        n = len(acel)
+        for k in range(3):
+            acel[:, k] += bincount(a, weights=w * d[:, k], minlength=n)
+        if self.phi is not None:
+            self.phi -= bincount(a, weights=massa / d1, minlength=n)
+        self.interacoes += len(a)
+
+class BarnesHut(object):
+    """Forca por octree de Barnes-Hut, O(N log N)"""
+
+    nome = "bh"
+
+    def __init__(self, theta=0.5, folha=8, reconstroi=1):
+        '''(BarnesHut, float, int, int) -> None
+        theta: angulo de abertura (0 recupera a soma direta)
+        folha: maximo de corpos por folha
+        reconstroi: reconstroi a arvore a cada `reconstroi` avaliacoes de
+               forca, nas demais apenas reajusta os nos; o backend nao ve
+               os passos: cada passo e 1 avaliacao no euler e no leapfrog,
+               3 no yoshida4, 4 no rk4 e varias parciais no blocos
+        '''
+        self.theta = theta
+        self.folha = folha
+        self.reconstroi = reconstroi
+        self.arvore = None
+        # avaliacoes de forca desde a criacao do backend
+        self.avaliacoes = 0
+
+    def aceleracoes(self, r, m, G):
+        '''(BarnesHut, array, array, float) -> array
+        Retorna as aceleracoes (N, 3) de todos os corpos
+        '''
+        self._arvore(r, m)
+        return self.arvore.aceleracoes(G, self.theta)
+
+    def aceleracoes_alvos(self, r, m, G, alvos):
+        '''(BarnesHut, array, array, float, array) -> array
+        Retorna as aceleracoes (len(alvos), 3) apenas dos corpos alvos
+        '''
+        self._arvore(r, m)
+        return self.arvore.aceleracoes(G, self.theta, alvos)
+
+    @property
+    def interacoes(self):
+        '''(BarnesHut) -> int
+        Interacoes (corpo-corpo ou corpo-no) da ultima avaliacao
+        '''
+        return self.arvore.interacoes if self.arvore else 0
+
+    def _arvore(self, r, m):
+        '''(BarnesHut, array, array) -> None
+        Reconstroi ou reajusta a arvore para as posicoes atuais
+        '''
+        if (self.arvore is None or len(self.arvore.ms) != len(m)
+                or self.avaliacoes % self.reconstroi == 0):
+            self.arvore = Octree(r, m, self.folha)
+        else:
+            self.arvore.refaz(r, m)
+        self.avaliacoes += 1
+
+    def fechar(self):
+        '''(BarnesHut) -> None
+        Libera recursos do backend
+        '''
+        self.arvore = None
+
+def relatorio_theta(pts, thetas=(0.2, 0.3, 0.5, 0.7, 1.0), G=1, folha=8):
+    '''(list of Particula, tuple, float, int) -> list of dict
+    Compara Barnes-Hut com a soma direta no mesmo conjunto de particulas,
+    imprimindo erro relativo da aceleracao e tempo para cada theta
+    '''
+    from estado import Estado
+    e = Estado(pts)
+    t0 = time()
+    ref = acel_direta(e.r, e.m, G)
+    t_dir = time() - t0
+    mod = sqrt((ref * ref).sum(axis=1))
+
+    print("N = %d, soma direta: %.3f s" % (len(e), t_dir))
+    print("  theta |  erro mediano |  erro p99    |  erro max    |  tempo (s) |  interacoes")
+    print("-" * 82)
+    linhas = []
+    for theta in thetas:
+        bh = BarnesHut(theta, folha)
+        t0 = time()
+        a = bh.aceleracoes(e.r, e.m, G)
+        t_bh = time() - t0
+        d = a - ref
+        erro = sqrt((d * d).sum(axis=1)) / mod
+        lin = {"theta": theta, "erro_mediano": percentile(erro, 50),
+               "erro_p99": percentile(erro, 99), "erro_max": erro.max(),
+               "tempo": t_bh, "tempo_direto": t_dir,
+               "interacoes": bh.arvore.interacoes}
+        linhas.append(lin)
+        print("  %5.2f |  %.6e |  %.6e |  %.6e |  %9.3f |  %d" % (
+              theta, lin["erro_mediano"], lin["erro_p99"], lin["erro_max"],
+              t_bh, lin["interacoes"]))
+    return linhas
+
+###############################################################################
+
+if __name__ == "__main__":
+    from random import triangular as next_rand
+    from sys import argv
+    from particula import Particula
+
+    # mesmas distribuicoes do modo [G]erar particulas aleatorias
+    R, V, M = 100, 1.5, 70
+    N = int(argv[1]) if len(argv) > 1 else 2000
+    pts = []
+    for i in range(N):
+        r = (next_rand(-R, R), next_rand(-R, R), next_rand(-R, R))
+        v = (next_rand(-V, V), next_rand(-V, V), next_rand(-V, V))
+        pts.append(Particula("p_%d" % (i+1), r, v, next_rand(0.7, M)))
+    relatorio_theta(pts)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from multiprocessing import cpu_count
+from time import time
+
+import numpy
+
+import nbody
+from nbody import Nbody, sistema_solar, gera_aleatorias
+from integradores import INTEGRADORES
+from forcas import FORCAS
+from diagnosticos import energia
+
+CENARIOS = ("solar", "arquivo", "aleatorio")
+TAMANHOS = (5, 100, 1000, 10000)
+
+# pares avaliados por configuracao, define o numero de passos
+PARES = 2e8
+
+def particulas(cenario, n, semente):
+    '''(str, int, int) -> list of Particula
+    Monta as particulas do cenario com semente fixa
+    '''
+    random.seed(semente)
+    if cenario == "solar":
+        return sistema_solar()
+    pts = gera_aleatorias(n)
+    if cenario == "arquivo":
+        # ida e volta pelo formato texto de registra / carrega
+        dir_ant = os.getcwd()
+        tmp = tempfile.mkdtemp()
+        try:
+            os.chdir(tmp)
+            os.mkdir("regs")
+            corpos = Nbody(pts, headless=True)
+            arq = open("regs/nbody-bench.txt", "w")
+            arq.write(str(corpos))
+            arq.close()
+            pts = corpos.carrega("bench")
+        finally:
+            os.chdir(dir_ant)
+            shutil.rmtree(tmp)
+    return pts
+
+def momento(corpos):
+    '''(Nbody) -> (array, float)
+    Momento total e soma dos modulos dos momentos
+    '''
+    p = corpos.estado.p
+    return p.sum(axis=0), numpy.sqrt((p * p).sum(axis=1)).sum()
+
+def mede(cenario, n, forca, integrador, passos, semente):
+    '''(str, int, str, str, int, int) -> dict
+    Roda uma configuracao sem visualizacao e retorna as medidas
+    '''
+    nbody.EPS = 0.2 if cenario == "solar" else nbody.R / 40
+    pts = particulas(cenario, n, semente)
+    corpos = Nbody(pts, forca=forca, headless=True, integrador=integrador)
+    n = corpos.n
+    e0 = energia(corpos)
+    p0, escala = momento(corpos)
+
+    # aquecimento (cria o pool de processos, compila caches, etc.)
+    corpos.integracao(corpos.dt / 2)
+    corpos.forcas = 0
+
+    feitos = corpos.passos
+    t0 = time()
+    corpos.integracao(passos * corpos.dt)
+    dt = time() - t0
+    feitos = corpos.passos - feitos
+    forcas = corpos.forcas
+
+    # memoria de pico de um passo, medida a parte para nao pesar no tempo
+    pico = float("nan")
+    try:
+        import tracemalloc
+        tracemalloc.start()
+        corpos.integracao(corpos.dt / 2)
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    except ImportError:
+        pass
+    corpos.forca.fechar()
+
+    p, _ = momento(corpos)
+    return {"cenario": cenario, "n": n, "n_final": corpos.n, "forca": forca,
+            "integrador": integrador, "passos": feitos, "tempo": dt,
+            "passos_s": feitos / dt,
+            "pares_s": forcas * n * (n - 1) / dt,
+            "memoria_pico_mb": pico / 2**20,
+            "deriva_energia": abs(energia(corpos) / e0 - 1),
+            "deriva_momento": float(numpy.sqrt(((p - p0)**2).sum()) / escala)}
+
+def compara(atual, antigo, tolerancia):
+    '''(list of dict, list of dict, float) -> list of str
+    Retorna as configuracoes que ficaram mais lentas que a tolerancia
+    '''
+    chave = lambda r: (r["cenario"], r["n"], r["forca"], r["integrador"])
+    ref = dict((chave(r), r) for r in antigo)
+    lentas = []
+    for r in atual:
+        a = ref.get(chave(r))
+        if a is None:
+            continue
+        razao = r["passos_s"] / a["passos_s"]
+        if razao < 1 - tolerancia:
+            lentas.append("%s N=%d %s/%s: %.1f -> %.1f passos/s (%.0f%%)" % (
+                          chave(r) + (a["passos_s"], r["passos_s"], 100 * (razao - 1))))
+    return lentas
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark dos cenarios do nbody")
+    ap.add_argument("--cenarios", nargs="+", default=CENARIOS, choices=CENARIOS)
+    ap.add_argument("--n", nargs="+", type=int, default=TAMANHOS)
+    ap.add_argument("--forcas", nargs="+", default=FORCAS, choices=FORCAS)
+    ap.add_argument("--integradores", nargs="+", default=sorted(INTEGRADORES),
+                    choices=sorted(INTEGRADORES))
+    ap.add_argument("--passos", type=int, default=None,
+                    help="passos por configuracao (padrao: ~%g pares)" % PARES)
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--saida", default="bench.json")
+    ap.add_argument("--compara", default=None, help="JSON de uma rodada anterior")
+    ap.add_argument("--tolerancia", type=float, default=0.1)
+    args = ap.parse_args()
+
+    resultados = []
+    print("  cenario |      N |    forca | integrador |  passos/s |    pares/s | pico MB | d energia | d momento")
+    print("-" * 106)
+    for cenario in args.cenarios:
+        for n in ([5] if cenario == "solar" else args.n):
+            passos = args.passos or int(min(200, max(3, PARES / (n * n))))
+            for forca in args.forcas:
+                for integrador in args.integradores:
+                    r = mede(cenario, n, forca, integrador, passos, args.semente)
+                    resultados.append(r)
+                    print("%9s | %6d | %8s | %10s | %9.1f | %10.3e | %7.1f | %9.2e | %9.2e" % (
+                          cenario, r["n"], forca, integrador, r["passos_s"],
+                          r["pares_s"], r["memoria_pico_mb"],
+                          r["deriva_energia"], r["deriva_momento"]))
+                    sys.stdout.flush()
+
+    meta = {"data": datetime.now().isoformat(), "python": platform.python_version(),
+            "numpy": numpy.__version__, "plataforma": platform.platform(),
+            "cpus": cpu_count(), "semente": args.semente}
+    arq = open(args.saida, "w")
+    json.dump({"meta": meta, "resultados": resultados}, arq, indent=1)
+    arq.close()
+    print("\nResultados em %s" % args.saida)
+
+    if args.compara:
+        arq = open(args.compara)
+        antigo = json.load(arq)["resultados"]
+        arq.close()
+        lentas = compara(resultados, antigo, args.tolerancia)
+        if lentas:
+            print("\nMais lentas que %s:" % args.compara)
+            for l in lentas:
+                print("  " + l)
+            sys.exit(1)
+        print("\nNenhuma regressao em relacao a %s" % args.compara)
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
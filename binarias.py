@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+from math import pi
+
+from numpy import (arange, array, concatenate, cos, cross, einsum, empty, eye,
+                   floor, full, inf, isin, maximum, sin, sqrt, stack,
+                   where, zeros)
+
+from colisoes import contatos
+from estado import Estado
+from forcas import PARES_BLOCO
+
+# perturbacao relativa abaixo da qual a binaria segue a orbita de Kepler
+# exata, sem passos no tempo ficticio
+GAMA_MIN = 1e-6
+
+def matriz_ks(u):
+    '''(array) -> array
+    Matrizes de Kustaanheimo-Stiefel L(u) (B, 4, 4) das coordenadas u (B, 4)
+    '''
+    u1, u2, u3, u4 = u[:, 0], u[:, 1], u[:, 2], u[:, 3]
+    return stack([stack([u1, -u2, -u3, u4], axis=1),
+                  stack([u2, u1, -u4, -u3], axis=1),
+                  stack([u3, u4, u1, u2], axis=1),
+                  stack([u4, -u3, u2, -u1], axis=1)], axis=1)
+
+def ks(rel, vel):
+    '''(array, array) -> (array, array)
+    Transformacao de Kustaanheimo-Stiefel das posicoes e velocidades
+    relativas (B, 3): coordenadas u (B, 4), com rel = L(u) u, e as
+    derivadas w = du/ds = L(u)^T vel / 2 no tempo ficticio s (dt = r ds)
+    '''
+    x, y, z = rel[:, 0], rel[:, 1], rel[:, 2]
+    r = sqrt((rel * rel).sum(axis=1))
+    u = zeros((len(rel), 4))
+    # dos dois ramos, o que nao divide por um numero pequeno
+    pos = x >= 0
+    a = sqrt((r + abs(x)) / 2)
+    u[:, 0] = where(pos, a, y / (2 * a))
+    u[:, 1] = where(pos, y / (2 * a), a)
+    u[:, 2] = where(pos, z / (2 * a), 0)
+    u[:, 3] = where(pos, 0, z / (2 * a))
+    v4 = concatenate([vel, zeros((len(vel), 1))], axis=1)
+    w = einsum("bji,bj->bi", matriz_ks(u), v4) / 2
+    return u, w
+
+def fisicas(u, w):
+    '''(array, array) -> (array, array)
+    Inversa de ks: posicoes e velocidades relativas (B, 3)
+    '''
+    L = matriz_ks(u)
+    rel = einsum("bij,bj->bi", L, u)[:, :3]
+    r = (u * u).sum(axis=1)
+    vel = 2 * einsum("bij,bj->bi", L, w)[:, :3] / r[:, None]
+    return rel, vel
+
+def elementos(rel, vel, mu):
+    '''(array, array, array) -> (array, array, array)
+    Energia especifica h, pericentro e apocentro das orbitas relativas
+    (o apocentro e infinito nas orbitas abertas)
+    '''
+    r = sqrt((rel * rel).sum(axis=1))
+    h = (vel * vel).sum(axis=1) / 2 - mu / r
+    l = cross(rel, vel)
+    e = sqrt(maximum(0, 1 + 2 * h * (l * l).sum(axis=1) / (mu * mu)))
+    # pericentro na forma l^2 / (mu (1 + e)), que vale tambem para e >= 1
+    q = (l * l).sum(axis=1) / (mu * (1 + e))
+    Q = where(h < 0, -mu / (2 * h) * (1 + e), inf)
+    return h, q, Q
+
+def mare(rc, r, m, G, exclui, bloco=PARES_BLOCO):
+    '''(array, array, array, float, array, int) -> array
+    Tensor de mare (B, 3, 3) dos corpos r, m nos pontos rc, sem os corpos
+    exclui[b] (B, k) de cada ponto: a aceleracao relativa de dois pontos
+    separados por d perto de rc[b] e T[b] . d
+    '''
+    T = zeros((len(rc), 3, 3))
+    passo = max(1, bloco // max(len(m), 1))
+    for i in range(0, len(rc), passo):
+        j = min(i + passo, len(rc))
+        d = r[None, :, :] - rc[i:j, None, :]
+        d2 = (d * d).sum(axis=2)
+        d2[arange(j - i)[:, None], exclui[i:j]] = inf
+        q = G * m / (d2 * sqrt(d2))
+        T[i:j] = 3 * einsum("bn,bni,bnk->bik", q / d2, d, d)
+        T[i:j] -= q.sum(axis=1)[:, None, None] * eye(3)
+    return T
+
+def oscilador(u, w, h, dt):
+    '''(array, array, array, float) -> (array, array)
+    Avanca por dt de tempo fisico as binarias sem perturbacao: em KS o
+    movimento e um oscilador harmonico de frequencia sqrt(-h/2) no tempo
+    ficticio e t(s) tem forma fechada, resolvida por Newton protegido por
+    bissecao; o custo nao depende da separacao nem do numero de orbitas
+    '''
+    om = sqrt(-h / 2)
+    A = (u * u).sum(axis=1)
+    B = (w * w).sum(axis=1) / (om * om)
+    C = (u * w).sum(axis=1) / om
+
+    # r = |u|^2 tem periodo pi / om em s: tira as orbitas inteiras
+    meia = pi / om
+    periodo = (A + B) * meia / 2
+    k = floor(dt / periodo)
+    resto = dt - k * periodo
+
+    lo = zeros(len(h))
+    hi = meia.copy()
+    s = resto / periodo * meia
+    for _ in range(100):
+        x = 2 * om * s
+        f = (A + B) * s / 2 + (A - B) * sin(x) / (4 * om) + C * (1 - cos(x)) / (2 * om) - resto
+        r = (A + B) / 2 + (A - B) / 2 * cos(x) + C * sin(x)
+        lo = where(f < 0, s, lo)
+        hi = where(f > 0, s, hi)
+        novo = s - f / r
+        fora = (novo <= lo) | (novo >= hi)
+        novo = where(fora, (lo + hi) / 2, novo)
+        if (abs(novo - s) <= 1e-15 * meia).all():
+            s = novo
+            break
+        s = novo
+
+    # a cada meia volta em s, u troca de sinal (r e o mesmo)
+    sinal = where(k % 2 == 1, -1., 1.)[:, None]
+    c, sn = cos(om * s)[:, None], sin(om * s)[:, None]
+    o = om[:, None]
+    return sinal * (u * c + w / o * sn), sinal * (w * c - u * o * sn)
+
+def _derivadas(y, T):
+    '''(array, array) -> array
+    Equacoes de KS perturbadas para y = (u, w, h, t) (B, 10): u' = w,
+    w' = h u / 2 + r L(u)^T P / 2, h' = 2 w . L(u)^T P, t' = r, com a
+    perturbacao P = T . rel
+    '''
+    u, w, h = y[:, :4], y[:, 4:8], y[:, 8]
+    L = matriz_ks(u)
+    r = (u * u).sum(axis=1)
+    rel = einsum("bij,bj->bi", L, u)[:, :3]
+    P = concatenate([einsum("bij,bj->bi", T, rel), zeros((len(y), 1))], axis=1)
+    LtP = einsum("bji,bj->bi", L, P)
+    return concatenate([w, h[:, None] / 2 * u + r[:, None] / 2 * LtP,
+                        2 * (w * LtP).sum(axis=1)[:, None], r[:, None]], axis=1)
+
+def _rk4(y, ds, T):
+    ds = ds[:, None]
+    k1 = _derivadas(y, T)
+    k2 = _derivadas(y + k1 * (ds / 2), T)
+    k3 = _derivadas(y + k2 * (ds / 2), T)
+    k4 = _derivadas(y + k3 * ds, T)
+    return y + (k1 + 2 * k2 + 2 * k3 + k4) * (ds / 6)
+
+def perturbadas(u, w, h, T, dt, passos=64):
+    '''(array, array, array, array, float, int) -> (array, array, array, int)
+    Avanca por dt de tempo fisico as binarias sob as mares T, por RK4 no
+    tempo ficticio com `passos` passos por orbita (as equacoes de KS nao
+    tem singularidade em r = 0), todas juntas; o ultimo passo de cada uma
+    e ajustado por Newton para terminar em dt; retorna tambem o total de
+    passos dados
+    '''
+    y = concatenate([u, w, h[:, None], zeros((len(h), 1))], axis=1)
+    ds = 2 * pi / (sqrt(-h / 2) * passos)
+    k = len(h)
+    while True:
+        r = (y[:, :4] * y[:, :4]).sum(axis=1)
+        ativo = y[:, 9] + r * ds < dt
+        if not ativo.any():
+            break
+        y[ativo] = _rk4(y[ativo], ds[ativo], T[ativo])
+        k += int(ativo.sum())
+    y0 = y
+    s = (dt - y0[:, 9]) / r
+    for _ in range(5):
+        y = _rk4(y0, s, T)
+        erro = dt - y[:, 9]
+        if (abs(erro) <= 1e-14 * dt).all():
+            break
+        s = s + erro / (y[:, :4] * y[:, :4]).sum(axis=1)
+    return y[:, :4], y[:, 4:8], y[:, 8], k
+
+class Binarias(object):
+    """Pares ligados e proximos regularizados por Kustaanheimo-Stiefel (KS):
+    cada par vira um unico corpo no centro de massa para o resto do sistema
+    (na linha do componente mais massivo do Estado; o outro e retirado) e o
+    movimento relativo e integrado a parte, no seu proprio relogio, em
+    coordenadas KS sob a mare dos demais corpos; sem perturbacao relevante
+    a orbita e avancada de forma exata, com custo fixo por passo"""
+
+    def __init__(self, raio, gama=0.1, gama_min=GAMA_MIN, passos=64):
+        '''(Binarias, float, float, float, int) -> None
+        raio: separacao abaixo da qual um par ligado vira binaria (com
+        apocentro menor que 2 raio); a binaria e desfeita quando os
+        componentes se afastam mais de 2 raio
+        gama: perturbacao maxima (mare x apocentro^3 / G M) para formar;
+        acima de 2 gama a binaria e desfeita
+        gama_min: perturbacao abaixo da qual a orbita e a de Kepler
+        passos: passos de RK4 por orbita das binarias perturbadas
+        '''
+        self.raio = raio
+        self.gama = gama
+        self.gama_min = gama_min
+        self.passos = passos
+        # id da linha do centro de massa (a do primeiro componente),
+        # massa do primeiro componente e estado KS do movimento relativo
+        # (r2 - r1) de cada binaria
+        self.ids = empty(0, dtype=int)
+        self.m1 = empty(0)
+        self.u = empty((0, 4))
+        self.w = empty((0, 4))
+        self.h = empty(0)
+        # segundos componentes, fora do Estado enquanto a binaria existe
+        self.segundos = Estado()
+        self.formadas = 0
+        self.desfeitas = 0
+        self.fundidas = 0
+        self.passos_ks = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def m2(self):
+        return self.segundos.m
+
+    def parametros(self):
+        '''(Binarias) -> dict
+        Parametros do construtor (gravados nos checkpoints)
+        '''
+        return {"raio": self.raio, "gama": self.gama, "gama_min": self.gama_min,
+                "passos": self.passos}
+
+    def _linhas(self, e):
+        '''(Binarias, Estado) -> array
+        Linha de cada centro de massa no estado, -1 se ela sumiu
+        '''
+        if len(self) == 0:
+            return empty(0, dtype=int)
+        inv = full(max(e.ids.max() if len(e) else 0, self.ids.max()) + 1, -1)
+        inv[e.ids] = arange(len(e))
+        return inv[self.ids]
+
+    def _tira(self, sel):
+        '''(Binarias, array of bool) -> Estado
+        Retira as binarias marcadas, retornando os segundos componentes delas
+        '''
+        fica = ~sel
+        self.ids, self.m1 = self.ids[fica], self.m1[fica]
+        self.u, self.w, self.h = self.u[fica], self.w[fica], self.h[fica]
+        return self.segundos.separa(sel.nonzero()[0])
+
+    def passo(self, corpos, dt, eps):
+        '''(Binarias, Nbody, float, float) -> (list of str, list of str)
+        Avanca as binarias por dt, desfaz as perturbadas ou afastadas,
+        funde as que passam a menos de eps no pericentro e forma as novas
+        (com dt = 0, so forma);
+        retorna os rotulos dos segundos componentes que sairam do estado e
+        dos que voltaram a ele (para o desenho)
+        '''
+        e = corpos.estado
+        G = corpos.G
+        saem, voltam = [], []
+        mudou = False
+        if len(self):
+            linha = self._linhas(e)
+            # o centro de massa colidiu com outro corpo (Nbody.colisoes):
+            # a binaria ja e parte do corpo resultante
+            perdida = (linha < 0) | (e.m[maximum(linha, 0)] != self.m1 + self.m2)
+            if perdida.any():
+                self.fundidas += int(perdida.sum())
+                self._tira(perdida)
+                linha = linha[~perdida]
+        if len(self) and dt > 0:
+            M = self.m1 + self.m2
+            mu = G * M
+            T = mare(e.r[linha], e.r, e.m, G, linha[:, None])
+            rel, vel = fisicas(self.u, self.w)
+            _, _, Q = elementos(rel, vel, mu)
+            gama = sqrt((T * T).sum(axis=(1, 2))) * Q**3 / mu
+
+            livre = gama < self.gama_min
+            if livre.any():
+                self.u[livre], self.w[livre] = oscilador(self.u[livre], self.w[livre],
+                                                         self.h[livre], dt)
+            p = ~livre
+            if p.any():
+                self.u[p], self.w[p], self.h[p], k = perturbadas(
+                    self.u[p], self.w[p], self.h[p], T[p], dt, self.passos)
+                self.passos_ks += k
+
+            rel, vel = fisicas(self.u, self.w)
+            # h segue o valor integrado (a energia e variavel das equacoes de KS)
+            _, q, Q = elementos(rel, vel, mu)
+            r = sqrt((rel * rel).sum(axis=1))
+
+            # pericentro dentro de eps: os componentes colidiriam, a linha
+            # do centro de massa (massa e momento totais) vira o corpo fundido
+            funde = q < eps
+            # desfeitas: abertas, afastadas ou perturbadas demais
+            desfaz = ~funde & ((self.h >= 0) | (r > 2 * self.raio) | (gama > 2 * self.gama))
+            if funde.any():
+                self.fundidas += int(funde.sum())
+                self._tira(funde)
+                fica = ~funde
+                linha, M, rel, vel, desfaz = linha[fica], M[fica], rel[fica], vel[fica], desfaz[fica]
+                mudou = True
+            if desfaz.any():
+                k = linha[desfaz]
+                m1 = self.m1[desfaz]
+                m2 = self.m2[desfaz]
+                Mk = M[desfaz][:, None]
+                rcm, vcm = e.r[k], e.v[k]
+                seg = self._tira(desfaz)
+                e.m[k] = m1
+                e.r[k] = rcm - rel[desfaz] * (m2[:, None] / Mk)
+                e.v[k] = vcm - vel[desfaz] * (m2[:, None] / Mk)
+                e.p[k] = e.v[k] * m1[:, None]
+                seg.r = rcm + rel[desfaz] * (m1[:, None] / Mk)
+                seg.v = vcm + vel[desfaz] * (m1[:, None] / Mk)
+                seg.p = seg.v * m2[:, None]
+                seg.liga()
+                e.acrescenta(seg)
+                self.desfeitas += len(k)
+                voltam += seg.labels()
+                mudou = True
+
+        saem += self.forma(corpos)
+        if saem or voltam or mudou:
+            corpos.integrador.reinicia()
+        return saem, voltam
+
+    def forma(self, corpos):
+        '''(Binarias, Nbody) -> list of str
+        Procura pares ligados a menos de raio, pouco perturbados e com a
+        orbita toda dentro de 2 raio, e os regulariza (os mais ligados
+        primeiro, cada corpo em uma binaria so); retorna os rotulos dos
+        segundos componentes
+        '''
+        e = corpos.estado
+        G = corpos.G
+        if len(e) < 2:
+            return []
+        i, j = contatos(e.r, self.raio)
+        # binarias nao entram em novos pares (sem hierarquias)
+        livre = ~isin(e.ids[i], self.ids) & ~isin(e.ids[j], self.ids)
+        i, j = i[livre], j[livre]
+        if len(i) == 0:
+            return []
+        # o primeiro componente e o mais massivo
+        troca = e.m[j] > e.m[i]
+        i[troca], j[troca] = j[troca], i[troca]
+        M = e.m[i] + e.m[j]
+        mu = G * M
+        rel = e.r[j] - e.r[i]
+        vel = e.v[j] - e.v[i]
+        h, _, Q = elementos(rel, vel, mu)
+        ok = (h < 0) & (Q < 2 * self.raio)
+        i, j, M, mu, rel, vel, h, Q = (x[ok] for x in (i, j, M, mu, rel, vel, h, Q))
+        if len(i) == 0:
+            return []
+        rc = (e.r[i] * e.m[i, None] + e.r[j] * e.m[j, None]) / M[:, None]
+        T = mare(rc, e.r, e.m, G, stack([i, j], axis=1))
+        ok = sqrt((T * T).sum(axis=(1, 2))) * Q**3 / mu < self.gama
+
+        usados = set()
+        escolhidos = []
+        for k in h.argsort().tolist():
+            if ok[k] and i[k] not in usados and j[k] not in usados:
+                usados.update((i[k], j[k]))
+                escolhidos.append(k)
+        if not escolhidos:
+            return []
+        k = array(escolhidos)
+        i, j, M = i[k], j[k], M[k]
+        u, w = ks(rel[k], vel[k])
+        self.ids = concatenate([self.ids, e.ids[i]])
+        self.m1 = concatenate([self.m1, e.m[i]])
+        self.u = concatenate([self.u, u])
+        self.w = concatenate([self.w, w])
+        self.h = concatenate([self.h, h[k]])
+
+        # o primeiro componente vira o centro de massa
+        p = e.p[i] + e.p[j]
+        e.r[i] = rc[k]
+        e.m[i] = M
+        e.p[i] = p
+        e.v[i] = p / M[:, None]
+        seg = e.separa(j)
+        self.segundos.acrescenta(seg)
+        self.formadas += len(k)
+        return seg.labels()
+
+    def energias(self, G):
+        '''(Binarias, float) -> (float, float)
+        Energias cinetica e potencial do movimento relativo das binarias
+        (o resto do sistema ve cada binaria so pelo centro de massa)
+        '''
+        if not len(self):
+            return 0., 0.
+        rel, vel = fisicas(self.u, self.w)
+        m1, m2 = self.m1, self.m2
+        K = 0.5 * (m1 * m2 / (m1 + m2) * (vel * vel).sum(axis=1)).sum()
+        U = -G * (m1 * m2 / sqrt((rel * rel).sum(axis=1))).sum()
+        return K, U
+
+    def momento_angular(self):
+        '''(Binarias) -> array
+        Momento angular do movimento relativo das binarias, mu (rel x vel),
+        somado
+        '''
+        if not len(self):
+            return zeros(3)
+        rel, vel = fisicas(self.u, self.w)
+        mu = self.m1 * self.m2 / (self.m1 + self.m2)
+        return (mu[:, None] * cross(rel, vel)).sum(axis=0)
+
+    def componentes(self, corpos):
+        '''(Binarias, Nbody) -> (array, array, array, array)
+        Posicoes e velocidades (B, 3) dos dois componentes de cada binaria
+        '''
+        e = corpos.estado
+        linha = self._linhas(e)
+        rel, vel = fisicas(self.u, self.w)
+        M = (self.m1 + self.m2)[:, None]
+        f1, f2 = self.m2[:, None] / M, self.m1[:, None] / M
+        rcm, vcm = e.r[linha], e.v[linha]
+        return rcm - rel * f1, vcm - vel * f1, rcm + rel * f2, vcm + vel * f2
+
+    def expande(self, corpos):
+        '''(Binarias, Nbody) -> Estado
+        Copia do estado com cada binaria nos seus dois componentes: o
+        primeiro na linha do centro de massa e o segundo no fim
+        '''
+        e = corpos.estado
+        s = self.segundos
+        linha = self._linhas(e)
+        r1, v1, r2, v2 = self.componentes(corpos)
+        r, v, m = e.r.copy(), e.v.copy(), e.m.copy()
+        r[linha], v[linha], m[linha] = r1, v1, self.m1
+        return Estado.de_arrays(concatenate([r, r2]), concatenate([v, v2]),
+                                concatenate([m, s.m]), e.labels() + s.labels(),
+                                concatenate([e.cores(), s.cores()]),
+                                ids=concatenate([e.ids, s.ids]))
+
+    def salva_estado(self):
+        '''(Binarias) -> dict
+        Arrays para retomar as binarias de um checkpoint
+        '''
+        if not len(self):
+            return {}
+        s = self.segundos
+        return {"ids": self.ids, "m1": self.m1, "u": self.u, "w": self.w,
+                "h": self.h, "m2": s.m, "ids2": s.ids, "label2": s.labels_utf8(),
+                "cor2": s.cores()}
+
+    def restaura_estado(self, arrays):
+        '''(Binarias, dict) -> None
+        Recupera o que foi gravado por salva_estado
+        '''
+        self.__init__(**self.parametros())
+        if "ids" not in arrays:
+            return
+        self.ids = array(arrays["ids"])
+        self.m1 = array(arrays["m1"])
+        self.u = array(arrays["u"])
+        self.w = array(arrays["w"])
+        self.h = array(arrays["h"])
+        B = len(self.ids)
+        self.segundos = Estado.de_arrays(zeros((B, 3)), zeros((B, 3)), array(arrays["m2"]),
+                                         array(arrays["label2"]), array(arrays["cor2"]),
+                                         ids=array(arrays["ids2"]))
+
+    def relatorio(self):
+        '''(Binarias) -> str
+        Contagem de binarias e passos no tempo ficticio
+        '''
+        return ("binarias: %d ativas, %d formadas, %d desfeitas, %d fundidas, "
+                "%d passos KS perturbados\n" % (len(self), self.formadas,
+                self.desfeitas, self.fundidas, self.passos_ks))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import json
+import os
+import struct
+
+from numpy import array, asarray, dtype, float64, int64, memmap, ndarray
+
+from estado import Estado
+
+# assinatura do formato binario
+MAGICO = b"NBODYCK1"
+
+# alinhamento dos arrays no arquivo (bytes)
+ALINHA = 64
+
+def _alinha(k):
+    return (k + ALINHA - 1) // ALINHA * ALINHA
+
+def salva(nome, estado, extras=None, **meta):
+    '''(str, Estado, dict, ...) -> None
+    Grava o estado em formato binario: assinatura, tamanho do cabecalho,
+    cabecalho JSON (meta-dados e posicao de cada campo) e os arrays crus,
+    alinhados para poderem ser lidos com mmap; extras sao arrays
+    adicionais (estado do integrador, etc.) gravados como campos
+    '''
+    labels = estado.labels_utf8()
+    campos = [("r", estado.r.astype(float64)),
+              ("v", estado.v.astype(float64)),
+              ("m", estado.m.astype(float64)),
+              ("cor", estado.cores().astype(float64)),
+              ("label", labels),
+              # momentos e ids exatos, para retomar a integracao bit a bit
+              ("p", estado.p.astype(float64)),
+              ("ids", estado.ids.astype(int64))]
+    for k in sorted(extras or {}):
+        campos.append((k, asarray(extras[k])))
+
+    cab = dict(meta)
+    cab["n"] = len(estado)
+    cab["campos"] = []
+    pos = 0
+    for k, a in campos:
+        cab["campos"].append([k, a.dtype.str, list(a.shape), pos])
+        pos = _alinha(pos + a.nbytes)
+    txt = json.dumps(cab).encode("utf-8")
+    inicio = _alinha(len(MAGICO) + 8 + len(txt))
+
+    # grava em arquivo temporario e troca no final,
+    # assim uma interrupcao nunca deixa um checkpoint pela metade
+    tmp = nome + ".tmp"
+    arq = open(tmp, "wb")
+    arq.write(MAGICO)
+    arq.write(struct.pack("<Q", len(txt)))
+    arq.write(txt)
+    for (k, a), (_, _, _, p) in zip(campos, cab["campos"]):
+        arq.seek(inicio + p)
+        arq.write(a.tobytes())
+    arq.close()
+    getattr(os, "replace", os.rename)(tmp, nome)
+
+def le(nome):
+    '''(str) -> (dict, dict)
+    Le o cabecalho e mapeia cada campo do arquivo com mmap, somente
+    leitura e sem copiar os dados; retorna (meta-dados, arrays)
+    Serve para inspecionar o arquivo: enquanto os arrays existirem o
+    mapeamento fica aberto e, no Windows, o arquivo nao pode ser
+    substituido por salva
+    '''
+    arq = open(nome, "rb")
+    if arq.read(len(MAGICO)) != MAGICO:
+        arq.close()
+        raise ValueError("Arquivo de checkpoint invalido: %s" % nome)
+    k = struct.unpack("<Q", arq.read(8))[0]
+    cab = json.loads(arq.read(k).decode("utf-8"))
+    arq.close()
+    inicio = _alinha(len(MAGICO) + 8 + k)
+
+    arrays = {}
+    for campo, tipo, forma, pos in cab.pop("campos"):
+        if cab["n"] == 0:
+            arrays[campo] = ndarray(forma, dtype=tipo)
+            continue
+        arrays[campo] = memmap(nome, dtype=dtype(tipo), mode="r",
+                               offset=inicio + pos, shape=tuple(forma))
+    return cab, arrays
+
+def carrega(nome):
+    '''(str) -> (Estado, dict)
+    Le o checkpoint, retornando o estado e os meta-dados;
+    campos extras ficam em meta["extras"]
+    A leitura nao e sob demanda: cada campo e copiado inteiro para a
+    memoria e o mapeamento e liberado, para que o mesmo arquivo possa ser
+    regravado em seguida (para acesso preguicoso, use le)
+    '''
+    meta, mm = le(nome)
+    a = dict((k, array(x)) for k, x in mm.items())
+    del mm
+    estado = Estado.de_arrays(a.pop("r"), a.pop("v"), a.pop("m"), a.pop("label"),
+                              a.pop("cor"), a.pop("p", None), a.pop("ids", None))
+    meta["extras"] = a
+    return estado, meta
+
+###############################################################################
+
+if __name__ == "__main__":
+    # conversao entre o formato texto (regs/*.txt) e o binario
+    from sys import argv
+    from nbody import Nbody
+    if len(argv) < 2:
+        print("Uso: python checkpoint.py <nome> | <arquivo.ckpt>")
+    elif argv[1].endswith(".ckpt"):
+        corpos = Nbody(headless=True)
+        corpos.carrega_checkpoint(argv[1])
+        corpos.registra()
+    else:
+        corpos = Nbody(headless=True)
+        corpos.set_bodies(corpos.carrega(argv[1]))
+        corpos.salva_checkpoint("regs/nbody-%s.ckpt" % argv[1])
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+
+from numpy import (arange, argsort, array, concatenate, cumsum, einsum, floor,
+                   flatnonzero, int64, r_, repeat, zeros)
+
+# metade dos 26 vizinhos de uma celula, cada par de celulas e visto uma vez
+VIZINHOS = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+            for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)]
+
+def contatos(r, eps, jit=False):
+    '''(array, float, bool) -> (array, array)
+    Retorna os pares (i, j), i < j, com distancia menor que eps,
+    usando uma grade uniforme de celulas de lado eps
+    jit: usa o nucleo compilado de nucleos.py (o Numba so e importado
+    entao; sem ele, segue em NumPy)
+    '''
+    n = len(r)
+    if n < 2:
+        return zeros(0, dtype=int), zeros(0, dtype=int)
+
+    # indices das celulas, com uma celula de folga em cada borda
+    c = floor(r / eps).astype(int64)
+    c -= c.min(axis=0) - 1
+    dim = c.max(axis=0) + 2
+    passo = array([dim[1] * dim[2], dim[2], 1], dtype=int64)
+    chave = c.dot(passo)
+
+    ordem = argsort(chave, kind='mergesort')
+    chave = chave[ordem]
+    ini = flatnonzero(r_[True, chave[1:] != chave[:-1]])
+    cont = r_[ini[1:], n] - ini
+    celula = chave[ini]
+    # celula de cada corpo (na ordem ordenada)
+    onde = repeat(arange(len(ini)), cont)
+
+    if jit:
+        import nucleos
+        jit = nucleos.NUMBA
+    if jit:
+        desl = array(VIZINHOS, dtype=int64).dot(passo)
+        a, b = nucleos.pares_celulas(r[ordem], celula, ini, cont, onde, desl, eps)
+        i, j = ordem[a], ordem[b]
+        troca = i > j
+        i[troca], j[troca] = j[troca], i[troca]
+        return i, j
+
+    ii, jj = [], []
+    # pares dentro da mesma celula
+    a, b = _pares(arange(n), ini[onde], cont[onde])
+    sel = b > a
+    ii.append(a[sel])
+    jj.append(b[sel])
+    # pares com as celulas vizinhas
+    for d in VIZINHOS:
+        alvo = celula + array(d, dtype=int64).dot(passo)
+        k = celula.searchsorted(alvo)
+        k[k == len(celula)] = 0
+        achou = celula[k] == alvo
+        nk = zeros(len(ini), dtype=int)
+        nk[achou] = cont[k[achou]]
+        a, b = _pares(arange(n), ini[k][onde], nk[onde])
+        ii.append(a)
+        jj.append(b)
+    a = concatenate(ii)
+    b = concatenate(jj)
+
+    d = r[ordem[a]] - r[ordem[b]]
+    perto = (d * d).sum(axis=1) < eps * eps
+    i, j = ordem[a[perto]], ordem[b[perto]]
+    troca = i > j
+    i[troca], j[troca] = j[troca], i[troca]
+    return i, j
+
+def proximos(rt, r, eps, bloco=2**21):
+    '''(array, array, float, int) -> array of bool
+    Marca os pontos rt (T, 3) a menos de eps de algum dos pontos r (N, 3)
+    '''
+    perto = zeros(len(rt), dtype=bool)
+    if len(r) == 0:
+        return perto
+    if len(r) <= 64:
+        # poucas fontes: uma passada vetorizada sobre os pontos por fonte
+        for j in range(len(r)):
+            d = rt - r[j]
+            perto |= einsum('ij,ij->i', d, d) < eps * eps
+        return perto
+    passo = max(1, bloco // len(r))
+    for i in range(0, len(rt), passo):
+        d = r[None, :, :] - rt[i:i+passo, None, :]
+        perto[i:i+passo] = ((d * d).sum(axis=2) < eps * eps).any(axis=1)
+    return perto
+
+def _pares(alvo, ini, cont):
+    '''(array, array, array) -> (array, array)
+    Repete cada alvo cont vezes, pareando com ini, ini+1, ..., ini+cont-1
+    '''
+    a = repeat(alvo, cont)
+    desl = repeat(ini - (cumsum(cont) - cont), cont)
+    return a, desl + arange(len(a))
+
+def grupos(i, j):
+    '''(array, array) -> list of list of int
+    Agrupa os contatos encadeados por uniao-busca,
+    retornando os grupos com mais de um corpo
+    '''
+    pai = {}
+    for x in i.tolist() + j.tolist():
+        pai[x] = x
+
+    def busca(x):
+        raiz = x
+        while pai[raiz] != raiz:
+            raiz = pai[raiz]
+        # compressao de caminho
+        while x != raiz:
+            pai[x], x = raiz, pai[x]
+        return raiz
+
+    for a, b in zip(i.tolist(), j.tolist()):
+        ra, rb = busca(a), busca(b)
+        if ra != rb:
+            pai[max(ra, rb)] = min(ra, rb)
+
+    g = {}
+    for x in pai:
+        g.setdefault(busca(x), []).append(x)
+    return [sorted(v) for v in g.values()]
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import argparse
+from math import erf, pi
+from time import time
+
+from numpy import (arange, array, concatenate, cos, empty, exp, frombuffer,
+                   interp, log, maximum, ones, sin, sqrt, tile, uint8, zeros)
+from numpy.random import RandomState
+
+import checkpoint
+from estado import Estado
+
+def _aleatorio(semente):
+    '''(int or RandomState) -> RandomState'''
+    if isinstance(semente, RandomState):
+        return semente
+    return RandomState(semente)
+
+def _direcoes(n, aleatorio):
+    '''(int, RandomState) -> array
+    n vetores unitarios (n, 3) com direcoes isotropicas
+    '''
+    c = aleatorio.uniform(-1, 1, n)
+    s = sqrt(1 - c * c)
+    f = aleatorio.uniform(0, 2 * pi, n)
+    u = empty((n, 3))
+    u[:, 0] = s * cos(f)
+    u[:, 1] = s * sin(f)
+    u[:, 2] = c
+    return u
+
+def _rejeicao(n, densidade, teto, aleatorio, x0=0., x1=1.):
+    '''(int, function, float, RandomState, float, float) -> array
+    n amostras em [x0, x1] da densidade (nao normalizada) limitada
+    por teto, por rejeicao vetorizada
+    '''
+    saida = empty(n)
+    feitas = 0
+    while feitas < n:
+        falta = n - feitas
+        # sobra de 20% para a maioria dos casos resolver em uma rodada
+        k = int(falta * 1.2) + 16
+        x = aleatorio.uniform(x0, x1, k)
+        ok = x[aleatorio.uniform(0, teto, k) < densidade(x)][:falta]
+        saida[feitas:feitas + len(ok)] = ok
+        feitas += len(ok)
+    return saida
+
+def rotulos(n, prefixo="p_"):
+    '''(int, str) -> array
+    Rotulos prefixo1, prefixo2, ... ja codificados em utf-8; cada coluna
+    de digitos e periodica dentro de uma faixa de ids com o mesmo numero
+    de digitos e e montada com repeat/tile numa matriz de bytes, bem mais
+    rapido que formatar n strings (o numpy descarta os zeros a direita)
+    '''
+    prefixo = prefixo.encode("utf-8")
+    p = len(prefixo)
+    largura = len(str(n))
+    buf = zeros((n, p + largura), dtype=uint8)
+    buf[:, :p] = frombuffer(prefixo, dtype=uint8)
+    algarismos = arange(ord("0"), ord("9") + 1, dtype=uint8)
+    for d in range(1, largura + 1):
+        ini, fim = 10**(d - 1), min(10**d, n + 1)
+        k = fim - ini
+        # primeiro digito de 1 a 9, os demais de 0 a 9
+        buf[ini - 1:fim - 1, p] = algarismos[1:].repeat(ini)[:k]
+        for j in range(1, d):
+            periodo = algarismos.repeat(10**(d - 1 - j))
+            buf[ini - 1:fim - 1, p + j] = tile(periodo, -(-k // len(periodo)))[:k]
+    return buf.view("S%d" % (p + largura)).ravel()
+
+def _estado(r, v, m):
+    '''(array, array, array) -> Estado
+    Estado com centro de massa e momento total na origem
+    '''
+    M = m.sum()
+    r -= m.dot(r) / M
+    v -= m.dot(v) / M
+    return Estado.de_arrays(r, v, m, rotulos(len(m)))
+
+def plummer(n, M=1., a=1., G=1., semente=None, corte=0.999):
+    '''(int, float, float, float, int, float) -> Estado
+    Esfera de Plummer de massa M e raio de escala a, em equilibrio;
+    corte e a fracao da massa amostrada (evita raios enormes)
+    '''
+    aleatorio = _aleatorio(semente)
+    X = aleatorio.uniform(0, corte, n)
+    raio = a / sqrt(X**(-2/3) - 1)
+    r = raio[:, None] * _direcoes(n, aleatorio)
+
+    # q = v / v_escape, densidade q^2 (1 - q^2)^(7/2), maximo < 0.1
+    q = _rejeicao(n, lambda q: q * q * (1 - q * q)**3.5, 0.1, aleatorio)
+    vesc = sqrt(2 * G * M) * (raio * raio + a * a)**(-1/4)
+    v = (q * vesc)[:, None] * _direcoes(n, aleatorio)
+    return _estado(r, v, ones(n) * (M / n))
+
+def uniforme(n, M=1., R=1., G=1., virial=1., semente=None):
+    '''(int, float, float, float, float, int) -> Estado
+    Esfera homogenea de raio R com velocidades gaussianas isotropicas
+    dando razao virial 2K/|U| = virial (0 para colapso frio)
+    '''
+    aleatorio = _aleatorio(semente)
+    raio = R * aleatorio.uniform(0, 1, n)**(1/3)
+    r = raio[:, None] * _direcoes(n, aleatorio)
+    # |U| = 3 G M^2 / (5 R) e 2K = 3 M sigma^2
+    sigma = sqrt(virial * G * M / (5 * R))
+    v = aleatorio.normal(0, sigma, (n, 3))
+    return _estado(r, v, ones(n) * (M / n))
+
+# celulas das tabelas do modelo de King
+TABELA = 2**15
+
+def _rho_king(W):
+    '''(float) -> float
+    Densidade do modelo de King em funcao do potencial adimensional W
+    '''
+    W = min(W, 700.)
+    return exp(W) * erf(sqrt(W)) - sqrt(4 * W / pi) * (1 + 2 * W / 3)
+
+def perfil_king(W0, pontos=4000):
+    '''(float, int) -> (array, array, array)
+    Integra a equacao de Poisson do modelo de King em r (raio de King 1,
+    sigma 1) ate o raio de mare, retornando r, W(r) e a massa M(<r)
+    (em unidades G = 1)
+    '''
+    rho0 = _rho_king(W0)
+
+    def deriv(y, W, u):
+        # y = ln r, u = dW/dr
+        r = exp(y)
+        rho = _rho_king(W) / rho0 if W > 0 else 0.
+        return r * u, -9 * r * rho - 2 * u
+
+    # serie perto do centro: W = W0 - 3 r^2 / 2
+    y0, y1 = log(1e-4), log(1e4)
+    h = (y1 - y0) / pontos
+    y, W, u = y0, W0 - 1.5e-8, -3e-4
+    rs, Ws, us = [exp(y)], [W], [u]
+    while W > 0 and y < y1:
+        k1 = deriv(y, W, u)
+        k2 = deriv(y + h/2, W + h/2 * k1[0], u + h/2 * k1[1])
+        k3 = deriv(y + h/2, W + h/2 * k2[0], u + h/2 * k2[1])
+        k4 = deriv(y + h, W + h * k3[0], u + h * k3[1])
+        W1 = W + h/6 * (k1[0] + 2*k2[0] + 2*k3[0] + k4[0])
+        u1 = u + h/6 * (k1[1] + 2*k2[1] + 2*k3[1] + k4[1])
+        if W1 <= 0:
+            # raio de mare por interpolacao linear em y
+            f = W / (W - W1)
+            y, W, u = y + f * h, 0., u + f * (u1 - u)
+        else:
+            y, W, u = y + h, W1, u1
+        rs.append(exp(y))
+        Ws.append(W)
+        us.append(u)
+    r = array(rs)
+    massa = -(r * r) * array(us)
+    return r, array(Ws), massa
+
+def king(n, W0=6., M=1., rc=1., G=1., semente=None):
+    '''(int, float, float, float, float, int) -> Estado
+    Modelo de King (esfera isotermica truncada) com potencial central
+    W0 (concentracao cresce com W0), massa M e raio de King rc
+    '''
+    aleatorio = _aleatorio(semente)
+    r, W, massa = perfil_king(W0)
+
+    # tabelas em uma grade uniforme da fracao de massa X: raio (inversa da
+    # massa acumulada), W e o teto da rejeicao de |v|; cada amostra so
+    # interpola entre duas celulas vizinhas, sem busca binaria
+    X = arange(TABELA + 1) / TABELA
+    rtab = interp(X, massa / massa[-1], r)
+    Wtab = interp(rtab, r, W)
+    # |v| com densidade v^2 (exp(W - v^2/2) - 1) em [0, sqrt(2W)];
+    # em u = v / v_escape: u^2 (exp(W (1 - u^2)) - 1)
+    ug = arange(1, 64) / 64.
+    ttab = (ug**2 * (exp(Wtab[:, None] * (1 - ug**2)) - 1)).max(axis=1)
+    ttab = maximum(ttab[:-1], ttab[1:]) * 1.05 + 1e-12
+
+    x = aleatorio.uniform(0, TABELA, n)
+    i = x.astype(int)
+    x -= i
+    raio = rtab[i] + x * (rtab[i + 1] - rtab[i])
+    Wi = Wtab[i] + x * (Wtab[i + 1] - Wtab[i])
+    teto = ttab[i]
+
+    u = empty(n)
+    falta = arange(n)
+    while len(falta):
+        x = aleatorio.uniform(0, 1, len(falta))
+        Wf = Wi[falta]
+        ok = aleatorio.uniform(0, 1, len(falta)) * teto[falta] < \
+             x * x * (exp(Wf * (1 - x * x)) - 1)
+        u[falta[ok]] = x[ok]
+        falta = falta[~ok]
+    v = (u * sqrt(2 * Wi))[:, None] * _direcoes(n, aleatorio)
+
+    # de (G = 1, r0 = 1, sigma = 1, massa massa[-1]) para (G, rc, M)
+    sigma = sqrt(G * M / (rc * massa[-1]))
+    r = (raio * rc)[:, None] * _direcoes(n, aleatorio)
+    return _estado(r, v * sigma, ones(n) * (M / n))
+
+def disco(n, M=1., Rd=1., Rmax=None, h=None, Mc=None, G=1., dispersao=0.05,
+          semente=None):
+    '''(int, float, float, float, float, float, float, float, int) -> Estado
+    Disco exponencial de massa M e escala Rd (cortado em Rmax, padrao
+    5 Rd), espessura gaussiana h (padrao Rd / 20), no plano x-z como o
+    Sistema Solar, girando em torno de uma massa central Mc (padrao M;
+    o corpo 0, se Mc > 0); velocidades circulares pela massa interna,
+    com dispersao relativa `dispersao`
+    '''
+    Rmax = 5 * Rd if Rmax is None else Rmax
+    h = Rd / 20 if h is None else h
+    Mc = M if Mc is None else Mc
+    aleatorio = _aleatorio(semente)
+    # densidade superficial exp(-R/Rd): R ~ Gama(2, Rd), cortado em Rmax
+    R = empty(0)
+    while len(R) < n:
+        k = n - len(R)
+        x = aleatorio.gamma(2, Rd, int(k * 1.1) + 16)
+        R = concatenate((R, x[x < Rmax][:k]))
+    f = aleatorio.uniform(0, 2 * pi, n)
+    r = empty((n, 3))
+    r[:, 0] = R * cos(f)
+    r[:, 1] = aleatorio.normal(0, h, n)
+    r[:, 2] = R * sin(f)
+
+    # massa interna (aproximacao esferica) para a velocidade circular
+    m = ones(n) * (M / n)
+    ordem = R.argsort()
+    interna = empty(n)
+    interna[ordem] = m[ordem].cumsum()
+    vc = sqrt(G * (Mc + interna) / R)
+    v = empty((n, 3))
+    v[:, 0] = -vc * sin(f)
+    v[:, 1] = 0
+    v[:, 2] = vc * cos(f)
+    v += aleatorio.normal(0, 1, (n, 3)) * (dispersao * vc)[:, None]
+
+    if Mc > 0:
+        r = concatenate((zeros((1, 3)), r))
+        v = concatenate((zeros((1, 3)), v))
+        m = concatenate(([Mc], m))
+    return _estado(r, v, m)
+
+# geradores por nome e o nome do parametro de escala de cada um
+MODELOS = {"plummer": plummer, "king": king, "uniforme": uniforme,
+           "disco": disco}
+ESCALAS = {"plummer": "a", "king": "rc", "uniforme": "R", "disco": "Rd"}
+
+def gera(modelo, n, M=1., escala=1., G=1., semente=None, **opcoes):
+    '''(str, int, float, float, float, int, ...) -> Estado
+    Gera n corpos do modelo de nome dado com massa total M e escala
+    de comprimento `escala`; opcoes sao os demais parametros do modelo
+    '''
+    if modelo not in MODELOS:
+        raise ValueError("Modelo desconhecido: %s" % modelo)
+    opcoes[ESCALAS[modelo]] = escala
+    return MODELOS[modelo](n, M=M, G=G, semente=semente, **opcoes)
+
+def salva(nome, estado, G=1., dt=1/120, **meta):
+    '''(str, Estado, float, float, ...) -> None
+    Grava o estado gerado como checkpoint no instante zero, pronto para
+    Nbody.carrega_checkpoint e para o modo arquivo de job.py
+    '''
+    checkpoint.salva(nome, estado, G=G, dt=dt, _dt=dt, t=0., passos=0,
+                     forcas=0, **meta)
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera condicoes iniciais e "
+                                 "grava em checkpoint binario")
+    ap.add_argument("modelo", choices=sorted(MODELOS))
+    ap.add_argument("n", type=int)
+    ap.add_argument("saida", help="arquivo .ckpt")
+    ap.add_argument("--M", type=float, default=1.)
+    ap.add_argument("--escala", type=float, default=1.)
+    ap.add_argument("--G", type=float, default=1.)
+    ap.add_argument("--dt", type=float, default=1/120)
+    ap.add_argument("--semente", type=int)
+    ap.add_argument("--W0", type=float, help="potencial central (king)")
+    ap.add_argument("--virial", type=float, help="2K/|U| (uniforme)")
+    args = vars(ap.parse_args())
+    modelo, n, saida, dt = (args.pop(k) for k in ("modelo", "n", "saida", "dt"))
+    opcoes = dict((k, v) for k, v in args.items() if v is not None)
+
+    t0 = time()
+    estado = gera(modelo, n, **opcoes)
+    t1 = time()
+    salva(saida, estado, dt=dt, modelo=modelo, **opcoes)
+    print("%d corpos (%s) gerados em %.2f s, gravados em %.2f s: %s" % (
+          len(estado), modelo, t1 - t0, time() - t1, saida))
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import warnings
+
+from numpy import arange, concatenate, cross, dtype, fromfile, inf, sqrt, zeros
+
+# acima deste N o potencial e aproximado pela octree de Barnes-Hut
+N_ARVORE = 20000
+
+# registro da serie temporal de diagnosticos
+SERIE = dtype([("t", "<f8"), ("passo", "<i8"), ("n", "<i8"),
+               ("K", "<f8"), ("U", "<f8"), ("E", "<f8"), ("dE", "<f8"),
+               ("P", "<f8", (3,)), ("L", "<f8", (3,)), ("Q", "<f8")])
+
+def cinetica(e):
+    '''(Estado) -> float
+    Energia cinetica total
+    '''
+    return 0.5 * (e.m * (e.v * e.v).sum(axis=1)).sum()
+
+def potencial(e, G, bloco=2**20, theta=None):
+    '''(Estado, float, int, float) -> float
+    Energia potencial total; soma direta dos pares em blocos de linhas
+    com no maximo `bloco` pares, ou pela octree se theta for dado
+    '''
+    n = len(e.m)
+    if theta is not None:
+        from barneshut import Octree
+        _, phi = Octree(e.r, e.m).aceleracoes(G, theta, potencial=True)
+        return 0.5 * (e.m * phi).sum()
+    u = 0.
+    passo = max(1, bloco // max(n, 1))
+    for i in range(0, n, passo):
+        f = min(i + passo, n)
+        d = e.r[None, :, :] - e.r[i:f, None, :]
+        d2 = (d * d).sum(axis=2)
+        # apenas os pares j > i
+        d2[arange(i, f)[:, None] >= arange(n)[None, :]] = inf
+        u -= (e.m[i:f, None] * e.m[None, :] / sqrt(d2)).sum()
+    return G * u
+
+def internas(corpos):
+    '''(Nbody) -> (float, float)
+    Energias cinetica e potencial internas das binarias regularizadas,
+    que o estado ve apenas pelos centros de massa
+    '''
+    if getattr(corpos, "ks", None) is None:
+        return 0., 0.
+    return corpos.ks.energias(corpos.G)
+
+def energia(corpos, theta=None):
+    '''(Nbody, float) -> float
+    Energia total (cinetica + potencial) do sistema
+    '''
+    return (cinetica(corpos.estado) + potencial(corpos.estado, corpos.G, theta=theta)
+            + sum(internas(corpos)))
+
+def momento(e):
+    '''(Estado) -> array
+    Momento linear total
+    '''
+    return e.p.sum(axis=0)
+
+def momento_angular(e, ks=None):
+    '''(Estado, Binarias) -> array
+    Momento angular total em relacao a origem; com ks soma o interno das
+    binarias regularizadas, que o estado ve apenas pelos centros de massa
+    '''
+    L = cross(e.r, e.p).sum(axis=0)
+    if ks is not None:
+        L = L + ks.momento_angular()
+    return L
+
+class Diagnosticos(object):
+    """Serie temporal de energia, momentos e razao virial a cada M passos"""
+
+    def __init__(self, corpos, a_cada=100, limite=1e-3, arquivo=None, theta=0.5):
+        '''(Diagnosticos, Nbody, int, float, str, float) -> None
+        Mede o estado inicial e passa a medir a cada `a_cada` passos;
+        avisa quando a deriva relativa de energia passa de `limite`;
+        com `arquivo`, cada registro e tambem anexado a ele em binario;
+        theta e usado no potencial quando N > N_ARVORE
+        '''
+        self.limite = limite
+        self.theta = theta
+        self.registros = []
+        self.arq = open(arquivo, "wb") if arquivo else None
+        self.E0 = None
+        self.aviso = 0.
+        self.mede(corpos)
+        corpos.a_cada(a_cada, self.mede)
+
+    def mede(self, corpos):
+        '''(Diagnosticos, Nbody) -> None
+        Calcula e guarda um registro da serie
+        '''
+        e = corpos.estado
+        Ki, Ui = internas(corpos)
+        K = cinetica(e) + Ki
+        U = potencial(e, corpos.G, theta=self.theta if len(e) > N_ARVORE else None) + Ui
+        E = K + U
+        if self.E0 is None:
+            self.E0 = E
+        dE = abs(E / self.E0 - 1) if self.E0 else abs(E)
+        reg = zeros(1, dtype=SERIE)
+        reg["t"], reg["passo"], reg["n"] = corpos.t, corpos.passos, len(e)
+        reg["K"], reg["U"], reg["E"], reg["dE"] = K, U, E, dE
+        reg["P"], reg["L"] = momento(e), momento_angular(e, getattr(corpos, "ks", None))
+        reg["Q"] = 2 * K / abs(U) if U else inf
+        self.registros.append(reg)
+        if self.arq:
+            self.arq.write(reg.tobytes())
+            self.arq.flush()
+
+        # avisa de novo apenas quando a deriva dobra desde o ultimo aviso
+        if dE > self.limite and dE > 2 * self.aviso:
+            self.aviso = dE
+            warnings.warn("deriva de energia %.3e (limite %.1e) em t = %.3f" % (
+                          dE, self.limite, corpos.t), RuntimeWarning)
+
+    def serie(self):
+        '''(Diagnosticos) -> array
+        Retorna a serie como array estruturado (campos de SERIE)
+        '''
+        if not self.registros:
+            return zeros(0, dtype=SERIE)
+        return concatenate(self.registros)
+
+    def fechar(self):
+        '''(Diagnosticos) -> None
+        Fecha o arquivo da serie
+        '''
+        if self.arq:
+            self.arq.close()
+            self.arq = None
+
+def le_serie(nome):
+    '''(str) -> array
+    Le uma serie gravada por Diagnosticos
+    '''
+    return fromfile(nome, dtype=SERIE)
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import argparse
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import warnings
+from multiprocessing import cpu_count
+from time import sleep, time
+
+from numpy import array_equal, ascontiguousarray, empty, float64, frombuffer, uint8
+
+from forcas import acel_direta, PARES_BLOCO
+
+# pedido do coordenador: tipo, seq, n, ini, fim, bytes do corpo, G;
+# o corpo sao as posicoes (N, 3) em float64 seguidas das massas, estas
+# apenas quando mudaram desde o ultimo pedido aquele trabalhador
+PEDIDO = struct.Struct("<4sQQQQQd")
+
+# resposta do trabalhador: tipo, seq, ini, fim, tempo de calculo (s);
+# o corpo sao as aceleracoes (fim - ini, 3) em float64
+RESPOSTA = struct.Struct("<4sQQQd")
+
+def _recebe(sock, buf):
+    '''(socket, memoryview) -> None
+    Le exatamente len(buf) bytes do socket para buf
+    '''
+    visto = 0
+    while visto < len(buf):
+        k = sock.recv_into(buf[visto:])
+        if k == 0:
+            raise EOFError("conexao fechada")
+        visto += k
+
+def _bytes(a):
+    '''(array) -> memoryview
+    Bytes de um array contiguo, sem copia
+    '''
+    return memoryview(a.view(uint8).reshape(-1))
+
+def trabalhador(host, porta):
+    '''(str, int) -> None
+    Processo trabalhador: conecta ao coordenador e calcula os blocos de
+    aceleracoes pedidos ate o coordenador encerrar a conexao
+    '''
+    sock = socket.create_connection((host, porta))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(RESPOSTA.pack(b"OLA ", os.getpid(), 0, 0, 0.))
+    cab = bytearray(PEDIDO.size)
+    corpo = bytearray(0)
+    m = empty(0)
+    while True:
+        try:
+            _recebe(sock, memoryview(cab))
+        except (EOFError, socket.error):
+            break
+        tipo, seq, n, ini, fim, nbytes, G = PEDIDO.unpack(bytes(cab))
+        if tipo == b"FIM ":
+            break
+        if len(corpo) < nbytes:
+            corpo = bytearray(nbytes)
+        _recebe(sock, memoryview(corpo)[:nbytes])
+        t0 = time()
+        r = frombuffer(corpo, float64, 3 * n).reshape(n, 3)
+        if nbytes > 24 * n:
+            m = frombuffer(corpo, float64, n, 24 * n).copy()
+        a = empty((fim - ini, 3))
+        passo = max(1, PARES_BLOCO // n)
+        for i in range(ini, fim, passo):
+            j = min(i + passo, fim)
+            acel_direta(r, m, G, i, j, out=a[i - ini:j - ini])
+        sock.sendall(RESPOSTA.pack(b"ACEL", seq, ini, fim, time() - t0))
+        sock.sendall(_bytes(a))
+    sock.close()
+
+class Conexao(object):
+    """Um trabalhador visto pelo coordenador"""
+
+    def __init__(self, sock, endereco, pid):
+        self.sock = sock
+        self.endereco = endereco
+        self.pid = pid
+        # versao das massas que o trabalhador tem
+        self.versao = -1
+        # alvos por segundo medidos, para dividir os blocos
+        self.taxa = None
+
+    def __str__(self):
+        return "%s:%d (pid %d)" % (self.endereco[0], self.endereco[1], self.pid)
+
+class Distribuida(object):
+    """Soma direta com os blocos de alvos calculados por processos
+    trabalhadores ligados por TCP, na mesma maquina ou em outras;
+    trabalhadores podem entrar a qualquer momento (passam a receber
+    blocos no passo seguinte) e os que caem ou nao respondem tem os
+    blocos redistribuidos entre os demais"""
+
+    nome = "distribuido"
+
+    def __init__(self, host="127.0.0.1", porta=0, locais=None, minimo=None,
+                 espera=30., tempo_limite=60., a_cada=0):
+        '''(Distribuida, str, int, int, int, float, float, int) -> None
+        host, porta: onde o coordenador escuta (porta 0: qualquer livre)
+        locais: trabalhadores iniciados nesta maquina (padrao: um por nucleo)
+        minimo: trabalhadores esperados antes do primeiro passo (padrao:
+        locais, ou 1), por ate `espera` segundos
+        tempo_limite: segundos sem resposta para dar um trabalhador por perdido
+        a_cada: imprime os tempos de comunicacao e calculo a cada
+        a_cada passos (0: nunca; ver resumo())
+        '''
+        self.tempo_limite = tempo_limite
+        self.a_cada = a_cada
+        self.servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.servidor.bind((host, porta))
+        self.servidor.listen(64)
+        self.endereco = self.servidor.getsockname()
+        self.ativos = []
+        self.novos = []
+        self.trava = threading.Lock()
+        self.aceitador = threading.Thread(target=self._aceita)
+        self.aceitador.daemon = True
+        self.aceitador.start()
+        print("Coordenador em %s:%d" % self.endereco)
+
+        self.processos = []
+        if locais is None:
+            locais = cpu_count()
+        self.inicia_locais(locais)
+        self._espera(minimo or locais or 1, espera)
+
+        self.m = None
+        self.versao = 0
+        self.seq = 0
+        # tempos de cada passo (dicts com parede, calculo, comunicacao, ...)
+        self.tempos = []
+
+    def inicia_locais(self, k, espera=None):
+        '''(Distribuida, int, float) -> None
+        Inicia k trabalhadores nesta maquina; com espera, aguarda ate
+        espera segundos que eles conectem
+        '''
+        host, porta = self.endereco
+        with self.trava:
+            alvo = len(self.ativos) + len(self.novos) + k
+        for _ in range(k):
+            self.processos.append(subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "trabalhador",
+                 host, str(porta)]))
+        if espera:
+            self._espera(alvo, espera)
+
+    def _aceita(self):
+        while True:
+            try:
+                sock, endereco = self.servidor.accept()
+            except (socket.error, OSError):
+                return
+            try:
+                sock.settimeout(5)
+                cab = bytearray(RESPOSTA.size)
+                _recebe(sock, memoryview(cab))
+                tipo, pid = RESPOSTA.unpack(bytes(cab))[:2]
+                if tipo != b"OLA ":
+                    raise ValueError("saudacao invalida")
+            except (socket.error, EOFError, ValueError):
+                sock.close()
+                continue
+            sock.settimeout(self.tempo_limite)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            c = Conexao(sock, endereco, pid)
+            with self.trava:
+                self.novos.append(c)
+            print("Trabalhador %s entrou" % c)
+
+    def _espera(self, k, segundos):
+        '''(Distribuida, int, float) -> None
+        Espera ate k trabalhadores conectados
+        '''
+        limite = time() + segundos
+        while time() < limite:
+            with self.trava:
+                if len(self.novos) + len(self.ativos) >= k:
+                    return
+            sleep(0.01)
+        self.fechar()
+        raise RuntimeError("Apenas %d de %d trabalhadores conectaram em %g s" % (
+                           len(self.novos) + len(self.ativos), k, segundos))
+
+    def _perde(self, c, motivo):
+        '''(Distribuida, Conexao, object) -> None
+        Desliga o trabalhador c
+        '''
+        warnings.warn("Trabalhador %s perdido (%s); blocos redistribuidos" % (
+                      c, motivo), RuntimeWarning)
+        c.sock.close()
+        if c in self.ativos:
+            self.ativos.remove(c)
+
+    def _divide(self, n):
+        '''(Distribuida, int) -> list of (int, int)
+        Um bloco de alvos por trabalhador, proporcional a taxa medida
+        '''
+        taxas = [c.taxa for c in self.ativos if c.taxa]
+        media = sum(taxas) / len(taxas) if taxas else 1.
+        pesos = [c.taxa or media for c in self.ativos]
+        total = sum(pesos)
+        cortes, acumulado = [0], 0.
+        for p in pesos:
+            acumulado += p
+            cortes.append(int(round(n * acumulado / total)))
+        cortes[-1] = n
+        return [(i, j) for i, j in zip(cortes[:-1], cortes[1:]) if j > i]
+
+    def _envia(self, c, r, n, ini, fim, G):
+        '''(Distribuida, Conexao, array, int, int, int, float) -> bool
+        Pede ao trabalhador c o bloco [ini, fim); False se ele caiu
+        '''
+        massas = c.versao != self.versao
+        nbytes = 24 * n + (8 * n if massas else 0)
+        try:
+            c.sock.sendall(PEDIDO.pack(b"PASS", self.seq, n, ini, fim, nbytes, G))
+            c.sock.sendall(_bytes(r))
+            if massas:
+                c.sock.sendall(_bytes(self.m))
+        except (socket.error, OSError) as erro:
+            self._perde(c, erro)
+            return False
+        c.versao = self.versao
+        return True
+
+    def _recebe_bloco(self, c, a, ini, fim):
+        '''(Distribuida, Conexao, array, int, int) -> float
+        Le a resposta de c direto para a[ini:fim]; retorna o tempo de calculo
+        '''
+        cab = bytearray(RESPOSTA.size)
+        _recebe(c.sock, memoryview(cab))
+        tipo, seq, i, j, calculo = RESPOSTA.unpack(bytes(cab))
+        if tipo != b"ACEL" or seq != self.seq or (i, j) != (ini, fim):
+            raise ValueError("resposta inesperada")
+        _recebe(c.sock, _bytes(a[ini:fim]))
+        return calculo
+
+    def _local(self, r, G, ini, fim, a):
+        '''(Distribuida, array, float, int, int, array) -> None
+        Calcula o bloco [ini, fim) neste processo
+        '''
+        passo = max(1, PARES_BLOCO // len(r))
+        for i in range(ini, fim, passo):
+            j = min(i + passo, fim)
+            acel_direta(r, self.m, G, i, j, out=a[i:j])
+
+    def aceleracoes(self, r, m, G):
+        '''(Distribuida, array, array, float) -> array
+        Retorna as aceleracoes (N, 3) de todos os corpos
+        '''
+        t0 = time()
+        with self.trava:
+            self.ativos += self.novos
+            self.novos = []
+        n = len(m)
+        if self.m is None or not array_equal(m, self.m):
+            self.m = ascontiguousarray(m, dtype=float64).copy()
+            self.versao += 1
+        r = ascontiguousarray(r, dtype=float64)
+        a = empty((n, 3))
+        self.seq += 1
+
+        pendentes = self._divide(n)
+        livres = list(self.ativos)
+        em_curso = {}
+        calculo = {}
+        while pendentes or em_curso:
+            while pendentes and livres:
+                c = livres.pop(0)
+                ini, fim = pendentes.pop(0)
+                if self._envia(c, r, n, ini, fim, G):
+                    em_curso[c.sock] = (c, ini, fim)
+                else:
+                    pendentes.append((ini, fim))
+            if not em_curso:
+                if pendentes:
+                    # nenhum trabalhador: calcula aqui mesmo
+                    warnings.warn("Sem trabalhadores; calculando localmente",
+                                  RuntimeWarning)
+                    t1 = time()
+                    for ini, fim in pendentes:
+                        self._local(r, G, ini, fim, a)
+                    calculo[None] = time() - t1
+                break
+            prontos = select.select(list(em_curso), [], [], self.tempo_limite)[0]
+            if not prontos:
+                for s in list(em_curso):
+                    c, ini, fim = em_curso.pop(s)
+                    self._perde(c, "sem resposta em %g s" % self.tempo_limite)
+                    pendentes.append((ini, fim))
+                continue
+            for s in prontos:
+                c, ini, fim = em_curso.pop(s)
+                try:
+                    dt = self._recebe_bloco(c, a, ini, fim)
+                except (socket.error, OSError, EOFError, ValueError) as erro:
+                    self._perde(c, erro)
+                    pendentes.append((ini, fim))
+                    continue
+                taxa = (fim - ini) / max(dt, 1e-9)
+                c.taxa = taxa if c.taxa is None else (c.taxa + taxa) / 2
+                calculo[c] = calculo.get(c, 0.) + dt
+                livres.append(c)
+
+        parede = time() - t0
+        # o passo espera pelo trabalhador mais lento: o resto e comunicacao
+        critico = max(calculo.values()) if calculo else 0.
+        tempos = {"passo": self.seq, "n": n, "trabalhadores": len(self.ativos),
+                  "parede": parede, "calculo": critico,
+                  "calculo_total": sum(calculo.values()),
+                  "comunicacao": parede - critico}
+        self.tempos.append(tempos)
+        if self.a_cada and self.seq % self.a_cada == 0:
+            print("passo %d: N = %d, %d trabalhadores, parede %.2f ms, "
+                  "calculo %.2f ms, comunicacao %.2f ms" % (
+                  self.seq, n, tempos["trabalhadores"], 1e3 * parede,
+                  1e3 * critico, 1e3 * tempos["comunicacao"]))
+        return a
+
+    def resumo(self):
+        '''(Distribuida) -> str
+        Tempos medios por passo de calculo e comunicacao
+        '''
+        k = len(self.tempos)
+        if k == 0:
+            return "Nenhum passo distribuido"
+        media = lambda c: 1e3 * sum(t[c] for t in self.tempos) / k
+        parede = media("parede")
+        return ("%d passos: parede %.2f ms, calculo %.2f ms (%.0f%%), "
+                "comunicacao %.2f ms (%.0f%%) por passo" % (
+                k, parede, media("calculo"), 100 * media("calculo") / parede,
+                media("comunicacao"), 100 * media("comunicacao") / parede))
+
+    def fechar(self):
+        '''(Distribuida) -> None
+        Encerra os trabalhadores e o servidor
+        '''
+        with self.trava:
+            todos = self.ativos + self.novos
+            self.ativos, self.novos = [], []
+        for c in todos:
+            try:
+                c.sock.sendall(PEDIDO.pack(b"FIM ", 0, 0, 0, 0, 0, 0.))
+            except (socket.error, OSError):
+                pass
+            c.sock.close()
+        try:
+            # shutdown acorda o accept() bloqueado na outra thread
+            self.servidor.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
+        try:
+            self.servidor.close()
+        except (socket.error, OSError):
+            pass
+        for p in self.processos:
+            try:
+                p.wait(timeout=5)
+            except TypeError:
+                p.wait()
+            except subprocess.TimeoutExpired:
+                p.kill()
+        self.processos = []
+
+def teste(n=2000, locais=4, passos=20, derruba=None, entra=None, semente=1):
+    '''(int, int, int, int, int, int) -> Distribuida
+    Integra uma esfera de Plummer com trabalhadores locais, conferindo as
+    aceleracoes com a soma direta; derruba: passo em que um trabalhador
+    e morto; entra: passo em que um novo trabalhador e iniciado
+    '''
+    from numpy import abs as npabs
+    from condicoes import gera
+    from forcas import Direta
+    import nbody
+    from nbody import Nbody
+
+    # unidades de N corpos: so funde corpos praticamente sobrepostos
+    nbody.EPS = 1e-4
+    forca = Distribuida(locais=locais, a_cada=1)
+    corpos = Nbody(forca=forca, headless=True, integrador="leapfrog")
+    corpos.estado = gera("plummer", n, semente=semente)
+    corpos._dt = corpos.dt = 1e-3
+    e = corpos.estado
+    ref = Direta().aceleracoes(e.r, e.m, corpos.G)
+    erro = (npabs(forca.aceleracoes(e.r, e.m, corpos.G) - ref)).max() / npabs(ref).max()
+    print("Diferenca para a soma direta: %.3e" % erro)
+
+    def eventos(corpos):
+        if corpos.passos == derruba and forca.processos:
+            print("Matando um trabalhador no passo %d" % corpos.passos)
+            forca.processos[0].kill()
+        if corpos.passos == entra:
+            print("Iniciando um trabalhador no passo %d" % corpos.passos)
+            forca.inicia_locais(1, espera=30)
+    corpos.a_cada(1, eventos)
+    try:
+        corpos.integracao(float("inf"), ate=passos)
+    finally:
+        forca.fechar()
+    print(forca.resumo())
+    return forca
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "trabalhador":
+        trabalhador(sys.argv[2], int(sys.argv[3]))
+        return
+    ap = argparse.ArgumentParser(description="Soma direta distribuida por TCP. "
+                                 "Trabalhadores remotos: python distribuido.py "
+                                 "trabalhador HOST PORTA")
+    ap.add_argument("modo", choices=["teste"])
+    ap.add_argument("--n", type=int, default=2000)
+    ap.add_argument("--locais", type=int, default=4)
+    ap.add_argument("--passos", type=int, default=20)
+    ap.add_argument("--derruba", type=int, help="passo em que um trabalhador morre")
+    ap.add_argument("--entra", type=int, help="passo em que um trabalhador entra")
+    ap.add_argument("--semente", type=int, default=1)
+    args = vars(ap.parse_args())
+    args.pop("modo")
+    teste(**args)
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+from multiprocessing import Pool, cpu_count
+from time import time
+
+import numpy
+
+import nbody
+from nbody import Nbody, gera_aleatorias
+from diagnosticos import cinetica, potencial, momento, momento_angular
+from integradores import INTEGRADORES
+from forcas import FORCAS
+
+# parametros varridos; cada realizacao e uma combinacao de todos
+EIXOS = ("semente", "n", "G", "dt", "T", "eps", "forca", "integrador")
+
+# varredura padrao: o aglomerado aleatorio do modo [G]erar particulas
+PADRAO = {"semente": [1], "n": [20], "G": [1.], "dt": [1 / 120], "T": [100.],
+          "eps": [nbody.R / 40], "forca": ["direto"], "integrador": ["euler"]}
+
+# colunas da tabela de resultados, apos os parametros
+COLUNAS = ("id",) + EIXOS + ("n_final", "fusoes", "passos", "tempo", "E0", "E",
+                             "deriva_energia", "deriva_momento", "L", "virial",
+                             "raio_meia_massa", "ckpt")
+
+def expande(varredura):
+    '''(dict) -> list of dict
+    Produto cartesiano dos valores de cada eixo da varredura; eixos
+    ausentes usam PADRAO e valores escalares viram listas de um item
+    '''
+    eixos = []
+    for k in varredura:
+        if k not in EIXOS:
+            raise ValueError("Eixo desconhecido na varredura: %s" % k)
+    for k in EIXOS:
+        v = varredura.get(k, PADRAO[k])
+        eixos.append(v if isinstance(v, (list, tuple)) else [v])
+    confs = []
+    for i, valores in enumerate(itertools.product(*eixos)):
+        c = dict(zip(EIXOS, valores))
+        c["id"] = i
+        confs.append(c)
+    return confs
+
+def roda(conf, saida):
+    '''(dict, str) -> dict
+    Roda uma realizacao sem visualizacao, grava o estado final em
+    checkpoint e o resumo em JSON no diretorio saida, retornando o resumo
+    '''
+    nbody.EPS = conf["eps"]
+    random.seed(conf["semente"])
+    pts = gera_aleatorias(conf["n"])
+    corpos = Nbody(pts, forca=conf["forca"], headless=True,
+                   integrador=conf["integrador"])
+    corpos.G = conf["G"]
+    corpos.dt = conf["dt"]
+
+    e = corpos.estado
+    E0 = cinetica(e) + potencial(e, corpos.G)
+    p0 = momento(e)
+    escala = numpy.sqrt((e.p * e.p).sum(axis=1)).sum()
+    t0 = time()
+    corpos.integracao(conf["T"])
+    dt = time() - t0
+    corpos.forca.fechar()
+
+    e = corpos.estado
+    K, U = cinetica(e), potencial(e, corpos.G)
+    cm = (e.r * e.m[:, None]).sum(axis=0) / e.m.sum()
+    d = numpy.sqrt(((e.r - cm)**2).sum(axis=1))
+    ordem = numpy.argsort(d)
+    meia = numpy.searchsorted(numpy.cumsum(e.m[ordem]), e.m.sum() / 2)
+    ckpt = os.path.join(saida, "run-%05d.ckpt" % conf["id"])
+    corpos.salva_checkpoint(ckpt)
+
+    res = dict(conf)
+    res.update({"n_final": corpos.n, "fusoes": conf["n"] - corpos.n,
+                "passos": corpos.passos, "tempo": dt, "E0": E0, "E": K + U,
+                "deriva_energia": abs((K + U) / E0 - 1),
+                "deriva_momento": float(numpy.sqrt(((momento(e) - p0)**2).sum()) / escala),
+                "L": float(numpy.sqrt((momento_angular(e)**2).sum())),
+                "virial": 2 * K / abs(U) if U else float("inf"),
+                "raio_meia_massa": float(d[ordem[min(meia, len(d) - 1)]]),
+                "ckpt": os.path.basename(ckpt)})
+    arq = open(os.path.join(saida, "run-%05d.json" % conf["id"]), "w")
+    json.dump(res, arq)
+    arq.close()
+    return res
+
+def _roda(args):
+    return roda(*args)
+
+def le_resumo(saida, conf):
+    '''(str, dict) -> dict
+    Resumo de uma realizacao ja terminada com os mesmos parametros, ou None
+    '''
+    nome = os.path.join(saida, "run-%05d.json" % conf["id"])
+    if not os.path.exists(nome):
+        return None
+    arq = open(nome)
+    res = json.load(arq)
+    arq.close()
+    if any(res.get(k) != conf[k] for k in EIXOS):
+        return None
+    return res
+
+def junta(resultados, saida):
+    '''(list of dict, str) -> str
+    Grava a tabela com todas as realizacoes em CSV, retornando o nome
+    '''
+    nome = os.path.join(saida, "resultados.csv")
+    arq = open(nome, "w")
+    w = csv.writer(arq)
+    w.writerow(COLUNAS)
+    for r in sorted(resultados, key=lambda r: r["id"]):
+        w.writerow([r[c] for c in COLUNAS])
+    arq.close()
+    return nome
+
+def ensemble(varredura, saida="ensemble", processos=None, verbose=True):
+    '''(dict, str, int, bool) -> list of dict
+    Roda todas as realizacoes da varredura em um pool com no maximo
+    `processos` simultaneos; realizacoes ja gravadas em saida sao
+    reaproveitadas, de modo que uma varredura interrompida pode ser
+    retomada com o mesmo comando
+    '''
+    if not os.path.isdir(saida):
+        os.makedirs(saida)
+    confs = expande(varredura)
+    arq = open(os.path.join(saida, "varredura.json"), "w")
+    json.dump(varredura, arq, indent=1)
+    arq.close()
+
+    resultados, faltam = [], []
+    for c in confs:
+        r = le_resumo(saida, c)
+        if r is None:
+            faltam.append(c)
+        else:
+            resultados.append(r)
+    if verbose:
+        print("%d realizacoes, %d ja prontas" % (len(confs), len(resultados)))
+
+    processos = min(processos or cpu_count(), max(len(faltam), 1))
+    pool = Pool(processos)
+    try:
+        # chunksize 1: realizacoes podem ter custos bem diferentes
+        for r in pool.imap_unordered(_roda, [(c, saida) for c in faltam]):
+            resultados.append(r)
+            if verbose:
+                print("[%d/%d] id %d: N %d -> %d, dE %.2e, %.1f s" % (
+                      len(resultados), len(confs), r["id"], r["n"],
+                      r["n_final"], r["deriva_energia"], r["tempo"]))
+                sys.stdout.flush()
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    nome = junta(resultados, saida)
+    if verbose:
+        print("Tabela em %s" % nome)
+    return resultados
+
+def main():
+    ap = argparse.ArgumentParser(description="Varredura de parametros do "
+                                 "aglomerado aleatorio, sem visualizacao")
+    ap.add_argument("varredura", nargs="?", default=None,
+                    help="JSON com listas de valores por eixo (%s)" % ", ".join(EIXOS))
+    ap.add_argument("--sementes", type=int, nargs="+")
+    ap.add_argument("--n", type=int, nargs="+")
+    ap.add_argument("--G", type=float, nargs="+")
+    ap.add_argument("--dt", type=float, nargs="+")
+    ap.add_argument("--T", type=float, nargs="+")
+    ap.add_argument("--eps", type=float, nargs="+")
+    # os backends paralelo e distribuido criam processos, o que nao e
+    # possivel dentro do pool
+    ap.add_argument("--forcas", nargs="+", choices=[f for f in FORCAS
+                                                    if f not in ("paralelo", "distribuido")])
+    ap.add_argument("--integradores", nargs="+", choices=sorted(INTEGRADORES))
+    ap.add_argument("--processos", type=int, default=None)
+    ap.add_argument("--saida", default="ensemble")
+    args = ap.parse_args()
+
+    varredura = {}
+    if args.varredura:
+        arq = open(args.varredura)
+        varredura = json.load(arq)
+        arq.close()
+    for eixo, valor in (("semente", args.sementes), ("n", args.n), ("G", args.G),
+                        ("dt", args.dt), ("T", args.T), ("eps", args.eps),
+                        ("forca", args.forcas), ("integrador", args.integradores)):
+        if valor:
+            varredura[eixo] = valor
+    ensemble(varredura, args.saida, args.processos)
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+
+from numpy import arange, asarray, char, concatenate, isnan, ones, zeros
+
+from particula import Particula
+
+class Estado(object):
+    """Classe Estado, guarda as particulas em arrays contiguos (struct-of-arrays)"""
+
+    def __init__(self, pts=[]):
+        '''(Estado, list of Particula) -> None
+        Copia os dados das particulas para os arrays e
+        liga cada particula a sua linha no estado
+        '''
+        n = len(pts)
+        # posicoes, velocidades e momentos (N, 3)
+        self.r = zeros((n, 3))
+        self.v = zeros((n, 3))
+        self.p = zeros((n, 3))
+        # massas (N,)
+        self.m = zeros(n)
+        # identificador fixo de cada particula, mantido nas colisoes
+        self.ids = arange(n)
+        for i, body in enumerate(pts):
+            self.r[i] = body._r
+            self.v[i] = body._v
+            self.p[i] = body._p
+            self.m[i] = body._m[0]
+        self._bodies = list(pts)
+        self.liga()
+
+    @classmethod
+    def de_arrays(cls, r, v, m, labels, cores=None, p=None, ids=None):
+        '''(array, array, array, array, array, array, array) -> Estado
+        Cria o estado direto dos arrays, sem criar as particulas;
+        cores (N, 3) usa NaN para particulas sem cor definida;
+        sem p, os momentos sao calculados de v e m
+        '''
+        e = cls()
+        e.r = asarray(r, dtype=float)
+        e.v = asarray(v, dtype=float)
+        e.m = asarray(m, dtype=float)
+        e.p = e.v * e.m[:, None] if p is None else asarray(p, dtype=float)
+        e.ids = arange(len(e.m)) if ids is None else asarray(ids, dtype=int)
+        e._labels = asarray(labels)
+        e._cores = cores
+        e._bodies = None
+        return e
+
+    @property
+    def bodies(self):
+        '''(Estado) -> list of Particula
+        Cria as particulas na primeira vez que sao pedidas
+        '''
+        if self._bodies is None:
+            self._bodies = []
+            for i in range(len(self.m)):
+                lbl = self._labels[i]
+                if isinstance(lbl, bytes):
+                    lbl = lbl.decode("utf-8")
+                cor = None
+                if self._cores is not None and not isnan(self._cores[i, 0]):
+                    cor = tuple(self._cores[i].tolist())
+                self._bodies.append(Particula(lbl, color=cor))
+            self._labels = self._cores = None
+            self.liga()
+        return self._bodies
+
+    def labels(self):
+        '''(Estado) -> list of str
+        Retorna os rotulos das particulas
+        '''
+        if self._bodies is None:
+            return [l.decode("utf-8") if isinstance(l, bytes) else l
+                    for l in self._labels]
+        return [body.label for body in self._bodies]
+
+    def labels_utf8(self):
+        '''(Estado) -> array
+        Retorna os rotulos codificados em utf-8 (array de bytes)
+        '''
+        if self._bodies is None:
+            if self._labels.dtype.kind == "S":
+                return self._labels
+            return char.encode(self._labels.astype("U"), "utf-8")
+        return char.encode(asarray(self.labels(), dtype="U"), "utf-8")
+
+    def cores(self):
+        '''(Estado) -> array
+        Retorna as cores (N, 3), NaN onde nao ha cor definida
+        '''
+        if self._bodies is None:
+            if self._cores is None:
+                return zeros((len(self.m), 3)) + float("nan")
+            return self._cores
+        c = zeros((len(self.m), 3)) + float("nan")
+        for i, body in enumerate(self._bodies):
+            if body.cor is not None:
+                c[i] = body.cor
+        return c
+
+    def __len__(self):
+        return len(self.m)
+
+    def liga(self):
+        '''(Estado) -> None
+        Aponta cada particula para a sua linha dos arrays
+        '''
+        if self._bodies is None:
+            return
+        for i, body in enumerate(self._bodies):
+            body.liga(self, i)
+
+    def remove(self, idx):
+        '''(Estado, list of int) -> None
+        Remove as particulas de indices idx,
+        compactando os arrays uma unica vez
+        '''
+        manter = ones(len(self.m), dtype=bool)
+        manter[idx] = False
+        self.r = self.r[manter]
+        self.v = self.v[manter]
+        self.p = self.p[manter]
+        self.m = self.m[manter]
+        self.ids = self.ids[manter]
+        if self._bodies is None:
+            self._labels = self._labels[manter]
+            if self._cores is not None:
+                self._cores = self._cores[manter]
+        else:
+            self._bodies = [b for b, k in zip(self._bodies, manter) if k]
+        self.liga()
+
+    def separa(self, idx):
+        '''(Estado, list of int) -> Estado
+        Remove as particulas de indices idx e as retorna, nessa ordem,
+        num novo estado (com os mesmos ids)
+        '''
+        idx = asarray(idx, dtype=int)
+        if self._bodies is None:
+            cores = None if self._cores is None else self._cores[idx]
+            outro = Estado.de_arrays(self.r[idx], self.v[idx], self.m[idx],
+                                     self._labels[idx], cores, p=self.p[idx],
+                                     ids=self.ids[idx])
+        else:
+            outro = Estado()
+            outro.r, outro.v, outro.p = self.r[idx], self.v[idx], self.p[idx]
+            outro.m, outro.ids = self.m[idx], self.ids[idx]
+            outro._bodies = [self._bodies[i] for i in idx.tolist()]
+            outro.liga()
+        self.remove(idx)
+        return outro
+
+    def acrescenta(self, outro):
+        '''(Estado, Estado) -> None
+        Anexa ao fim as particulas de outro estado (mantendo os ids)
+        '''
+        if len(outro) == 0:
+            return
+        if len(self.m) == 0 and outro._bodies is None:
+            # estado vazio passa a guardar rotulos e cores como o outro
+            self._labels, self._cores = outro._labels, outro._cores
+            self._bodies = None
+        elif self._bodies is None:
+            if outro._bodies is None and self._labels.dtype.kind == outro._labels.dtype.kind:
+                self._labels = concatenate([self._labels, outro._labels])
+            else:
+                self._labels = asarray(self.labels() + outro.labels())
+            if self._cores is not None or outro._bodies is not None or outro._cores is not None:
+                self._cores = concatenate([self.cores(), outro.cores()])
+        else:
+            self._bodies = self._bodies + outro.bodies
+        self.r = concatenate([self.r, outro.r])
+        self.v = concatenate([self.v, outro.v])
+        self.p = concatenate([self.p, outro.p])
+        self.m = concatenate([self.m, outro.m])
+        self.ids = concatenate([self.ids, outro.ids])
+        self.liga()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+from numpy import (arange, concatenate, einsum, empty, flatnonzero, float32,
+                   inf, newaxis, ones, sqrt)
+
+# maximo de pares (linhas x colunas) calculados de uma vez
+PARES_BLOCO = 2**21
+
+# com ate este numero de fontes, acel_fontes percorre as fontes uma a uma,
+# cada uma vetorizada sobre todos os alvos
+FONTES_LACO = 64
+
+# nomes aceitos por cria_forca
+FORCAS = ("direto", "direto32", "numba", "bh", "pm", "paralelo", "distribuido")
+
+def acel_direta(r, m, G, ini=0, fim=None, out=None):
+    '''(array, array, float, int, int, array) -> array
+    Retorna as aceleracoes nos corpos [ini, fim) devidas a todos os corpos
+    a_i = G * soma_j m_j * (r_j - r_i) / |r_j - r_i|^3
+    '''
+    if fim is None:
+        fim = len(m)
+    # separacoes (B, N, 3)
+    d = r[newaxis, :, :] - r[ini:fim, newaxis, :]
+    d2 = einsum('ijk,ijk->ij', d, d)
+    # exclui a interacao de cada corpo consigo mesmo
+    i = arange(ini, fim)
+    d2[i - ini, i] = inf
+    w = m[newaxis, :] / (d2 * sqrt(d2))
+    if out is None:
+        out = empty((fim - ini, 3))
+    einsum('ij,ijk->ik', w, d, out=out)
+    out *= G
+    return out
+
+def acel_alvos(r, m, G, alvos, out=None):
+    '''(array, array, float, array, array) -> array
+    Retorna as aceleracoes apenas nos corpos de indices alvos
+    '''
+    d = r[newaxis, :, :] - r[alvos, newaxis, :]
+    d2 = einsum('ijk,ijk->ij', d, d)
+    d2[arange(len(alvos)), alvos] = inf
+    w = m[newaxis, :] / (d2 * sqrt(d2))
+    if out is None:
+        out = empty((len(alvos), 3))
+    einsum('ij,ijk->ik', w, d, out=out)
+    out *= G
+    return out
+
+def acel_fontes(rt, r, m, G, out=None, bloco=PARES_BLOCO):
+    '''(array, array, array, float, array, int) -> array
+    Retorna as aceleracoes nos pontos rt (T, 3) devidas as massas m nas
+    posicoes r (N, 3), sem reacao (particulas de teste sem massa);
+    O(N * T), em blocos de linhas com no maximo `bloco` pares
+    '''
+    n = len(m)
+    if out is None:
+        out = empty((len(rt), 3))
+    if n <= FONTES_LACO:
+        out[:] = 0
+        for j in range(n):
+            d = r[j] - rt
+            d2 = einsum('ij,ij->i', d, d)
+            d *= (m[j] / (d2 * sqrt(d2)))[:, newaxis]
+            out += d
+        out *= G
+        return out
+    passo = max(1, bloco // max(n, 1))
+    for i in range(0, len(rt), passo):
+        j = min(i + passo, len(rt))
+        d = r[newaxis, :, :] - rt[i:j, newaxis, :]
+        d2 = einsum('ijk,ijk->ij', d, d)
+        w = m[newaxis, :] / (d2 * sqrt(d2))
+        einsum('ij,ijk->ik', w, d, out=out[i:j])
+    out *= G
+    return out
+
+def acel_direta32(x, m, G, ini=0, fim=None, out=None):
+    '''(array, array, float, int, int, array) -> array
+    Como acel_direta, em precisao simples: x (3, N) float32 sao as
+    posicoes por coordenada relativas a uma origem e m (N,) float32;
+    cada soma em j e feita ao longo do eixo contiguo, onde o numpy usa
+    soma em pares (erro O(log N) em vez de O(N)); saida em float64
+    '''
+    if fim is None:
+        fim = len(m)
+    # separacoes (3, B, N)
+    d = x[:, newaxis, :] - x[:, ini:fim, newaxis]
+    d2 = einsum('kij,kij->ij', d, d)
+    i = arange(ini, fim)
+    d2[i - ini, i] = inf
+    w = m[newaxis, :] / (d2 * sqrt(d2))
+    d *= w[newaxis, :, :]
+    if out is None:
+        out = empty((fim - ini, 3))
+    out[:] = d.sum(axis=2).T
+    out *= G
+    return out
+
+class Direta(object):
+    """Soma direta de todos os pares, O(N^2)"""
+
+    nome = "direto"
+
+    def __init__(self, bloco=PARES_BLOCO):
+        '''(Direta, int) -> None
+        bloco: maximo de pares por bloco de linhas, limita a memoria
+        temporaria a O(bloco) em vez de O(N^2)
+        '''
+        self.bloco = bloco
+
+    def aceleracoes(self, r, m, G):
+        '''(Direta, array, array, float) -> array
+        Retorna as aceleracoes (N, 3) de todos os corpos
+        '''
+        n = len(m)
+        a = empty((n, 3))
+        passo = max(1, self.bloco // max(n, 1))
+        for i in range(0, n, passo):
+            j = min(i + passo, n)
+            acel_direta(r, m, G, i, j, out=a[i:j])
+        return a
+
+    def aceleracoes_alvos(self, r, m, G, alvos):
+        '''(Direta, array, array, float, array) -> array
+        Retorna as aceleracoes (len(alvos), 3) apenas dos corpos alvos
+        '''
+        return acel_alvos(r, m, G, alvos)
+
+    def fechar(self):
+        '''(Direta) -> None
+        Libera recursos do backend
+        '''
+        pass
+
+class Direta32(Direta):
+    """Soma direta em precisao simples: posicoes em float32 relativas ao
+    centro da caixa envolvente (em float64), somas em pares; o estado
+    integrado continua em float64"""
+
+    nome = "direto32"
+
+    def _converte(self, r, m):
+        '''(Direta32, array, array) -> (array, array)
+        Posicoes (3, N) e massas em float32, relativas ao centro da caixa
+        '''
+        origem = (r.min(axis=0) + r.max(axis=0)) / 2
+        x = empty((3, len(m)), dtype=float32)
+        x[:] = (r - origem).T
+        return x, m.astype(float32)
+
+    def aceleracoes(self, r, m, G):
+        n = len(m)
+        x, m32 = self._converte(r, m)
+        a = empty((n, 3))
+        passo = max(1, self.bloco // max(n, 1))
+        for i in range(0, n, passo):
+            j = min(i + passo, n)
+            acel_direta32(x, m32, G, i, j, out=a[i:j])
+        return a
+
+    def aceleracoes_alvos(self, r, m, G, alvos):
+        # reordena para que os alvos sejam as primeiras linhas
+        n = len(m)
+        resto = ones(n, dtype=bool)
+        resto[alvos] = False
+        ordem = concatenate((alvos, flatnonzero(resto)))
+        x, m32 = self._converte(r[ordem], m[ordem])
+        a = empty((len(alvos), 3))
+        passo = max(1, self.bloco // max(n, 1))
+        for i in range(0, len(alvos), passo):
+            j = min(i + passo, len(alvos))
+            acel_direta32(x, m32, G, i, j, out=a[i:j])
+        return a
+
+def cria_forca(nome="direto", **opcoes):
+    '''(str, ...) -> backend de forca
+    Retorna o backend de forca de nome dado
+    '''
+    if nome == "direto":
+        return Direta(**opcoes)
+    elif nome == "direto32":
+        return Direta32(**opcoes)
+    elif nome == "numba":
+        from nucleos import DiretaJit
+        return DiretaJit(**opcoes)
+    elif nome == "bh":
+        from barneshut import BarnesHut
+        return BarnesHut(**opcoes)
+    elif nome == "pm":
+        from pm import ParticulaMalha
+        return ParticulaMalha(**opcoes)
+    elif nome == "paralelo":
+        from paralelo import Paralela
+        return Paralela(**opcoes)
+    elif nome == "distribuido":
+        from distribuido import Distribuida
+        return Distribuida(**opcoes)
+    raise ValueError("Backend de forca desconhecido: %s" % nome)
+
+def relatorio_precisao(r, m, G=1, bloco=PARES_BLOCO):
+    '''(array, array, float, int) -> list of dict
+    Compara as somas diretas em float64 e float32 nas mesmas posicoes:
+    erro relativo da aceleracao de cada corpo, violacao da 3a lei
+    (|soma m a| / soma |m a|), tempo e memoria temporaria de pico
+    '''
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    from time import time
+    from numpy import nan, percentile
+
+    print("N = %d" % len(m))
+    print("   backend |  erro mediano |  erro p99    |  erro max    |  3a lei     |  tempo (s) |  pico MB")
+    print("-" * 96)
+    linhas = []
+    ref = None
+    for forca in (Direta(bloco), Direta32(bloco)):
+        forca.aceleracoes(r[:64], m[:64], G)
+        t0 = time()
+        a = forca.aceleracoes(r, m, G)
+        dt = time() - t0
+        pico = nan
+        if tracemalloc:
+            tracemalloc.start()
+            forca.aceleracoes(r, m, G)
+            pico = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        if ref is None:
+            ref = a
+        erro = sqrt(((a - ref)**2).sum(axis=1) / (ref * ref).sum(axis=1))
+        f = a * m[:, newaxis]
+        lei = sqrt((f.sum(axis=0)**2).sum()) / sqrt((f * f).sum(axis=1)).sum()
+        lin = {"forca": forca.nome, "erro_mediano": percentile(erro, 50),
+               "erro_p99": percentile(erro, 99), "erro_max": erro.max(),
+               "terceira_lei": lei, "tempo": dt, "pico_mb": pico}
+        linhas.append(lin)
+        print("%10s |  %.6e |  %.6e |  %.6e |  %.3e |  %9.3f |  %7.1f" % (
+              forca.nome, lin["erro_mediano"], lin["erro_p99"], lin["erro_max"],
+              lei, dt, pico))
+    return linhas
+
+###############################################################################
+
+if __name__ == "__main__":
+    from sys import argv
+    from numpy.random import RandomState
+
+    # aglomerado como o do modo [G]erar particulas, longe da origem para
+    # mostrar o efeito da origem local das posicoes em float32
+    R, V, M = 100, 1.5, 70
+    N = int(argv[1]) if len(argv) > 1 else 10000
+    aleatorio = RandomState(42)
+    r = aleatorio.triangular(-R, 0, R, (N, 3)) + 10 * R
+    m = aleatorio.triangular(0.7, (0.7 + M) / 2, M, N)
+    relatorio_precisao(r, m)
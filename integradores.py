@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+from numpy import (abs, bincount, ceil, clip, errstate, flatnonzero, log2,
+                   nan_to_num, ones, sign, sin, sinh, sqrt, where, zeros)
+
+from forcas import acel_fontes
+
+class Integrador(object):
+    """Base dos integradores: avancam o estado de um Nbody por dt"""
+
+    nome = None
+
+    def __init__(self):
+        self.reinicia()
+
+    def reinicia(self):
+        '''(Integrador) -> None
+        Descarta as aceleracoes guardadas (apos colisoes ou troca de G)
+        '''
+        self.a = None
+        self.G = None
+        self.a_testes = None
+
+    def troca_estado(self):
+        '''(Integrador) -> None
+        Descarta tudo o que foi guardado dos corpos quando o estado e
+        substituido por outro
+        '''
+        self.reinicia()
+
+    def acel(self, corpos):
+        '''(Integrador, Nbody) -> array
+        Aceleracoes nas posicoes atuais, reaproveitando as do passo anterior
+        quando nada mudou desde entao
+        '''
+        if self.a is None or self.G != corpos.G or len(self.a) != corpos.n:
+            self.a = corpos.aceleracoes()
+            self.G = corpos.G
+        return self.a
+
+    def passo(self, corpos, dt):
+        '''(Integrador, Nbody, float) -> None
+        Avanca o estado de corpos por dt
+        '''
+        raise NotImplementedError
+
+    def passo_testes(self, corpos, dt):
+        '''(Integrador, Nbody, float) -> None
+        Avanca os corpos com passo() e as particulas de teste com um
+        leapfrog KDK no campo dos corpos no inicio e no fim do passo
+        (2a ordem, 1 avaliacao O(N * N_testes) por passo)
+        '''
+        t = corpos.testes
+        if self.a_testes is None or len(self.a_testes) != len(t):
+            self.a_testes = corpos.aceleracoes_testes()
+        t.v += self.a_testes * (dt / 2)
+        self.passo(corpos, dt)
+        t.r += t.v * dt
+        self.a_testes = corpos.aceleracoes_testes()
+        t.v += self.a_testes * (dt / 2)
+        t.p[:] = t.m[:, None] * t.v
+
+    def salva_estado(self, corpos):
+        '''(Integrador, Nbody) -> dict
+        Arrays internos necessarios para retomar a integracao exatamente
+        do mesmo ponto (gravados como extras do checkpoint)
+        '''
+        if self.a is None or len(self.a) != corpos.n:
+            return {}
+        return {"a": self.a}
+
+    def restaura_estado(self, corpos, arrays):
+        '''(Integrador, Nbody, dict) -> None
+        Recupera o que foi gravado por salva_estado
+        '''
+        self.reinicia()
+        if "a" in arrays:
+            self.a = arrays["a"].copy()
+            self.G = corpos.G
+
+class Euler(Integrador):
+    """Euler semi-implicito (simpletico, 1a ordem): 1 forca por passo"""
+
+    nome = "euler"
+
+    def passo(self, corpos, dt):
+        e = corpos.estado
+        a = corpos.aceleracoes()
+
+        # calculando impulso e velocidade atual
+        e.p += e.m[:, None] * a * dt
+        e.v[:] = e.p / e.m[:, None]
+
+        # calculando posicao atual
+        e.r += e.v * dt
+
+class Leapfrog(Integrador):
+    """Leapfrog / velocity-Verlet kick-drift-kick (simpletico, 2a ordem):
+    1 forca por passo, a do fim de um passo serve o inicio do proximo"""
+
+    nome = "leapfrog"
+
+    def passo(self, corpos, dt):
+        self.kdk(corpos, dt)
+        corpos.estado.p[:] = corpos.estado.m[:, None] * corpos.estado.v
+
+    def kdk(self, corpos, dt):
+        '''(Leapfrog, Nbody, float) -> None
+        Meio chute, deriva e meio chute
+        '''
+        e = corpos.estado
+        e.v += self.acel(corpos) * (dt / 2)
+        e.r += e.v * dt
+        self.a = corpos.aceleracoes()
+        e.v += self.a * (dt / 2)
+
+class Yoshida4(Leapfrog):
+    """Yoshida de 4a ordem (simpletico): composicao de tres leapfrogs,
+    3 forcas por passo"""
+
+    nome = "yoshida4"
+
+    # coeficientes de Yoshida (1990)
+    W1 = 1 / (2 - 2**(1/3))
+    W0 = 1 - 2 * W1
+
+    def passo(self, corpos, dt):
+        for w in (self.W1, self.W0, self.W1):
+            self.kdk(corpos, w * dt)
+        corpos.estado.p[:] = corpos.estado.m[:, None] * corpos.estado.v
+
+class RK4(Integrador):
+    """Runge-Kutta classico de 4a ordem (nao simpletico, para comparacao):
+    4 forcas por passo"""
+
+    nome = "rk4"
+
+    def passo(self, corpos, dt):
+        e = corpos.estado
+        r0, v0 = e.r.copy(), e.v.copy()
+        k1v = corpos.aceleracoes(r0)
+        k1r = v0
+        k2v = corpos.aceleracoes(r0 + k1r * (dt / 2))
+        k2r = v0 + k1v * (dt / 2)
+        k3v = corpos.aceleracoes(r0 + k2r * (dt / 2))
+        k3r = v0 + k2v * (dt / 2)
+        k4v = corpos.aceleracoes(r0 + k3r * dt)
+        k4r = v0 + k3v * dt
+        e.r += (k1r + 2*k2r + 2*k3r + k4r) * (dt / 6)
+        e.v += (k1v + 2*k2v + 2*k3v + k4v) * (dt / 6)
+        e.p[:] = e.m[:, None] * e.v
+
+class Blocos(Integrador):
+    """Leapfrog KDK com passos individuais em blocos de potencias de 2:
+    o corpo i usa dt / 2^k_i, escolhido pelo criterio de jerk
+    dt_i = eta * |a_i| / |da_i/dt|, e so os corpos ativos sao chutados
+    (todos derivam juntos, o que e barato)"""
+
+    nome = "blocos"
+
+    def __init__(self, eta=0.03, kmax=10):
+        '''(Blocos, float, int) -> None
+        eta: precisao do criterio de passo
+        kmax: nivel mais fino, com passo dt / 2^kmax
+        '''
+        self.eta = eta
+        self.kmax = kmax
+        # nivel de cada corpo, indexado pelo id fixo do Estado
+        self.nivel_id = None
+        # contagem de corpos por nivel ao longo da integracao
+        self.hist = zeros(kmax + 1, dtype=int)
+        self.avaliacoes = 0
+        self.avaliacoes_global = 0
+        Integrador.__init__(self)
+
+    def passo(self, corpos, dt):
+        e = corpos.estado
+        n = len(e)
+        kmax = self.kmax
+        nsub = 2**kmax
+        h = dt / nsub
+        if self.nivel_id is None or len(self.nivel_id) <= e.ids.max():
+            # comeca todos no nivel mais fino, cada um sobe ate o seu
+            self.nivel_id = zeros(e.ids.max() + 1, dtype=int) + kmax
+        k = self.nivel_id[e.ids]
+        a = self.acel(corpos).copy()
+
+        s = 0
+        # meio chute inicial de todos (todos estao sincronizados)
+        e.v += a * (h * 2.**(kmax - k) / 2)[:, None]
+        while s < nsub:
+            # avanca ate o proximo fim de passo do nivel mais fino presente
+            u = 2**(kmax - k.max())
+            e.r += e.v * (h * u)
+            s += u
+            self.avaliacoes_global += n
+            fim = flatnonzero(s % 2**(kmax - k) == 0)
+            dti = h * 2.**(kmax - k[fim])
+
+            a_nova = corpos.aceleracoes(alvos=fim)
+            self.avaliacoes += len(fim)
+            e.v[fim] += a_nova * (dti / 2)[:, None]
+
+            # novo nivel pelo jerk estimado no passo que terminou
+            j = sqrt(((a_nova - a[fim])**2).sum(axis=1)) / dti
+            am = sqrt((a_nova**2).sum(axis=1))
+            with errstate(divide="ignore", invalid="ignore"):
+                kn = ceil(log2(dt * j / (self.eta * am)))
+            kn = clip(nan_to_num(kn), 0, kmax).astype(int)
+            # so sobe para um nivel mais grosso se estiver sincronizado com ele
+            while True:
+                desalinhado = (kn < k[fim]) & (s % 2**(kmax - kn) != 0)
+                if not desalinhado.any():
+                    break
+                kn[desalinhado] += 1
+            k[fim] = kn
+            a[fim] = a_nova
+
+            # meio chute de abertura de quem continua dentro do bloco
+            if s < nsub:
+                e.v[fim] += a_nova * (h * 2.**(kmax - kn) / 2)[:, None]
+
+        self.nivel_id[e.ids] = k
+        self.a = a
+        self.hist += bincount(k, minlength=kmax + 1)
+        e.p[:] = e.m[:, None] * e.v
+
+    def troca_estado(self):
+        # os niveis sobrevivem as colisoes (reinicia), mas os ids do estado
+        # novo sao de outros corpos
+        Integrador.troca_estado(self)
+        self.nivel_id = None
+
+    def salva_estado(self, corpos):
+        arrays = Integrador.salva_estado(self, corpos)
+        if self.nivel_id is not None:
+            arrays["nivel"] = self.nivel_id[corpos.estado.ids]
+        return arrays
+
+    def restaura_estado(self, corpos, arrays):
+        Integrador.restaura_estado(self, corpos, arrays)
+        if "nivel" in arrays:
+            ids = corpos.estado.ids
+            self.nivel_id = zeros(ids.max() + 1, dtype=int) + self.kmax
+            self.nivel_id[ids] = arrays["nivel"]
+
+    def relatorio(self):
+        '''(Blocos) -> str
+        Histograma dos niveis de passo e economia de avaliacoes de forca
+        em relacao a um passo global igual ao mais fino em uso
+        '''
+        txt = " nivel | passo (x dt) | corpos-bloco\n"
+        txt += "-" * 38 + "\n"
+        for k, c in enumerate(self.hist):
+            if c:
+                txt += " %5d | %12.3e | %d\n" % (k, 2.**-k, c)
+        if self.avaliacoes:
+            txt += "avaliacoes: %d (passo global exigiria %d, %.1fx)\n" % (
+                   self.avaliacoes, self.avaliacoes_global,
+                   self.avaliacoes_global / self.avaliacoes)
+        return txt
+
+def stumpff(z):
+    '''(array) -> (array, array)
+    Funcoes de Stumpff C(z) e S(z), com serie perto de z = 0
+    '''
+    za = abs(z)
+    s = sqrt(za)
+    with errstate(divide="ignore", invalid="ignore"):
+        # 2 sin^2(s/2) evita o cancelamento de 1 - cos(s)
+        c_el = 2 * sin(s / 2)**2 / za
+        s_el = (s - sin(s)) / (za * s)
+        c_hi = 2 * sinh(s / 2)**2 / za
+        s_hi = (sinh(s) - s) / (za * s)
+    c_se = 1/2 - z/24 + z*z/720 - z*z*z/40320
+    s_se = 1/6 - z/120 + z*z/5040 - z*z*z/362880
+    perto = za < 1e-2
+    C = where(perto, c_se, where(z > 0, c_el, c_hi))
+    S = where(perto, s_se, where(z > 0, s_el, s_hi))
+    return C, S
+
+def kepler(r0, v0, mu, dt, x=None, tol=1e-15, iteracoes=50):
+    '''(array, array, float, float, array, float, int) -> (array, array, array)
+    Avanca por dt, de forma exata, as orbitas de Kepler (N, 3) em torno
+    de uma massa central com mu = G*M, em variaveis universais (vale
+    para orbitas elipticas e hiperbolicas); a equacao de Kepler universal
+    e resolvida pelo metodo de Laguerre-Conway, partindo de x (a anomalia
+    universal do passo anterior, por exemplo) se dado; retorna tambem x
+    '''
+    R0 = sqrt((r0 * r0).sum(axis=1))
+    V2 = (v0 * v0).sum(axis=1)
+    smu = sqrt(mu)
+    sig = (r0 * v0).sum(axis=1) / smu
+    alfa = 2 / R0 - V2 / mu
+    um = 1 - alfa * R0
+
+    if x is None:
+        x = smu * dt / R0
+    ativo = ones(len(R0), dtype=bool)
+    for _ in range(iteracoes):
+        x2 = x * x
+        C, S = stumpff(alfa * x2)
+        F = sig * x2 * C + um * x2 * x * S + R0 * x - smu * dt
+        F1 = sig * x * (1 - alfa * x2 * S) + um * x2 * C + R0
+        F2 = sig * (1 - alfa * x2 * C) + um * x * (1 - alfa * x2 * S)
+        n = 5
+        raiz = sqrt(abs((n - 1)**2 * F1 * F1 - n * (n - 1) * F * F2))
+        dx = n * F / (F1 + sign(F1) * raiz)
+        dx[~ativo] = 0
+        x = x - dx
+        ativo = abs(dx) > tol * abs(x)
+        if not ativo.any():
+            break
+
+    x2 = x * x
+    C, S = stumpff(alfa * x2)
+    f = 1 - x2 / R0 * C
+    g = dt - x2 * x / smu * S
+    r = f[:, None] * r0 + g[:, None] * v0
+    R = sqrt((r * r).sum(axis=1))
+    df = smu / (R * R0) * (alfa * x2 * x * S - x)
+    dg = 1 - x2 / R * C
+    v = df[:, None] * r0 + dg[:, None] * v0
+    return r, v, x
+
+class WisdomHolman(Integrador):
+    """Mapa simpletico de Wisdom-Holman em coordenadas heliocentricas
+    democraticas (Duncan, Levison e Lee 1998), para sistemas dominados por
+    uma massa central: o movimento kepleriano de cada corpo em torno do
+    mais massivo e resolvido analiticamente, e so as interacoes entre os
+    demais corpos (pequenas) sao integradas; o passo pode ser uma fracao
+    do periodo orbital mais curto em vez de uma fracao muito menor.
+    1 forca (entre os corpos nao centrais) por passo"""
+
+    nome = "wh"
+
+    def reinicia(self):
+        Integrador.reinicia(self)
+        # anomalia universal do ultimo passo, chute do seguinte
+        self.x = None
+        self.xt = None
+
+    def interacao(self, corpos, Q, m):
+        '''(WisdomHolman, Nbody, array, array) -> array
+        Aceleracoes entre os corpos nao centrais, reaproveitando as do fim
+        do passo anterior quando nada mudou
+        '''
+        if self.a is None or self.G != corpos.G or len(self.a) != len(m):
+            self.a = self.calcula(corpos, Q, m)
+            self.G = corpos.G
+        return self.a
+
+    def calcula(self, corpos, Q, m):
+        '''(WisdomHolman, Nbody, array, array) -> array
+        Chama o backend de forca so com os corpos nao centrais, contando
+        tempo e pares no perfil como em Nbody.aceleracoes
+        '''
+        corpos.forcas += 1
+        if len(m) < 2:
+            return zeros((len(m), 3))
+        if corpos.perfil:
+            t0 = corpos.perfil.relogio()
+        a = corpos.forca.aceleracoes(Q, m, corpos.G)
+        if corpos.perfil:
+            corpos.perfil.termina("forca", t0)
+            corpos.perfil.conta("forcas")
+            corpos.perfil.conta("pares", getattr(corpos.forca, "interacoes",
+                                                 len(m) * (len(m) - 1)))
+        return a
+
+    def interacao_testes(self, corpos, Qt, Q, m):
+        '''(WisdomHolman, Nbody, array, array, array) -> array
+        Aceleracoes das particulas de teste devidas aos corpos nao centrais
+        '''
+        if len(m) == 0:
+            return zeros((len(Qt), 3))
+        if corpos.perfil:
+            t0 = corpos.perfil.relogio()
+        a = acel_fontes(Qt, Q, m, corpos.G)
+        if corpos.perfil:
+            corpos.perfil.termina("forca", t0)
+            corpos.perfil.conta("pares", len(Qt) * len(m))
+        return a
+
+    def passo_testes(self, corpos, dt):
+        self.passo(corpos, dt, testes=True)
+
+    def passo(self, corpos, dt, testes=False):
+        e = corpos.estado
+        c = e.m.argmax()
+        outros = ones(len(e), dtype=bool)
+        outros[c] = False
+        m0 = e.m[c]
+        m = e.m[outros]
+        M = e.m.sum()
+
+        # para coordenadas heliocentricas democraticas
+        rcm = e.m.dot(e.r) / M
+        vcm = e.m.dot(e.v) / M
+        Q = e.r[outros] - e.r[c]
+        P = m[:, None] * (e.v[outros] - vcm)
+
+        # particulas de teste: posicao heliocentrica e velocidade
+        # baricentrica, com a mesma sequencia de passos dos corpos
+        if testes:
+            t = corpos.testes
+            Qt = t.r - e.r[c]
+            ut = t.v - vcm
+            if self.a_testes is None or len(self.a_testes) != len(t):
+                self.a_testes = self.interacao_testes(corpos, Qt, Q, m)
+            ut += self.a_testes * (dt / 2)
+
+        # chute das interacoes, salto, Kepler, salto, chute
+        P += m[:, None] * self.interacao(corpos, Q, m) * (dt / 2)
+        salto = P.sum(axis=0) * (dt / 2 / m0)
+        Q += salto
+        if self.x is not None and (len(self.x) != len(m) or self.dt != dt):
+            self.x = None
+        Q, v, self.x = kepler(Q, P / m[:, None], corpos.G * m0, dt, self.x)
+        P = m[:, None] * v
+        Q += P.sum(axis=0) * (dt / 2 / m0)
+        self.a = self.calcula(corpos, Q, m)
+        P += m[:, None] * self.a * (dt / 2)
+
+        if testes:
+            Qt += salto
+            if self.xt is not None and (len(self.xt) != len(t) or self.dt != dt):
+                self.xt = None
+            Qt, ut, self.xt = kepler(Qt, ut, corpos.G * m0, dt, self.xt)
+            Qt += P.sum(axis=0) * (dt / 2 / m0)
+            self.a_testes = self.interacao_testes(corpos, Qt, Q, m)
+            ut += self.a_testes * (dt / 2)
+        self.dt = dt
+
+        # de volta para as coordenadas do estado
+        rcm += vcm * dt
+        e.r[c] = rcm - m.dot(Q) / M
+        e.r[outros] = Q + e.r[c]
+        e.v[outros] = P / m[:, None] + vcm
+        e.v[c] = vcm - P.sum(axis=0) / m0
+        e.p[:] = e.m[:, None] * e.v
+        if testes:
+            t.r[:] = Qt + e.r[c]
+            t.v[:] = ut + vcm
+            t.p[:] = t.m[:, None] * t.v
+
+INTEGRADORES = dict((c.nome, c) for c in (Euler, Leapfrog, Yoshida4, RK4, Blocos,
+                                          WisdomHolman))
+
+def cria_integrador(nome="euler", **opcoes):
+    '''(str, ...) -> Integrador
+    Retorna o integrador de nome dado
+    '''
+    if nome not in INTEGRADORES:
+        raise ValueError("Integrador desconhecido: %s" % nome)
+    return INTEGRADORES[nome](**opcoes)
+
+###############################################################################
+
+if __name__ == "__main__":
+    # erro de energia de cada integrador no Sistema Solar, em 100 anos
+    from time import time
+    import nbody
+    from nbody import Nbody, sistema_solar
+    from diagnosticos import energia
+
+    # raio de colisao do modo Sistema Solar
+    nbody.EPS = 0.2
+
+    print("  integrador | dt (x 1/120) | erro rel. energia |  forcas |  tempo (s)")
+    print("-" * 72)
+    for nome in ("euler", "leapfrog", "yoshida4", "rk4", "wh"):
+        for k in (1, 5, 10, 20):
+            corpos = Nbody(sistema_solar(), headless=True, integrador=nome)
+            corpos.dt = k / 120
+            e0 = energia(corpos)
+            t0 = time()
+            corpos.integracao(100)
+            print("  %10s | %12d | %17.3e | %7d | %10.3f" % (
+                  nome, k, abs(energia(corpos) / e0 - 1),
+                  corpos.forcas, time() - t0))
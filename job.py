@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import argparse
+import json
+import os
+import random
+import signal
+from time import time
+
+import nbody
+import checkpoint
+from nbody import Nbody, sistema_solar, gera_aleatorias
+from diagnosticos import energia
+from integradores import INTEGRADORES
+from forcas import FORCAS
+from condicoes import MODELOS, gera
+
+# alem dos modos proprios, os modelos de condicoes.py (plummer, king, ...)
+MODOS = ("solar", "aleatorio", "arquivo") + tuple(sorted(MODELOS))
+
+# parametros do job; eps None usa o padrao do modo (0.2 no Sistema Solar,
+# escala / 1000 nos modelos); opcoes_modelo vao para condicoes.gera e, com
+# ks, opcoes_ks para Nbody.regulariza
+PADRAO = {"modo": "aleatorio", "n": 20, "T": 2500., "G": 1., "dt": 1 / 120,
+          "eps": None, "semente": 1, "forca": "direto", "opcoes_forca": {},
+          "integrador": "euler", "arquivo": None, "opcoes_modelo": {},
+          "ks": False, "opcoes_ks": {},
+          "saida": "job", "checkpoint_passos": 1000,
+          "checkpoint_segundos": 300.}
+
+# parametros que nao mudam o resultado; podem ser alterados ao retomar
+LIVRES = ("saida", "checkpoint_passos", "checkpoint_segundos")
+
+def le_job(nome=None, **args):
+    '''(str, ...) -> dict
+    Junta PADRAO, o arquivo JSON do job e os argumentos (que tem prioridade)
+    '''
+    job = dict(PADRAO)
+    if nome:
+        arq = open(nome)
+        job.update(json.load(arq))
+        arq.close()
+    job.update((k, v) for k, v in args.items() if v is not None)
+    for k in job:
+        if k not in PADRAO:
+            raise ValueError("Parametro desconhecido no job: %s" % k)
+    if job["modo"] not in MODOS:
+        raise ValueError("Modo desconhecido: %s" % job["modo"])
+    if job["modo"] == "arquivo" and not job["arquivo"]:
+        raise ValueError("O modo arquivo precisa do parametro arquivo")
+    if job["eps"] is None:
+        if job["modo"] == "solar":
+            job["eps"] = 0.2
+        elif job["modo"] in MODELOS:
+            job["eps"] = job["opcoes_modelo"].get("escala", 1.) / 1000
+        else:
+            job["eps"] = nbody.R / 40
+    return job
+
+def total_passos(T, dt):
+    '''(float, float) -> int
+    Passos que Nbody.integracao(T) daria, com a mesma soma de dt
+    '''
+    t, k = 0, 0
+    while t < T:
+        t += dt
+        k += 1
+    return k
+
+def inicia(job):
+    '''(dict) -> Nbody
+    Monta o sistema inicial do job
+    '''
+    corpos = Nbody(forca=job["forca"], headless=True,
+                   integrador=job["integrador"], **job["opcoes_forca"])
+    corpos.G = job["G"]
+    if job["modo"] == "solar":
+        corpos.set_bodies(sistema_solar(corpos.G))
+    elif job["modo"] == "aleatorio":
+        random.seed(job["semente"])
+        corpos.set_bodies(gera_aleatorias(job["n"]))
+    elif job["modo"] in MODELOS:
+        corpos.estado = gera(job["modo"], job["n"], G=corpos.G,
+                             semente=job["semente"], **job["opcoes_modelo"])
+    elif job["arquivo"].endswith(".ckpt"):
+        corpos.estado = checkpoint.carrega(job["arquivo"])[0]
+    else:
+        corpos.set_bodies(corpos.carrega(job["arquivo"]))
+    corpos._dt = corpos.dt = job["dt"]
+    if job["ks"]:
+        corpos.regulariza(**job["opcoes_ks"])
+    return corpos
+
+class Salvador(object):
+    """Gancho que grava o checkpoint do job a cada k passos, a cada s
+    segundos ou ao receber SIGTERM / SIGINT (e entao encerra)"""
+
+    def __init__(self, corpos, nome, passos, segundos, **meta):
+        self.nome = nome
+        self.passos = passos
+        self.segundos = segundos
+        self.meta = meta
+        self.ultimo = time()
+        self.sinal = None
+        for s in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(s, self.recebe)
+        corpos.a_cada(1, self)
+
+    def recebe(self, sinal, quadro):
+        # so marca: o estado so e consistente no fim de um passo
+        self.sinal = sinal
+
+    def __call__(self, corpos):
+        if (self.sinal is None and corpos.passos % self.passos != 0
+                and time() - self.ultimo < self.segundos):
+            return
+        self.salva(corpos)
+        if self.sinal is not None:
+            print("Sinal %d: checkpoint no passo %d, encerrando" % (
+                  self.sinal, corpos.passos))
+            raise SystemExit(128 + self.sinal)
+
+    def salva(self, corpos):
+        corpos.salva_checkpoint(self.nome, **self.meta)
+        self.ultimo = time()
+
+def roda(job):
+    '''(dict) -> dict
+    Roda o job sem visualizacao, retomando do ultimo checkpoint em
+    job["saida"] se houver; grava o estado final e um resumo
+    '''
+    saida = job["saida"]
+    if not os.path.isdir(saida):
+        os.makedirs(saida)
+    nome_job = os.path.join(saida, "job.json")
+    nome_ckpt = os.path.join(saida, "estado.ckpt")
+    fixos = dict((k, v) for k, v in job.items() if k not in LIVRES)
+
+    if os.path.exists(nome_job):
+        arq = open(nome_job)
+        antigo = json.load(arq)
+        arq.close()
+        difere = [k for k in fixos if antigo.get(k) != fixos[k]]
+        if difere:
+            raise ValueError("%s e de outro job (difere em %s)" % (
+                             nome_job, ", ".join(sorted(difere))))
+    arq = open(nome_job + ".tmp", "w")
+    json.dump(job, arq, indent=1)
+    arq.close()
+    getattr(os, "replace", os.rename)(nome_job + ".tmp", nome_job)
+
+    nbody.EPS = job["eps"]
+    total = total_passos(job["T"], job["dt"])
+    if os.path.exists(nome_ckpt):
+        corpos = Nbody(forca=job["forca"], headless=True,
+                       integrador=job["integrador"], **job["opcoes_forca"])
+        E0 = corpos.carrega_checkpoint(nome_ckpt)["E0"]
+        print("Retomando do passo %d de %d (t = %.3f)" % (corpos.passos, total, corpos.t))
+    else:
+        corpos = inicia(job)
+        E0 = energia(corpos)
+
+    salvador = Salvador(corpos, nome_ckpt, job["checkpoint_passos"],
+                        job["checkpoint_segundos"], E0=E0)
+    if corpos.passos == 0:
+        salvador.salva(corpos)
+
+    t0 = time()
+    passos = corpos.passos
+    corpos.integracao(float("inf"), ate=total)
+    parede = time() - t0
+    salvador.salva(corpos)
+    corpos.forca.fechar()
+
+    corpos.salva_checkpoint(os.path.join(saida, "final.ckpt"), E0=E0)
+    arq = open(os.path.join(saida, "final.txt"), "w")
+    arq.write(str(corpos))
+    arq.close()
+    resumo = {"passos": corpos.passos, "t": corpos.t, "n": corpos.n,
+              "forcas": corpos.forcas, "tempo_parede": parede,
+              "passos_s": (corpos.passos - passos) / max(parede, 1e-12),
+              "deriva_energia": abs(energia(corpos) / E0 - 1),
+              "binarias": len(corpos.ks) if corpos.ks is not None else 0}
+    arq = open(os.path.join(saida, "resumo.json"), "w")
+    json.dump(resumo, arq, indent=1)
+    arq.close()
+    return resumo
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulacao sem visualizacao a "
+                                 "partir de um job, com checkpoints e retomada")
+    ap.add_argument("job", nargs="?", default=None,
+                    help="JSON com os parametros (%s)" % ", ".join(sorted(PADRAO)))
+    ap.add_argument("--modo", choices=MODOS)
+    ap.add_argument("--n", type=int)
+    ap.add_argument("--T", type=float)
+    ap.add_argument("--G", type=float)
+    ap.add_argument("--dt", type=float)
+    ap.add_argument("--eps", type=float)
+    ap.add_argument("--semente", type=int)
+    ap.add_argument("--forca", choices=FORCAS)
+    ap.add_argument("--integrador", choices=sorted(INTEGRADORES))
+    ap.add_argument("--ks", action="store_true", default=None,
+                    help="regularizacao KS das binarias proximas")
+    ap.add_argument("--arquivo")
+    ap.add_argument("--saida")
+    ap.add_argument("--checkpoint-passos", dest="checkpoint_passos", type=int)
+    ap.add_argument("--checkpoint-segundos", dest="checkpoint_segundos", type=float)
+    args = vars(ap.parse_args())
+    job = le_job(args.pop("job"), **args)
+
+    resumo = roda(job)
+    print("Fim: %d passos, t = %.3f, N = %d, deriva de energia %.3e" % (
+          resumo["passos"], resumo["t"], resumo["n"], resumo["deriva_energia"]))
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
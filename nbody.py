@@ -4,12 +4,22 @@ from random import triangular as next_rand
 from datetime import datetime as time
 from six.moves import input
 from numpy import sqrt
-from visual import *
 from sys import argv
 from math import pi
 
 from vetor import Vetor
 from particula import Particula
+from estado import Estado
+from forcas import cria_forca, acel_fontes
+from integradores import INTEGRADORES, cria_integrador
+from colisoes import contatos, grupos, proximos
+from binarias import Binarias
+import checkpoint
+from trajetoria import Gravador
+from perfil import Perfil
+from diagnosticos import Diagnosticos
+from condicoes import MODELOS, gera
+from animacao import Renderizador, NivelDetalhe, LIMITE_LOD
 
 ###############################################################################
 
@@ -22,20 +32,57 @@ RHO = (5/8) * M / 0.004652 # [Massa Solar / UA]
 # raio de relaxamento
 EPS = R/40 # [UA]
 
+# modulo VPython, importado apenas quando ha renderizacao
+visual = None
+
 ###############################################################################
 
-class Nbody:
+def carrega_visual():
+    '''() -> module
+    Importa o VPython sob demanda e o retorna
+    '''
+    global visual
+    if visual is None:
+        import visual as vpython
+        visual = vpython
+    return visual
+
+###############################################################################
+
+class Nbody(object):
     """Classe Nbody"""
 
-    def __init__(self, pts=[]):
-        '''(Nbody, list of Particula) -> None
-        Recebe uma lista de particulas
+    def __init__(self, pts=[], forca="direto", headless=False,
+                 integrador="euler", **opcoes):
+        '''(Nbody, list of Particula, str, bool, str, ...) -> None
+        Recebe uma lista de particulas e o backend de forca
+        ("direto", "direto32", "numba", "bh", "pm", "paralelo" ou
+        "distribuido"),
+        ou um objeto backend ja criado;
+        as opcoes extras sao repassadas ao backend (ex.: theta=0.5)
+        Em modo headless nada e desenhado e o VPython nao e importado
+        O integrador pode ser "euler", "leapfrog", "yoshida4", "rk4",
+        "blocos" (passos individuais) ou "wh" (Wisdom-Holman, para
+        sistemas dominados por uma massa central)
         '''
-        self.n = len(pts)
-        self.bodies = pts
+        self.headless = headless
+        if not headless:
+            carrega_visual()
+        self._estado = Estado(pts)
+        # particulas de teste: sentem a gravidade dos corpos, sem exerce-la
+        self.testes = Estado()
+        self.nuvem = None
+        # acima de limite_lod corpos o desenho e um animacao.NivelDetalhe
+        # (nuvem de pontos e esferas so para os de maior massa)
+        self.limite_lod = LIMITE_LOD
+        self.lod = None
+        if isinstance(forca, str):
+            forca = cria_forca(forca, **opcoes)
+        self.forca = forca
+        if isinstance(integrador, str):
+            integrador = cria_integrador(integrador)
+        self.integrador = integrador
         self.pontos = {}
-        if self.n > 0:
-            self.make_stars()
 
         # atributos de estado
         self.center = 0
@@ -51,6 +98,30 @@ class Nbody:
         self._dt = 1/120
         self.dt = self._dt
 
+        # tempo decorrido (anos), passos dados e calculos de forca
+        # (em avaliacoes equivalentes de todos os corpos)
+        self.t = 0
+        self.passos = 0
+        self.forcas = 0
+
+        # funcoes chamadas a cada k passos: lista de (k, funcao)
+        self.ganchos = []
+
+        # temporizadores por fase (perfil.Perfil), None quando desligado
+        self.perfil = None
+
+        # animacao.Renderizador desenhando em outra thread, ou None
+        self.renderizador = None
+
+        # ganchos podem interromper a integracao com parar = True
+        self.parar = False
+
+        # binarias regularizadas (binarias.Binarias), None quando desligado
+        self.ks = None
+
+        if self.n > 0:
+            self.make_stars()
+
 
     def __str__(self):
         '''(NBody) -> str'''
@@ -58,28 +129,140 @@ class Nbody:
         txt += '   Velocidade (x, y, z)   |   Massa \n'
         txt += '-' * 74
         txt += '\n'
-        for body in self.bodies:
+        for body in self.completo().bodies:
             txt += str(body)+"\n"
         return txt
 
+    @property
+    def bodies(self):
+        return self.estado.bodies
+
+    def completo(self):
+        '''(Nbody) -> Estado
+        O estado com cada binaria regularizada nos seus dois componentes
+        (uma copia), para as saidas; sem binarias, o proprio estado
+        '''
+        if self.ks is None or not len(self.ks):
+            return self.estado
+        return self.ks.expande(self)
+
+    @property
+    def estado(self):
+        return self._estado
+
+    @estado.setter
+    def estado(self, e):
+        '''(Nbody, Estado) -> None
+        Troca o estado; o que o integrador guardou e do estado anterior
+        '''
+        self._estado = e
+        self.integrador.troca_estado()
+
+    @property
+    def n(self):
+        return len(self.estado)
+
     def set_bodies(self, pts):
-        self.n = len(pts)
-        self.bodies = pts
+        self.estado = Estado(pts)
+        if self.ks is not None:
+            self.ks.restaura_estado({})
         self.make_stars()
 
+    def set_testes(self, pts):
+        '''(Nbody, list of Particula) -> None
+        Define as particulas de teste (a massa delas so e usada para o
+        momento, nao como fonte de gravidade)
+        '''
+        self.testes = Estado(pts)
+        self.integrador.reinicia()
+        self.make_testes()
+
+    def aceleracoes(self, r=None, alvos=None):
+        '''(Nbody, array, array) -> array
+        Retorna as aceleracoes dos corpos nas posicoes r (padrao: atuais);
+        com alvos, apenas as desses corpos
+        '''
+        if self.perfil:
+            t0 = self.perfil.relogio()
+        e = self.estado
+        r = e.r if r is None else r
+        n = len(e) if alvos is None else len(alvos)
+        self.forcas += n / len(e)
+        if alvos is None:
+            a = self.forca.aceleracoes(r, e.m, self.G)
+        elif hasattr(self.forca, "aceleracoes_alvos"):
+            a = self.forca.aceleracoes_alvos(r, e.m, self.G, alvos)
+        else:
+            a = self.forca.aceleracoes(r, e.m, self.G)[alvos]
+        if self.perfil:
+            self.perfil.termina("forca", t0)
+            self.perfil.conta("forcas")
+            self.perfil.conta("pares", getattr(self.forca, "interacoes",
+                                               n * (len(e) - 1)))
+        return a
+
+    def aceleracoes_testes(self, rt=None):
+        '''(Nbody, array) -> array
+        Aceleracoes das particulas de teste nas posicoes rt (padrao: atuais)
+        devidas apenas aos corpos com massa, O(N * N_testes)
+        '''
+        if self.perfil:
+            t0 = self.perfil.relogio()
+        e = self.estado
+        rt = self.testes.r if rt is None else rt
+        a = acel_fontes(rt, e.r, e.m, self.G)
+        if self.perfil:
+            self.perfil.termina("forca", t0)
+            self.perfil.conta("pares", len(rt) * len(e))
+        return a
+
+    def a_cada(self, k, funcao):
+        '''(Nbody, int, function) -> None
+        Registra funcao(self) para ser chamada a cada k passos da integracao
+        '''
+        self.ganchos.append((k, funcao))
+
     def make_stars(self):
-        for body in self.bodies:
-            v = vector(body.r.x, body.r.y, body.r.z)
+        if self.headless:
+            return
+        if self.lod is not None:
+            self.lod.esconde()
+            self.lod = None
+        if self.n > self.limite_lod:
+            e = self.estado
+            self.lod = NivelDetalhe(visual, RHO, trail=self.trail)
+            self.lod.atualiza(e.r, e.m, e.ids)
+            self.make_testes()
+            return
+        # segundos componentes das binarias: esferas escondidas ate voltarem
+        segundos = self.ks.segundos.bodies if self.ks is not None else []
+        for body in self.bodies + segundos:
+            v = visual.vector(body.r.x, body.r.y, body.r.z)
             r = 15 * (body.m * 3. / RHO / 4. / (pi**2))**(1/3)
 
             if body.cor is None:
                 body.cor = (next_rand(0, 1), next_rand(0, 1), next_rand(0, 1))
             if body.material is None:
-                body.material = materials.marble
+                body.material = visual.materials.marble
             
-            s = sphere(pos=v, radius=r, make_trail=self.trail, 
+            s = visual.sphere(pos=v, radius=r, make_trail=self.trail, 
                 retain=100, color=body.cor, material=body.material)
+            s.visible = body not in segundos
             self.pontos[body.label] = s
+        self.make_testes()
+
+    def make_testes(self):
+        '''(Nbody) -> None
+        Desenha as particulas de teste como uma nuvem de pontos
+        '''
+        if self.headless:
+            return
+        if self.nuvem is not None:
+            self.nuvem.visible = False
+            self.nuvem = None
+        if len(self.testes):
+            self.nuvem = visual.points(pos=self.testes.r.tolist(), size=2,
+                                       color=visual.color.white)
 
     def key_input(self, ev):
         '''(Nbody, event) -> None
@@ -109,15 +292,15 @@ class Nbody:
             print(self)
         
         elif ev.key == "Z":
-            scene.range -= vector(EPS*5)
+            visual.scene.range -= visual.vector(EPS*5)
         
         elif ev.key == "z":
-            scene.range += vector(EPS*5)
+            visual.scene.range += visual.vector(EPS*5)
         
         elif ev.key == "p":
             self.pause = True
             while self.pause:
-                scene.waitfor("keydown")
+                visual.scene.waitfor("keydown")
         
         elif ev.key == "r":
             self.pause = False
@@ -140,18 +323,35 @@ class Nbody:
             self.dt += self._dt
             print("dt: ", self.dt)
 
+        elif ev.key == "P":
+            self.set_perfil()
+
+
+    def set_perfil(self, a_cada=200):
+        '''(Nbody, int) -> None
+        Liga ou desliga o perfil por fase da integracao;
+        ao desligar imprime o resumo de todo o periodo medido
+        '''
+        if self.perfil:
+            print(self.perfil.resumo())
+            self.perfil = None
+        else:
+            self.perfil = Perfil(a_cada)
+        print("Perfil: ", self.perfil is not None)
 
     def mouse(self, ev):
         '''(Nbody, event) -> None
         Trigger para clicks do mouse
         '''
-        scene.center = ev.pos
+        visual.scene.center = ev.pos
 
     def set_trail(self):
         '''(Nbody) -> None
         Ativa ou desativa traco das orbitas
         '''
         self.trail = not self.trail
+        if self.lod is not None:
+            self.lod.set_trail(self.trail)
         for p in self.pontos:
             self.pontos[p].make_trail = self.trail
 
@@ -159,129 +359,210 @@ class Nbody:
         '''(Nbody) -> 3-tuple
         Retorna a posicao do centro de massa
         '''
-        s, m = Vetor(), 0
-        for body in self.bodies:
-            s += body.r.multiply(body.m)
-            m += body.m
-        c = s.multiply(1/m)
-        return c.to_list()
+        e = self.estado
+        c = e.m.dot(e.r) / e.m.sum()
+        return c.tolist()
 
     def star_center(self):
         '''(Nbody) -> 3-tuple
         Retorna a posicao do corpo de maior massa
         '''
-        s, m = Vetor(), 0
-        for body in self.bodies:
-            if body.m > m:
-                m = body.m
-                s = body.r
-        return s.to_list()
+        e = self.estado
+        return e.r[e.m.argmax()].tolist()
 
     def atualiza_anim(self, t):
         '''(Nbody, float) -> None
         Atualiza visualizacao do sistema
         '''
+        if self.headless or self.renderizador is not None:
+            return
+
         # taxa por segundo de atualizacoes
-        rate(120)
+        if self.perfil:
+            t0 = self.perfil.relogio()
+            visual.rate(120)
+            self.perfil.termina("espera", t0)
+            t0 = self.perfil.relogio()
+        else:
+            visual.rate(120)
 
         if self.verbose:
             print("::%d Corpos - (%.2f anos)::"%(self.n, t))
             self.verbose = False
 
         # atualiza posicao das bolinhas
-        for i in range(self.n):
-            body = self.bodies[i]
-            v = vector(body.r.x, body.r.y, body.r.z)
-            self.pontos[body.label].pos = v
+        e = self.estado
+        if self.lod is not None:
+            self.lod.atualiza(e.r, e.m, e.ids)
+        else:
+            r = e.r
+            for i, body in enumerate(self.bodies):
+                self.pontos[body.label].pos = visual.vector(r[i, 0], r[i, 1], r[i, 2])
+        if self.nuvem is not None:
+            self.nuvem.pos = self.testes.r
 
         # centraliza a visualizacao
         if self.center == 1:
-            scene.center = self.mass_center() # centro de massa
+            visual.scene.center = self.mass_center() # centro de massa
         elif self.center == 2:
-            scene.center = self.star_center() # corpo de maior massa
+            visual.scene.center = self.star_center() # corpo de maior massa
+
+        if self.perfil:
+            self.perfil.termina("render", t0)
+            self.perfil.conta("quadros")
 
     def colisoes(self):
         '''(Nbody) -> None
-        Verifica se houve colisao, agregando as particulas
+        Verifica as colisoes, agregando cada grupo de particulas em contato
+        '''
+        e = self.estado
+        # com o backend numba, a busca de contatos tambem e a compilada
+        i, j = contatos(e.r, EPS, jit=getattr(self.forca, "nome", None) == "numba")
+        if len(i) == 0:
+            return
+
+        removidas = []
+        for g in grupos(i, j):
+            # calcula novos raio e massa
+            m = e.m[g].sum()
+            r = 15 * (m * 3. / RHO / 4. / (pi**2))**(1/3)
+
+            # colisao inelastica
+            p = e.p[g].sum(axis=0)
+
+            # obtem qual do grupo tem o maior momento
+            p2 = (e.p[g] * e.p[g]).sum(axis=1)
+            a = g[p2.argmax()]
+
+            # atualiza a de maior momento
+            e.m[a] = m
+            e.p[a] = p
+            e.v[a] = p / m
+            outras = [b for b in g if b != a]
+            # com o renderizador ou o NivelDetalhe as esferas sao
+            # atualizadas por eles
+            if not self.headless and self.renderizador is None and self.lod is None:
+                self.pontos[self.bodies[a].label].radius = r
+
+                # exclui as outras
+                for b in outras:
+                    self.pontos[self.bodies[b].label].visible = False
+                    del self.pontos[self.bodies[b].label]
+            removidas += outras
+
+        # compacta os arrays uma unica vez
+        e.remove(removidas)
+        self.integrador.reinicia()
+
+    def regulariza(self, raio=None, **opcoes):
+        '''(Nbody, float, ...) -> None
+        Liga a regularizacao KS de binarias (binarias.Binarias): pares
+        ligados a menos de raio (padrao 4 EPS) passam a ser um corpo no
+        centro de massa e o movimento relativo e integrado a parte; opcoes
+        vao para Binarias (gama, gama_min, passos)
         '''
-        i, has = 0, False
-        while i < len(self.bodies) and not has:
-            j = 1
-            while j < len(self.bodies) and not has:
-                if self.bodies[i] != self.bodies[j]:
-                    dist = self.bodies[i].r.distancia(self.bodies[j].r)
-                    if dist < EPS:
-                        # calcula novos raio e massa
-                        m = self.bodies[i].m + self.bodies[j].m
-                        r = 15 * (m * 3. / RHO / 4. / (pi**2))**(1/3)
-
-                        # colisao inelastica
-                        p = self.bodies[i].p + self.bodies[j].p
-                        v = p.multiply(1/m)
-
-                        # obtem qual das 2 tem o maior momento
-                        a, b = i, j
-                        if self.bodies[j] > self.bodies[i]:
-                            a, b = j, i
-
-                        # atualiza a de maior momento
-                        self.bodies[a].m = m
-                        self.bodies[a].v = v
-                        self.bodies[a].p = p
-                        self.pontos[self.bodies[a].label].radius = r
-
-                        # exclui a outra
-                        self.pontos[self.bodies[b].label].visible = False
-                        del self.pontos[self.bodies[b].label]
-                        self.bodies.pop(b)
-                        has = True
-                j += 1
-            i += 1
-        self.n = len(self.bodies)
-
-    def integracao(self, tempo):
+        self.ks = Binarias(4 * EPS if raio is None else raio, **opcoes)
+
+    def binarias(self, dt=None):
         '''(Nbody, float) -> None
-        Realiza integracao numerica da forca gravitacional em Nbody
+        Avanca as binarias regularizadas por dt (padrao: o passo atual) e
+        forma ou desfaz binarias, mostrando ou escondendo os segundos
+        componentes
+        '''
+        saem, voltam = self.ks.passo(self, self.dt if dt is None else dt, EPS)
+        # com o renderizador ou o NivelDetalhe as esferas sao
+        # atualizadas por eles
+        if not self.headless and self.renderizador is None and self.lod is None:
+            for lbl in saem:
+                self.pontos[lbl].visible = False
+            for lbl in voltam:
+                self.pontos[lbl].visible = True
+
+    def colisoes_testes(self):
+        '''(Nbody) -> int
+        Remove as particulas de teste a menos de EPS de algum corpo,
+        retornando quantas foram removidas
+        '''
+        if len(self.testes) == 0:
+            return 0
+        perto = proximos(self.testes.r, self.estado.r, EPS)
+        k = int(perto.sum())
+        if k:
+            self.testes.remove(perto.nonzero()[0])
+        return k
+
+    def integracao(self, tempo, ate=None):
+        '''(Nbody, float, int) -> None
+        Realiza integracao numerica da forca gravitacional em Nbody;
+        com ate, para tambem quando o total de passos chega a ate
         '''
         t = 0
-        while t < tempo and self.n > 1:
-            for i in range(self.n):
-                body = self.bodies[i]
-
-                # somatoria de forcas devido as demais particulas
-                f_res = Vetor()
-                for j in range(self.n):
-                    if i != j:
-                        f_res += body.gravity(self.bodies[j], self.G)
-                
-                # calculando impulso nesse corpo
-                dp = f_res.multiply(self.dt)
-                
-                # calculando velocidade atual
-                body.p = body.p + dp
-                body.v = body.p.multiply(1/body.m)
-                
-                # calculando posicao atual (na pos auxiliar)
-                body.r_ = body.r + body.v.multiply(self.dt)
-
-            # atualiza posicoes das particulas
-            for body in self.bodies:
-                body.r = body.r_
+        self.parar = False
+        # os pares que ja estao ligados sao regularizados antes do 1o passo
+        if self.ks is not None:
+            self.binarias(0)
+        while (t < tempo and not self.parar
+               and (self.n + (len(self.ks) if self.ks is not None else 0) > 1
+                    or len(self.testes))
+               and (ate is None or self.passos < ate)):
+            # avanca posicoes e velocidades
+            if len(self.testes):
+                self.integrador.passo_testes(self, self.dt)
+            else:
+                self.integrador.passo(self, self.dt)
 
             # trata as colisoes
-            self.colisoes()
+            if self.perfil:
+                t0 = self.perfil.relogio()
+                n = self.n
+                self.colisoes()
+                self.perfil.conta("absorvidas", self.colisoes_testes())
+                self.perfil.termina("colisoes", t0)
+                self.perfil.conta("fusoes", n - self.n)
+            else:
+                self.colisoes()
+                self.colisoes_testes()
+
+            # binarias regularizadas no seu proprio relogio
+            if self.ks is not None:
+                if self.perfil:
+                    t0 = self.perfil.relogio()
+                    self.binarias()
+                    self.perfil.termina("binarias", t0)
+                    self.perfil.conta("binarias", len(self.ks))
+                else:
+                    self.binarias()
 
             t += self.dt
+            self.t += self.dt
+            self.passos += 1
+            if self.perfil:
+                t0 = self.perfil.relogio()
+            for k, funcao in self.ganchos:
+                if self.passos % k == 0:
+                    funcao(self)
+            if self.perfil:
+                self.perfil.termina("ganchos", t0)
+
             # atualiza animacao
             self.atualiza_anim(t)
 
+            if self.perfil:
+                self.perfil.passo()
+
+    def nome_registro(self, ext):
+        '''(Nbody, str) -> str
+        Retorna o nome de arquivo em regs/ com a data e hora atuais
+        '''
+        t = time.now()
+        t = "%02d%02d%d-%02d%02d"%(t.day, t.month, t.year, t.hour, t.minute)
+        return r"./regs/nbody-%02d#%s.%s"%(self.n, t, ext)
+
     def registra(self):
         '''(Nbody) -> None
         Registra estado final em arquivo de texto
         '''
-        t = time.now()
-        t = "%02d%02d%d-%02d%02d"%(t.day, t.month, t.year, t.hour, t.minute)
-        nome = r"./regs/nbody-%02d#%s.txt"%(self.n, t)
+        nome = self.nome_registro("txt")
         arq = open(nome, "w+")
         arq.write(self.__str__())
         arq.close()
@@ -305,43 +586,162 @@ class Nbody:
         arq.close()
         return pts
 
+    def salva_checkpoint(self, nome=None, **meta):
+        '''(Nbody, str, ...) -> str
+        Grava o estado atual e o do integrador em checkpoint binario,
+        retornando o nome; meta sao meta-dados adicionais
+        '''
+        if nome is None:
+            nome = self.nome_registro("ckpt")
+        extras = dict(("integrador." + k, a) for k, a in
+                      self.integrador.salva_estado(self).items())
+        if len(self.testes):
+            t = self.testes
+            extras.update({"testes.r": t.r, "testes.v": t.v, "testes.p": t.p,
+                           "testes.m": t.m, "testes.label": t.labels_utf8()})
+        if self.ks is not None:
+            meta["ks"] = self.ks.parametros()
+            extras.update(("ks." + k, a) for k, a in self.ks.salva_estado().items())
+        checkpoint.salva(nome, self.estado, extras, G=self.G, dt=self.dt,
+                         _dt=self._dt, t=self.t, passos=self.passos,
+                         forcas=self.forcas, integrador=self.integrador.nome,
+                         **meta)
+        return nome
+
+    def carrega_checkpoint(self, nome):
+        '''(Nbody, str) -> dict
+        Recupera estado, G, dt, tempo decorrido e, se for o mesmo
+        integrador, o estado dele; retorna os meta-dados do checkpoint
+        '''
+        self.estado, meta = checkpoint.carrega(nome)
+        self.G = meta["G"]
+        self.dt = meta["dt"]
+        self._dt = meta["_dt"]
+        self.t = meta["t"]
+        self.passos = meta["passos"]
+        self.forcas = meta.get("forcas", 0)
+        x = meta["extras"]
+        if "testes.r" in x:
+            self.testes = Estado.de_arrays(x["testes.r"], x["testes.v"], x["testes.m"],
+                                           x["testes.label"], p=x["testes.p"])
+        else:
+            self.testes = Estado()
+        if "ks" in meta:
+            if self.ks is None:
+                self.regulariza(**meta["ks"])
+            self.ks.restaura_estado(dict((k[len("ks."):], a) for k, a in x.items()
+                                         if k.startswith("ks.")))
+        elif self.ks is not None:
+            self.ks.restaura_estado({})
+        if meta.get("integrador") == self.integrador.nome:
+            self.integrador.restaura_estado(self, dict(
+                (k[len("integrador."):], a) for k, a in meta["extras"].items()
+                if k.startswith("integrador.")))
+        else:
+            self.integrador.reinicia()
+        self.make_stars()
+        return meta
+
+###############################################################################
+
+def sistema_solar(G=1, cor={}, emissivo=None):
+    '''(float, dict, material) -> list of Particula
+    Sol, Jupiter, Saturno, Terra e Marte em orbitas circulares;
+    cor mapeia "yellow", "cyan", "orange", "blue" e "red" nas cores
+    '''
+    pts = []
+    # Velocidade circular v0 = sqrt(GM/R)
+    pts.append(Particula("Sol", (0, 0, 0), (0, 0, 0), 1, cor.get("yellow"), emissivo))
+    pts.append(Particula("Jupiter", (5.5, 0, 0), (0, 0, sqrt(G/5.5)), 1E-3, cor.get("cyan")))
+    pts.append(Particula("Saturno", (10, 0, 0), (0, 0, sqrt(G/10)), 3E-4, cor.get("orange")))
+    pts.append(Particula("Terra", (1, 0, 0), (0, 0, sqrt(G)), 3.003E-6, cor.get("blue")))
+    pts.append(Particula("Marte", (1.4, 0, 0), (0, 0, sqrt(G/1.4)), 3.2e-7, cor.get("red")))
+    return pts
+
+def gera_aleatorias(N):
+    '''(int) -> list of Particula
+    Gera N particulas aleatorias no cubo [-R, R]^3
+    '''
+    pts = []
+    for i in range(N):
+        lbl = "p_%d"%(i+1)
+        x = next_rand(-R, R)
+        y = next_rand(-R, R)
+        z = next_rand(-R, R)
+        vx = next_rand(-V, V)
+        vy = next_rand(-V, V)
+        vz = next_rand(-V, V)
+        m = next_rand(0.7, M)
+        p = Particula(lbl, (x, y, z), (vx, vy, vz), m)
+        pts.append(p)
+    return pts
+
 ###############################################################################
 
 def main():
     print("\n# feanored-NBody #\n")
 
-    # configuracoes da tela
-    scene.title = "# feanored-NBody #"
-    scene.background = (0.2, 0.2, 0.2)
-    scene.autoscale = 1
-    scene.lights = []
-    distant_light(direction=(0,R,0), color=color.white)
-    distant_light(direction=(0,-R,0), color=color.white)
-    distant_light(direction=(R,0,0), color=color.white)
-    distant_light(direction=(-R,0,0), color=color.white)
-    distant_light(direction=(0,0,R), color=color.white)
-    distant_light(direction=(0,0,-R), color=color.white)
-    scene.width = 1366
-    scene.height = 768
-    scene.range = R*2
+    # parametros
+    flags = argv[1] if len(argv) > 1 else ""
+    if flags:
+        print(flags)
+
+    # h: sem visualizacao, integra o mais rapido possivel
+    headless = "h" in flags
+
+    # g: grava a trajetoria para ser reproduzida com trajetoria.py
+    grava = "g" in flags
+
+    # d: serie de energia, momentos e razao virial a cada 100 passos
+    diagnostica = "d" in flags
+
+    # s: renderiza a cada passo, na mesma thread da fisica (modo antigo);
+    # sem s a fisica roda em outra thread e a tela desenha o ultimo quadro
+    sincrono = "s" in flags
+
+    # l: sem limite de passos por segundo com o renderizador em thread
+    livre = "l" in flags
+
+    # k: regularizacao KS das binarias proximas
+    regulariza = "k" in flags
+
+    if not headless:
+        carrega_visual()
+        scene = visual.scene
+        color = visual.color
+
+        # configuracoes da tela
+        scene.title = "# feanored-NBody #"
+        scene.background = (0.2, 0.2, 0.2)
+        scene.autoscale = 1
+        scene.lights = []
+        visual.distant_light(direction=(0,R,0), color=color.white)
+        visual.distant_light(direction=(0,-R,0), color=color.white)
+        visual.distant_light(direction=(R,0,0), color=color.white)
+        visual.distant_light(direction=(-R,0,0), color=color.white)
+        visual.distant_light(direction=(0,0,R), color=color.white)
+        visual.distant_light(direction=(0,0,-R), color=color.white)
+        scene.width = 1366
+        scene.height = 768
+        scene.range = R*2
 
     # inicia objeto Nbody
-    corpos = Nbody()
-    
-    # parametros
-    if len(argv) > 1:
-        print(argv[1])
-        if "t" in argv[1]:
-            corpos.trail = True
-        if "c" in argv[1]:
-            corpos.center = True
+    corpos = Nbody(headless=headless)
+
+    if "t" in flags:
+        corpos.trail = True
+    if "c" in flags:
+        corpos.center = True
+    # p: perfil por fase da integracao (tambem com a tecla P)
+    if "p" in flags:
+        corpos.set_perfil()
 
     op = ""
     while op == "" or not op in "lsgx":
         txt  = "O que deseja?\n"
         txt += " [S]imular o Sistema Solar\n"
         txt += " [L]er estado inicial de arquivo\n"
-        txt += " [G]erar particulas aleatorias\n"
+        txt += " [G]erar particulas (cubo aleatorio ou modelos)\n"
         txt += " [X] Sair do programa\n"
         print(txt)
         op = input("Digite opcao: ")
@@ -350,33 +750,43 @@ def main():
     if op == "x":
         return
 
+    # no Sistema Solar, dominado pelo Sol, o padrao e o Wisdom-Holman
+    padrao = "wh" if op == "s" else "euler"
+    nome = None
+    while nome not in INTEGRADORES:
+        nome = input("Integrador (%s) [%s]: " % (", ".join(sorted(INTEGRADORES)),
+                                                 padrao)) or padrao
+    corpos.integrador = cria_integrador(nome)
+
     # Sistema Solar
-    elif op == "s":
+    if op == "s":
         global EPS
         EPS = 0.2
-        scene.range = 20
-        scene.forward = vector(0, -1, 0)
         corpos.center = True
         corpos.trail = True
-        pts = []
-        # Velocidade circular v0 = sqrt(GM/R)
-        pts.append(Particula("Sol", (0, 0, 0), (0, 0, 0), 1, color.yellow, materials.emissive))
-        pts.append(Particula("Jupiter", (5.5, 0, 0), (0, 0, sqrt(corpos.G/5.5)), 1E-3, color.cyan))
-        pts.append(Particula("Saturno", (10, 0, 0), (0, 0, sqrt(corpos.G/10)), 3E-4, color.orange))
-        pts.append(Particula("Terra", (1, 0, 0), (0, 0, sqrt(corpos.G)), 3.003E-6, color.blue))
-        pts.append(Particula("Marte", (1.4, 0, 0), (0, 0, sqrt(corpos.G/1.4)), 3.2e-7, color.red))
+        cor = dict.fromkeys(["yellow", "cyan", "orange", "blue", "red"])
+        emissivo = None
+        if not headless:
+            scene.range = 20
+            scene.forward = visual.vector(0, -1, 0)
+            cor = dict((c, getattr(color, c)) for c in cor)
+            emissivo = visual.materials.emissive
+        pts = sistema_solar(corpos.G, cor, emissivo)
     
-    # Ler particulas de arquivo
+    # Ler particulas de arquivo (texto ou checkpoint .ckpt)
     elif op == "l":
         nome = input("Digite nome do arquivo com estado inicial: [nbody-] ")
-        pts = corpos.carrega(nome)
-        if len(pts) < 1:
-            print("Arquivo invalido!")
-            return
+        if nome.endswith(".ckpt"):
+            corpos.carrega_checkpoint("regs/nbody-" + nome)
+            pts = None
+        else:
+            pts = corpos.carrega(nome)
+            if len(pts) < 1:
+                print("Arquivo invalido!")
+                return
 
     # pontos aleatorios
     elif op == "g":
-        pts = []
         N = 0
         while N < 2:
             N = input("Qtde de particulas [20]: ")
@@ -386,23 +796,15 @@ def main():
                 N = int(N)
             if N < 2:
                 print("Minimo de 2 particulas!")
-        for i in range(N):
-            ''' 
-            Gera N particulas aleatorias
-            '''
-            lbl = "p_%d"%(i+1)
-            x = next_rand(-R, R)
-            y = next_rand(-R, R)
-            z = next_rand(-R, R)
-            vx = next_rand(-V, V)
-            vy = next_rand(-V, V)
-            vz = next_rand(-V, V)
-            m = next_rand(0.7, M)
-            '''
-            Objeto Particula
-            '''
-            p = Particula(lbl, (x, y, z), (vx, vy, vz), m)
-            pts.append(p)
+        modelo = input("Modelo (cubo, %s) [cubo]: " % ", ".join(sorted(MODELOS)))
+        if modelo in MODELOS:
+            # mesma massa media do cubo, escala de comprimento R/4
+            corpos.estado = gera(modelo, N, M=N * (0.7 + M) / 2, escala=R / 4,
+                                 G=corpos.G)
+            corpos.make_stars()
+            pts = None
+        else:
+            pts = gera_aleatorias(N)
 
     # tempo para integracao em anos
     T = input("Insira o tempo de integracao (em anos) [2500]: ")
@@ -415,31 +817,63 @@ def main():
         return
 
     # insere as particulas
-    corpos.set_bodies(pts)
-
-    # aumenta tamanho dos planetas
-    if op == "s":
-        corpos.pontos["Terra"].retain = 77
-        corpos.pontos["Marte"].retain = 126
-        corpos.pontos["Jupiter"].retain = 970
-        corpos.pontos["Saturno"].retain = 2365
-        for p in corpos.pontos:
-            if p == "Sol": continue
-            corpos.pontos[p].radius *= 10
-
-    # centraliza visualizacao 
-    scene.center = corpos.mass_center()
-
-    # registra eventos
-    scene.bind('keydown', corpos.key_input)
-    scene.bind('click', corpos.mouse)
-
-    # pausa no início
-    corpos.pause = True
-    scene.waitfor("keydown")
+    if pts is not None:
+        corpos.set_bodies(pts)
+    if regulariza and corpos.ks is None:
+        corpos.regulariza()
+
+    if not headless:
+        # aumenta tamanho dos planetas
+        if op == "s":
+            corpos.pontos["Terra"].retain = 77
+            corpos.pontos["Marte"].retain = 126
+            corpos.pontos["Jupiter"].retain = 970
+            corpos.pontos["Saturno"].retain = 2365
+            for p in corpos.pontos:
+                if p == "Sol": continue
+                corpos.pontos[p].radius *= 10
+
+        # centraliza visualizacao 
+        scene.center = corpos.mass_center()
+
+        # registra eventos
+        scene.bind('keydown', corpos.key_input)
+        scene.bind('click', corpos.mouse)
+
+        # pausa no início
+        corpos.pause = True
+        scene.waitfor("keydown")
+
+    if grava:
+        gravador = Gravador(corpos, corpos.nome_registro("traj"))
+    if diagnostica:
+        diag = Diagnosticos(corpos, arquivo=corpos.nome_registro("diag"))
 
     # liga a forca da gravidade
-    corpos.integracao(T)
+    if headless or sincrono:
+        corpos.integracao(T)
+    else:
+        Renderizador(corpos, fps=60, ritmo=None if livre else 120).roda(T)
+
+    if grava:
+        gravador.fechar()
+    if diagnostica:
+        diag.fechar()
+        s = diag.serie()
+        print("Diagnosticos: deriva de energia max %.3e, razao virial final %.3f" % (
+              s["dE"].max(), s["Q"][-1]))
+
+    if corpos.perfil:
+        print(corpos.perfil.resumo())
+
+    # histograma dos niveis de passo (integrador "blocos")
+    if hasattr(corpos.integrador, "relatorio"):
+        print(corpos.integrador.relatorio())
+    if corpos.ks is not None:
+        print(corpos.ks.relatorio())
+
+    # libera os recursos do backend de forca
+    corpos.forca.fechar()
 
     # salva estado final em arquivo de texto
     corpos.registra()
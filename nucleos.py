@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import os
+from time import time
+
+from numpy import ascontiguousarray, empty, float64, int64, sqrt
+
+from forcas import Direta, PARES_BLOCO
+
+# os nucleos compilados sao opcionais: sem o Numba (ou com NUMBA = False)
+# quem os usa volta aos caminhos em NumPy
+try:
+    from numba import config, njit, prange
+    NUMBA = True
+except ImportError:
+    NUMBA = False
+
+# com as threads do TBB ja iniciadas, um fork (backend paralelo ou Pool no
+# mesmo processo, como no benchmark.py) trava a saida do processo; o TBB
+# fica por ultimo, salvo escolha explicita nas variaveis do Numba
+if (NUMBA and "NUMBA_THREADING_LAYER" not in os.environ
+        and "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ):
+    config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+
+# corpos por ladrilho da soma direta (dois ladrilhos cabem na cache L1)
+LADRILHO = 128
+
+if NUMBA:
+    @njit(cache=True)
+    def _ladrilho(r, m, a, i0, i1, j0, j1):
+        # interacoes entre os ladrilhos [i0, i1) e [j0, j1), usando a
+        # 3a lei; com i0 == j0, so os pares i < j do mesmo ladrilho
+        for i in range(i0, i1):
+            xi = r[i, 0]
+            yi = r[i, 1]
+            zi = r[i, 2]
+            mi = m[i]
+            ax = 0.
+            ay = 0.
+            az = 0.
+            for j in range(j0 if j0 != i0 else i + 1, j1):
+                dx = r[j, 0] - xi
+                dy = r[j, 1] - yi
+                dz = r[j, 2] - zi
+                d2 = dx * dx + dy * dy + dz * dz
+                w = 1. / (d2 * sqrt(d2))
+                wj = m[j] * w
+                ax += dx * wj
+                ay += dy * wj
+                az += dz * wj
+                wi = mi * w
+                a[j, 0] -= dx * wi
+                a[j, 1] -= dy * wi
+                a[j, 2] -= dz * wi
+            a[i, 0] += ax
+            a[i, 1] += ay
+            a[i, 2] += az
+
+    @njit(parallel=True, cache=True)
+    def _acel_direta(r, m, G, a, ladrilho):
+        n = len(m)
+        t = (n + ladrilho - 1) // ladrilho
+        for i in range(n):
+            a[i, 0] = 0.
+            a[i, 1] = 0.
+            a[i, 2] = 0.
+        # os ladrilhos consigo mesmos sao independentes entre si
+        for k in prange(t):
+            i0 = k * ladrilho
+            i1 = min(i0 + ladrilho, n)
+            _ladrilho(r, m, a, i0, i1, i0, i1)
+        # pares de ladrilhos distintos em rodadas de um torneio
+        # (metodo do circulo): numa rodada nenhum ladrilho aparece duas
+        # vezes, entao as escritas em paralelo nunca colidem
+        tt = t + (t % 2)
+        for rodada in range(tt - 1):
+            for k in prange(tt // 2):
+                # o ladrilho tt - 1 fica parado e os demais giram
+                if k == 0:
+                    p = tt - 1
+                    q = rodada
+                else:
+                    p = (rodada + k) % (tt - 1)
+                    q = (rodada - k + tt - 1) % (tt - 1)
+                if p >= t or q >= t:
+                    continue
+                if p > q:
+                    p, q = q, p
+                _ladrilho(r, m, a, p * ladrilho, min(p * ladrilho + ladrilho, n),
+                          q * ladrilho, min(q * ladrilho + ladrilho, n))
+        for i in range(n):
+            a[i, 0] *= G
+            a[i, 1] *= G
+            a[i, 2] *= G
+
+    @njit(parallel=True, cache=True)
+    def _acel_alvos(r, m, G, alvos, a):
+        n = len(m)
+        for k in prange(len(alvos)):
+            i = alvos[k]
+            xi = r[i, 0]
+            yi = r[i, 1]
+            zi = r[i, 2]
+            ax = 0.
+            ay = 0.
+            az = 0.
+            for j in range(n):
+                if j == i:
+                    continue
+                dx = r[j, 0] - xi
+                dy = r[j, 1] - yi
+                dz = r[j, 2] - zi
+                d2 = dx * dx + dy * dy + dz * dz
+                w = m[j] / (d2 * sqrt(d2))
+                ax += dx * w
+                ay += dy * w
+                az += dz * w
+            a[k, 0] = G * ax
+            a[k, 1] = G * ay
+            a[k, 2] = G * az
+
+    @njit(parallel=True, cache=True)
+    def _pares_celulas(r, celula, ini, cont, onde, desl, eps2, offs, ii, jj, escreve):
+        # r: posicoes ordenadas pela celula; celula, ini, cont: chave,
+        # inicio e ocupacao de cada celula ocupada (em ordem); onde: celula
+        # de cada corpo; desl: deslocamentos das chaves das celulas
+        # vizinhas (metade delas). Sem escreve, so conta os pares de cada
+        # corpo em offs; com escreve, grava-os a partir de offs
+        n = len(onde)
+        for p in prange(n):
+            k = offs[p] if escreve else 0
+            c = onde[p]
+            x = r[p, 0]
+            y = r[p, 1]
+            z = r[p, 2]
+            # mesma celula: so q > p
+            for q in range(p + 1, ini[c] + cont[c]):
+                dx = r[q, 0] - x
+                dy = r[q, 1] - y
+                dz = r[q, 2] - z
+                if dx * dx + dy * dy + dz * dz < eps2:
+                    if escreve:
+                        ii[k] = p
+                        jj[k] = q
+                    k += 1
+            for d in desl:
+                alvo = celula[c] + d
+                # busca binaria da celula vizinha
+                lo = 0
+                hi = len(celula)
+                while lo < hi:
+                    meio = (lo + hi) // 2
+                    if celula[meio] < alvo:
+                        lo = meio + 1
+                    else:
+                        hi = meio
+                if lo == len(celula) or celula[lo] != alvo:
+                    continue
+                for q in range(ini[lo], ini[lo] + cont[lo]):
+                    dx = r[q, 0] - x
+                    dy = r[q, 1] - y
+                    dz = r[q, 2] - z
+                    if dx * dx + dy * dy + dz * dz < eps2:
+                        if escreve:
+                            ii[k] = p
+                            jj[k] = q
+                        k += 1
+            if not escreve:
+                offs[p] = k
+
+def acel_direta(r, m, G, ladrilho=LADRILHO):
+    '''(array, array, float, int) -> array
+    Soma direta compilada: memoria O(N), 3a lei (cada par calculado uma
+    vez) e ladrilhos de corpos vizinhos na memoria, em paralelo
+    '''
+    a = empty((len(m), 3))
+    _acel_direta(ascontiguousarray(r, dtype=float64),
+                 ascontiguousarray(m, dtype=float64), G, a, ladrilho)
+    return a
+
+def acel_alvos(r, m, G, alvos):
+    '''(array, array, float, array) -> array
+    Aceleracoes compiladas apenas nos corpos alvos
+    '''
+    a = empty((len(alvos), 3))
+    _acel_alvos(ascontiguousarray(r, dtype=float64),
+                ascontiguousarray(m, dtype=float64), G,
+                ascontiguousarray(alvos, dtype=int64), a)
+    return a
+
+def pares_celulas(r, celula, ini, cont, onde, desl, eps):
+    '''(array, array, array, array, array, array, float) -> (array, array)
+    Pares (p, q) de corpos (nas posicoes r ordenadas por celula) a menos
+    de eps: uma passada conta os pares de cada corpo e outra os grava,
+    sem temporarios do tamanho dos pares candidatos
+    '''
+    n = len(onde)
+    r = ascontiguousarray(r, dtype=float64)
+    vazio = empty(0, dtype=int64)
+    conta = empty(n, dtype=int64)
+    _pares_celulas(r, celula, ini, cont, onde, desl, eps * eps, conta, vazio, vazio, False)
+    offs = conta.cumsum() - conta
+    total = int(conta.sum())
+    ii = empty(total, dtype=int64)
+    jj = empty(total, dtype=int64)
+    _pares_celulas(r, celula, ini, cont, onde, desl, eps * eps, offs, ii, jj, True)
+    return ii, jj
+
+class DiretaJit(Direta):
+    """Soma direta compilada pelo Numba (ver acel_direta); sem o Numba
+    instalado e a propria Direta em NumPy"""
+
+    nome = "numba"
+
+    def __init__(self, bloco=PARES_BLOCO, ladrilho=LADRILHO, confere=True):
+        '''(DiretaJit, int, int, bool) -> None
+        ladrilho: corpos por ladrilho da soma compilada
+        confere: compara com a Direta em NumPy num sistema pequeno ao
+        criar o backend (tambem compila os nucleos)
+        '''
+        Direta.__init__(self, bloco)
+        self.ladrilho = ladrilho
+        if NUMBA and confere:
+            erro = compara_forcas(300)
+            if erro > 1e-12:
+                raise RuntimeError("Soma compilada difere da soma em NumPy: %.3e" % erro)
+
+    def aceleracoes(self, r, m, G):
+        if not NUMBA:
+            return Direta.aceleracoes(self, r, m, G)
+        return acel_direta(r, m, G, self.ladrilho)
+
+    def aceleracoes_alvos(self, r, m, G, alvos):
+        if not NUMBA:
+            return Direta.aceleracoes_alvos(self, r, m, G, alvos)
+        return acel_alvos(r, m, G, alvos)
+
+def compara_forcas(n=1000, semente=0):
+    '''(int, int) -> float
+    Maior erro relativo (por corpo) das somas compiladas, de todos os
+    corpos e de alvos, em relacao a Direta em NumPy
+    '''
+    from numpy import arange
+    from numpy.random import RandomState
+    aleatorio = RandomState(semente)
+    r = aleatorio.normal(size=(n, 3))
+    m = aleatorio.uniform(0.5, 1.5, n)
+    ref = Direta().aceleracoes(r, m, 1.)
+    escala = sqrt((ref * ref).sum(axis=1))
+    # n nao multiplo do ladrilho e um ladrilho menor que n: exercita as
+    # rodadas com ladrilho vazio e o ultimo ladrilho incompleto
+    erro = 0.
+    for a in (acel_direta(r, m, 1., 7), acel_direta(r, m, 1.)):
+        erro = max(erro, (sqrt(((a - ref)**2).sum(axis=1)) / escala).max())
+    alvos = arange(0, n, 3)
+    a = acel_alvos(r, m, 1., alvos)
+    return max(erro, (sqrt(((a - ref[alvos])**2).sum(axis=1)) / escala[alvos]).max())
+
+def compara_contatos(n=20000, eps=0.05, semente=0):
+    '''(int, float, int) -> bool
+    Confere se os contatos compilados e em NumPy sao os mesmos pares
+    '''
+    import colisoes
+    from numpy.random import RandomState
+    r = RandomState(semente).uniform(0, 1, (n, 3))
+    pares = []
+    for jit in (True, False):
+        i, j = colisoes.contatos(r, eps, jit=jit)
+        pares.append(sorted(zip(i.tolist(), j.tolist())))
+    return pares[0] == pares[1]
+
+###############################################################################
+
+if __name__ == "__main__":
+    from sys import argv
+    from numpy.random import RandomState
+    import colisoes
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    if not NUMBA:
+        print("Numba nao instalado: os caminhos em NumPy sao usados")
+        raise SystemExit
+    print("Erro relativo maximo da soma compilada: %.3e" % compara_forcas())
+    print("Contatos compilados iguais aos em NumPy: %s" % compara_contatos())
+
+    N = int(argv[1]) if len(argv) > 1 else 20000
+    aleatorio = RandomState(42)
+    r = aleatorio.triangular(-100, 0, 100, (N, 3))
+    m = aleatorio.triangular(0.7, 35.35, 70, N)
+    print("N = %d" % N)
+    for nome, f in (("direto", lambda: Direta().aceleracoes(r, m, 1.)),
+                    ("numba", lambda: acel_direta(r, m, 1.)),
+                    ("contatos numpy", lambda: colisoes.contatos(r, 2.5, jit=False)),
+                    ("contatos numba", lambda: colisoes.contatos(r, 2.5, jit=True))):
+        f()
+        pico = float("nan")
+        if tracemalloc:
+            tracemalloc.start()
+        t0 = time()
+        f()
+        dt = time() - t0
+        if tracemalloc:
+            pico = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        print("%16s: %8.3f s, pico %8.1f MB" % (nome, dt, pico))
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from multiprocessing import Pool, cpu_count
+# a memoria compartilhada entre processos so existe a partir do Python 3.8
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from numpy import float64, linspace, ndarray
+
+from forcas import acel_direta, PARES_BLOCO
+
+# memoria compartilhada vista por cada processo
+_mem = {}
+
+def _anexa(nome, forma):
+    '''(str, tuple) -> (SharedMemory, array)
+    Abre o bloco de memoria compartilhada `nome` como array float64
+    '''
+    # os processos do pool usam o mesmo resource_tracker do processo
+    # principal, que e quem libera o bloco em fechar()
+    shm = shared_memory.SharedMemory(name=nome)
+    return shm, ndarray(forma, dtype=float64, buffer=shm.buf)
+
+def _inicia(nomes, cap):
+    '''(dict, int) -> None
+    Inicializador dos processos: anexa posicoes, massas e aceleracoes
+    '''
+    formas = {"r": (cap, 3), "m": (cap,), "a": (cap, 3)}
+    for k in nomes:
+        _mem[k] = _anexa(nomes[k], formas[k])
+
+def _trabalho(args):
+    '''(tuple) -> int
+    Calcula as aceleracoes dos alvos [ini, fim) direto na memoria compartilhada
+    '''
+    ini, fim, n, G = args
+    r = _mem["r"][1][:n]
+    m = _mem["m"][1][:n]
+    a = _mem["a"][1]
+    passo = max(1, PARES_BLOCO // n)
+    for i in range(ini, fim, passo):
+        j = min(i + passo, fim)
+        acel_direta(r, m, G, i, j, out=a[i:j])
+    return fim - ini
+
+class Paralela(object):
+    """Soma direta dividida em blocos de alvos entre varios processos"""
+
+    nome = "paralelo"
+
+    def __init__(self, processos=None, blocos=None):
+        '''(Paralela, int, int) -> None
+        processos: numero de processos (padrao: numero de nucleos)
+        blocos: numero de blocos de alvos por passo (padrao: 4 por processo)
+        '''
+        if shared_memory is None:
+            raise RuntimeError("O backend paralelo requer Python 3.8+ "
+                               "(multiprocessing.shared_memory)")
+        self.processos = processos or cpu_count()
+        self.blocos = blocos or 4 * self.processos
+        self.cap = 0
+        self.pool = None
+        self.shm = {}
+
+    def _aloca(self, n):
+        '''(Paralela, int) -> None
+        Cria a memoria compartilhada para n corpos e (re)inicia os processos
+        '''
+        self.fechar()
+        self.cap = n
+        tamanhos = {"r": 24 * n, "m": 8 * n, "a": 24 * n}
+        formas = {"r": (n, 3), "m": (n,), "a": (n, 3)}
+        self.arr = {}
+        for k in tamanhos:
+            shm = shared_memory.SharedMemory(create=True, size=tamanhos[k])
+            self.shm[k] = shm
+            self.arr[k] = ndarray(formas[k], dtype=float64, buffer=shm.buf)
+        nomes = dict((k, self.shm[k].name) for k in self.shm)
+        self.pool = Pool(self.processos, _inicia, (nomes, n))
+
+    def aceleracoes(self, r, m, G):
+        '''(Paralela, array, array, float) -> array
+        Retorna as aceleracoes (N, 3) de todos os corpos
+        '''
+        n = len(m)
+        if n > self.cap or self.pool is None:
+            self._aloca(n)
+        self.arr["r"][:n] = r
+        self.arr["m"][:n] = m
+        cortes = linspace(0, n, min(self.blocos, n) + 1).astype(int)
+        tarefas = [(cortes[k], cortes[k+1], n, G) for k in range(len(cortes) - 1)]
+        self.pool.map(_trabalho, tarefas)
+        return self.arr["a"][:n].copy()
+
+    def fechar(self):
+        '''(Paralela) -> None
+        Encerra os processos e libera a memoria compartilhada
+        '''
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.arr = {}
+        for k in self.shm:
+            self.shm[k].close()
+            self.shm[k].unlink()
+        self.shm = {}
+        self.cap = 0
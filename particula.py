@@ -1,31 +1,76 @@
 # -*- coding: utf-8 -*-
 from __future__ import division
 
+from math import sqrt
+
+from numpy import array
+
 from vetor import Vetor
 
-class Particula:
+class Particula(object):
     """Classe Partícula"""
 
+    __slots__ = ("label", "_r", "_v", "_p", "_m", "cor", "material")
+
     def __init__(self, lbl, r = (0, 0, 0), v = (0, 0, 0), mass = 1, color=None, material=None):
         '''(Particula, str, 3-tuple, 3-tuple, float) -> None
         O padrão é uma "partícula" na posição origem
         '''
         self.label = lbl
         # vetor posição
-        self.r = Vetor(r)
+        self._r = array(r, dtype=float)
         # vetor velocidade
-        self.v = Vetor(v)
+        self._v = array(v, dtype=float)
         # massa
-        self.m = mass
-        # vetor momentum
-        self.p = self.v.multiply(self.m)
-        # vetor posição auxiliar
-        self.r_ = Vetor(r)
+        self._m = array([mass], dtype=float)
+        # vetor momentum (linha do array de momentos quando ligada a um Estado)
+        self._p = self._v * mass
         # cor
         self.cor = color
         # material
         self.material = material
 
+    def liga(self, estado, i):
+        '''(Particula, Estado, int) -> None
+        Passa a ler e escrever os dados na linha i dos arrays do estado
+        '''
+        self._r = estado.r[i]
+        self._v = estado.v[i]
+        self._p = estado.p[i]
+        self._m = estado.m[i:i+1]
+
+    @property
+    def r(self):
+        return Vetor(self._r)
+
+    @r.setter
+    def r(self, u):
+        self._r[0], self._r[1], self._r[2] = u.x, u.y, u.z
+
+    @property
+    def v(self):
+        return Vetor(self._v)
+
+    @v.setter
+    def v(self, u):
+        self._v[0], self._v[1], self._v[2] = u.x, u.y, u.z
+
+    @property
+    def p(self):
+        return Vetor(self._p)
+
+    @p.setter
+    def p(self, u):
+        self._p[0], self._p[1], self._p[2] = u.x, u.y, u.z
+
+    @property
+    def m(self):
+        return float(self._m[0])
+
+    @m.setter
+    def m(self, mass):
+        self._m[0] = mass
+
     def __str__(self):
         '''(Particula) -> str'''
         txt = "%s, %s, %s, %.14f"%(
@@ -39,19 +84,33 @@ class Particula:
         return not self == other
 
     def __gt__(self, other):
-        return self.p > other.p
+        return self.p.modulo2() > other.p.modulo2()
 
     def __lt__(self, other):
-        return self.p < other.p
+        return self.p.modulo2() < other.p.modulo2()
 
     def gravity(self, other, G):
         '''(Particula, Particula) -> Vetor
         Retorna o vetor força gravitacional em self causada por other
         g = G * m1 * m2 / r^2 * r (r é o vetor posicao)
         '''
+        return self.gravity_into(other, G, Vetor())
+
+    def gravity_into(self, other, G, f):
+        '''(Particula, Particula, float, Vetor) -> Vetor
+        Soma em f a força gravitacional em self causada por other,
+        sem criar vetores intermediarios; retorna f
+        '''
+        ax, ay, az = self._r.tolist()
+        bx, by, bz = other._r.tolist()
         # vetor posição
-        r = other.r - self.r
+        dx = bx - ax
+        dy = by - ay
+        dz = bz - az
+        d2 = dx*dx + dy*dy + dz*dz
         # intensidade da força
-        f = G * self.m * other.m / r.modulo3()
-        # retorna vetor força
-        return r.multiply(f)
+        k = G * self._m.item(0) * other._m.item(0) / (d2 * sqrt(d2))
+        f.x += k * dx
+        f.y += k * dy
+        f.z += k * dz
+        return f
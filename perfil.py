@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+try:
+    from time import perf_counter as relogio
+except ImportError:
+    from time import time as relogio
+
+# fases medidas em Nbody.integracao
+FASES = ("forca", "colisoes", "binarias", "render", "espera", "ganchos")
+
+class Perfil(object):
+    """Temporizadores e contadores por fase do laco de integracao"""
+
+    def __init__(self, a_cada=200, saida=print):
+        '''(Perfil, int, function) -> None
+        a_cada: passos entre resumos (0 desliga os resumos)
+        saida: funcao que recebe o texto de cada resumo
+        '''
+        self.a_cada = a_cada
+        self.saida = saida
+        # ouvintes externos: funcao(fase, inicio, fim) a cada fase medida
+        self.ouvintes = []
+        self.total = {}
+        self.janela = {}
+        self.cont_total = {}
+        self.cont_janela = {}
+        self.passos = 0
+        self.inicio = self.inicio_janela = relogio()
+
+    def relogio(self):
+        return relogio()
+
+    def termina(self, fase, t0):
+        '''(Perfil, str, float) -> None
+        Acumula o tempo da fase iniciada em t0 (valor de relogio())
+        '''
+        t1 = relogio()
+        self.janela[fase] = self.janela.get(fase, 0.) + t1 - t0
+        for ouvinte in self.ouvintes:
+            ouvinte(fase, t0, t1)
+
+    def conta(self, nome, k=1):
+        '''(Perfil, str, int) -> None
+        Soma k ao contador nome
+        '''
+        self.cont_janela[nome] = self.cont_janela.get(nome, 0) + k
+
+    def passo(self):
+        '''(Perfil) -> None
+        Fim de um passo; a cada a_cada passos emite o resumo da janela
+        '''
+        self.passos += 1
+        self.conta("passos")
+        if self.a_cada and self.passos % self.a_cada == 0:
+            self.saida(self.fecha_janela())
+
+    def fecha_janela(self):
+        '''(Perfil) -> str
+        Retorna o resumo da janela atual e comeca uma nova
+        '''
+        agora = relogio()
+        txt = self.resumo(self.janela, self.cont_janela, agora - self.inicio_janela)
+        for d, j in ((self.total, self.janela), (self.cont_total, self.cont_janela)):
+            for k in j:
+                d[k] = d.get(k, 0) + j[k]
+            j.clear()
+        self.inicio_janela = agora
+        return txt
+
+    def resumo(self, tempos=None, contadores=None, parede=None):
+        '''(Perfil, dict, dict, float) -> str
+        Tabela com tempo por fase e contadores; sem argumentos,
+        resume toda a integracao ate agora
+        '''
+        if tempos is None:
+            tempos = dict(self.total)
+            contadores = dict(self.cont_total)
+            for d, j in ((tempos, self.janela), (contadores, self.cont_janela)):
+                for k in j:
+                    d[k] = d.get(k, 0) + j[k]
+            parede = relogio() - self.inicio
+        n = max(contadores.get("passos", 0), 1)
+        txt = "::Perfil - %d passos em %.3f s (%.1f passos/s)::\n" % (
+              contadores.get("passos", 0), parede, contadores.get("passos", 0) / max(parede, 1e-12))
+        outros = parede
+        for fase in FASES + tuple(sorted(set(tempos) - set(FASES))):
+            if fase in tempos:
+                t = tempos[fase]
+                outros -= t
+                txt += "  %-9s %9.3f s  %5.1f%%  %9.3f ms/passo\n" % (
+                       fase, t, 100 * t / max(parede, 1e-12), 1000 * t / n)
+        txt += "  %-9s %9.3f s  %5.1f%%\n" % ("outros", outros,
+                                            100 * outros / max(parede, 1e-12))
+        for k in sorted(contadores):
+            if k != "passos":
+                txt += "  %-9s %d\n" % (k, contadores[k])
+        return txt
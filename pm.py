@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+from math import pi
+from time import time
+
+from numpy import (arange, bincount, exp, floor, minimum, r_, searchsorted, sinc,
+                   sqrt, zeros)
+from numpy.fft import irfftn, rfftn
+
+from colisoes import contatos
+from forcas import Direta, PARES_BLOCO
+
+def _erfc(x):
+    '''(array) -> array
+    Funcao erro complementar (Abramowitz e Stegun 7.1.26, erro < 1.5e-7)
+    '''
+    t = 1 / (1 + 0.3275911 * x)
+    p = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 +
+        t * (-1.453152027 + t * 1.061405429))))
+    return p * exp(-x * x)
+
+def green(malha, s):
+    '''(int, float) -> array
+    Transformada do nucleo erf(d / (sqrt(2) s)) / d numa malha de
+    2 malha + 4 celulas por eixo (contorno isolado: distancias periodicas
+    de ate malha + 2 celulas nunca ligam fontes e alvos pelo lado errado),
+    em unidades de celula e dividida pela janela da CIC ao quadrado
+    (distribuicao e interpolacao), que de outro modo suaviza ainda mais
+    a forca da malha
+    '''
+    k = 2 * malha + 4
+    i = arange(k)
+    i = minimum(i, k - i).astype(float)
+    d = sqrt(i[:, None, None]**2 + i[None, :, None]**2 + i[None, None, :]**2)
+    d[0, 0, 0] = 1.
+    g = (1 - _erfc(d / (sqrt(2) * s))) / d
+    # limite em d = 0
+    g[0, 0, 0] = sqrt(2 / pi) / s
+    w = sinc(i / k)**2
+    janela = w[:, None, None] * w[None, :, None] * w[None, None, :k // 2 + 1]
+    return rfftn(g) / janela**2
+
+class ParticulaMalha(object):
+    """Forca por particula-malha (PM): massas distribuidas na malha por
+    nuvem-na-celula (CIC), potencial pela FFT com contorno isolado e
+    aceleracoes interpoladas de volta, O(N + M^3 log M); a gravidade e
+    suavizada por uma gaussiana de `s` celulas e, com p3m, a diferenca
+    para a gravidade exata e somada diretamente entre os pares a menos de
+    `corte` celulas (P3M), recuperando a forca exata a curta distancia"""
+
+    nome = "pm"
+
+    def __init__(self, malha=64, s=1.5, p3m=False, corte=None):
+        '''(ParticulaMalha, int, float, bool, float) -> None
+        malha: celulas por eixo na caixa envolvente dos corpos
+        s: largura da gaussiana de suavizacao, em celulas
+        p3m: soma a correcao de curto alcance
+        corte: alcance da correcao, em celulas (padrao 4 s, onde a parte
+        de curto alcance cai abaixo de 1e-4 da forca)
+        '''
+        self.malha = malha
+        self.s = s
+        self.p3m = p3m
+        self.corte = 4 * s if corte is None else corte
+        self.ghat = green(malha, s)
+        self.pares = 0
+        self.tempos = {}
+
+    @property
+    def interacoes(self):
+        '''(ParticulaMalha) -> int
+        Pares somados diretamente na ultima avaliacao
+        '''
+        return self.pares
+
+    def _caixa(self, r):
+        '''(ParticulaMalha, array) -> (array, float)
+        Origem e lado da celula da malha que cobre os corpos
+        '''
+        lo = r.min(axis=0)
+        lado = (r.max(axis=0) - lo).max()
+        if lado == 0:
+            lado = 1.
+        # a ultima celula fica vazia: i0 + 1 <= malha - 1
+        h = lado * (1 + 1e-9) / (self.malha - 1)
+        return lo, h
+
+    def aceleracoes(self, r, m, G):
+        '''(ParticulaMalha, array, array, float) -> array
+        Retorna as aceleracoes (N, 3) de todos os corpos
+        '''
+        M = self.malha
+        t0 = time()
+        lo, h = self._caixa(r)
+        u = (r - lo) / h
+        i0 = floor(u).astype(int)
+        f = u - i0
+
+        # CIC: cada corpo reparte a massa entre os 8 vertices da celula
+        rho = zeros(M**3)
+        cantos = []
+        for dx in (0, 1):
+            wx = f[:, 0] if dx else 1 - f[:, 0]
+            for dy in (0, 1):
+                wy = f[:, 1] if dy else 1 - f[:, 1]
+                for dz in (0, 1):
+                    wz = f[:, 2] if dz else 1 - f[:, 2]
+                    idx = ((i0[:, 0] + dx) * M + i0[:, 1] + dy) * M + i0[:, 2] + dz
+                    w = wx * wy * wz
+                    rho += bincount(idx, m * w, M**3)
+                    cantos.append((idx, w))
+        t1 = time()
+
+        # potencial: convolucao com a malha dobrada (contorno isolado)
+        K = 2 * M + 4
+        grande = zeros((K, K, K))
+        grande[:M, :M, :M] = rho.reshape(M, M, M)
+        phi = irfftn(rfftn(grande) * self.ghat, (K, K, K), axes=(0, 1, 2))
+        # indices de -2 a M + 1, todos exatos (distancias ate M + 2 celulas)
+        ext = r_[K - 2:K, 0:M + 2]
+        phi = phi[ext][:, ext][:, :, ext] * (-G / h)
+        t2 = time()
+
+        # campo por diferencas centrais de 4 pontos e interpolacao CIC
+        campo = []
+        for eixo in range(3):
+            def desloca(k):
+                fatia = [slice(2, -2)] * 3
+                fatia[eixo] = slice(2 + k, -2 + k or None)
+                return phi[tuple(fatia)]
+            g = (8 * (desloca(-1) - desloca(1)) - (desloca(-2) - desloca(2))) / (12 * h)
+            campo.append(g.ravel())
+        a = zeros((len(m), 3))
+        for idx, w in cantos:
+            for eixo in range(3):
+                a[:, eixo] += campo[eixo][idx] * w
+        t3 = time()
+
+        if self.p3m:
+            self._curto(r, m, G, h, a)
+        self.tempos = {"cic": t1 - t0, "fft": t2 - t1, "interpolacao": t3 - t2,
+                       "curto": time() - t3}
+        return a
+
+    def _curto(self, r, m, G, h, a):
+        '''(ParticulaMalha, array, array, float, float, array) -> None
+        Soma em a a parte de curto alcance (erfc) da gravidade entre os
+        pares a menos de corte celulas; os corpos sao ordenados em x e
+        tratados em fatias com uma borda de corte a direita, cada par na
+        fatia do corpo mais a esquerda, para limitar a memoria dos pares
+        '''
+        n = len(m)
+        rc = self.corte * h
+        ordem = r[:, 0].argsort()
+        x = r[ordem, 0]
+        # corpos por fatia pelos vizinhos medidos na avaliacao anterior
+        vizinhos = max(1., 2 * self.pares / n) if self.pares else 64.
+        bloco = max(256, int(PARES_BLOCO / vizinhos))
+        pares = 0
+        for ini in range(0, n, bloco):
+            fim = min(ini + bloco, n)
+            ate = searchsorted(x, x[fim - 1] + rc, "right")
+            idx = ordem[ini:ate]
+            i, j = contatos(r[idx], rc)
+            # so os pares com algum corpo na fatia (o outro pode estar na borda)
+            sel = minimum(i, j) < fim - ini
+            i, j = idx[i[sel]], idx[j[sel]]
+            pares += len(i)
+            if len(i) == 0:
+                continue
+            d = r[j] - r[i]
+            d2 = (d * d).sum(axis=1)
+            dist = sqrt(d2)
+            sig = self.s * h
+            q = dist / (sqrt(2) * sig)
+            # -dphi/dd do potencial -erfc(q) / d, por unidade de G m
+            f = (_erfc(q) / dist + sqrt(2 / pi) / sig * exp(-q * q)) / d2
+            d *= f[:, None]
+            for eixo in range(3):
+                a[:, eixo] += G * (bincount(i, d[:, eixo] * m[j], n) -
+                                   bincount(j, d[:, eixo] * m[i], n))
+        self.pares = pares
+
+    def fechar(self):
+        '''(ParticulaMalha) -> None
+        Libera recursos do backend
+        '''
+        pass
+
+def relatorio(r, m, G=1, malhas=(32, 64), p3m=(False, True)):
+    '''(array, array, float, tuple, tuple) -> list of dict
+    Compara PM e P3M com a soma direta: erro relativo da aceleracao de
+    cada corpo (mediano e p99) e tempo
+    '''
+    from numpy import percentile
+    t0 = time()
+    ref = Direta().aceleracoes(r, m, G)
+    print("N = %d, soma direta em %.2f s" % (len(m), time() - t0))
+    print(" malha |  p3m |  erro mediano |  erro p99  |  tempo (s) |  pares")
+    print("-" * 66)
+    linhas = []
+    for malha in malhas:
+        for p in p3m:
+            forca = ParticulaMalha(malha, p3m=p)
+            t0 = time()
+            a = forca.aceleracoes(r, m, G)
+            dt = time() - t0
+            erro = sqrt(((a - ref)**2).sum(axis=1) / (ref * ref).sum(axis=1))
+            lin = {"malha": malha, "p3m": p, "erro_mediano": percentile(erro, 50),
+                   "erro_p99": percentile(erro, 99), "tempo": dt,
+                   "pares": forca.pares}
+            linhas.append(lin)
+            print("%6d | %4s |  %.6e | %.4e |  %9.3f | %6d" % (
+                  malha, "sim" if p else "nao", lin["erro_mediano"],
+                  lin["erro_p99"], dt, forca.pares))
+    return linhas
+
+###############################################################################
+
+if __name__ == "__main__":
+    from sys import argv
+    from numpy.random import RandomState
+
+    # aglomerado como o do modo [G]erar particulas
+    R, V, M = 100, 1.5, 70
+    N = int(argv[1]) if len(argv) > 1 else 5000
+    aleatorio = RandomState(42)
+    r = aleatorio.triangular(-R, 0, R, (N, 3))
+    m = aleatorio.triangular(0.7, (0.7 + M) / 2, M, N)
+    relatorio(r, m)
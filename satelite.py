@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+from sys import argv
+
+import nbody
+from nbody import Nbody, carrega_visual
+from particula import Particula
+
+# constantes (S.I.)
+G = 6.7e-11
+mTerra = 6e24
+RTerra = 6.4e6
+msatelite = 15e3
+
+def cria(r0=2.1e7, v0=5.02e3, integrador="leapfrog"):
+    '''(float, float, str) -> Nbody
+    Terra parada na origem e o satelite, particula de teste, em (r0, 0, 0)
+    com velocidade (0, v0, 0); passo de 60 s
+    '''
+    # o satelite e removido ao tocar a superficie
+    nbody.EPS = RTerra
+    corpos = Nbody([Particula("Terra", (0, 0, 0), (0, 0, 0), mTerra)],
+                   headless=True, integrador=integrador)
+    corpos.G = G
+    corpos._dt = corpos.dt = 60
+    corpos.set_testes([Particula("satelite", (r0, 0, 0), (0, v0, 0), msatelite)])
+    return corpos
+
+class MeiasVoltas(object):
+    """Conta as meias voltas (trocas de sinal da coordenada y do satelite)
+    e para a integracao apos N periodos completos ou na colisao"""
+
+    def __init__(self, corpos, N=10):
+        self.N = N
+        self.sinal = 1.
+        self.contador = 0
+        self.periodo = None
+        corpos.a_cada(1, self)
+
+    def __call__(self, corpos):
+        if len(corpos.testes) == 0:
+            print("O satelite colidiu com a Terra em t = %.0f s" % corpos.t)
+            corpos.parar = True
+            return
+        if self.sinal * corpos.testes.r[0, 1] < 0:
+            self.sinal = -self.sinal
+            self.contador += 1
+            if self.contador == 2 * self.N:
+                self.periodo = corpos.t / self.N
+                print("O periodo e: ", self.periodo / 3600, " horas")
+                corpos.parar = True
+
+class Cena(object):
+    """Terra, satelite, setas do momento e da forca e a trajetoria,
+    atualizados a cada passo"""
+
+    def __init__(self, corpos, escalap=0.25, escalaF=1e3):
+        visual = self.visual = carrega_visual()
+        color = visual.color
+        visual.scene.width = 1400
+        visual.scene.height = 980
+        # mantem a escala da janela fixa
+        visual.scene.autoscale = 1
+        self.escalap = escalap
+        self.escalaF = escalaF
+        r = corpos.testes.r[0]
+        self.terra = visual.sphere(pos=(0, 0, 0), radius=RTerra,
+                                   material=visual.materials.earth)
+        # o raio do satelite e enorme para facilitar sua visualizacao
+        self.satelite = visual.sphere(pos=tuple(r), radius=2e6, color=color.yellow,
+                                      material=visual.materials.emissive)
+        self.parr = visual.arrow(color=color.green, shaftwidth=1e6)
+        self.Farr = visual.arrow(color=color.red, shaftwidth=1e6)
+        self.trajetoria = visual.curve(color=color.yellow)
+        self.trajetoria.append(pos=tuple(r))
+        corpos.a_cada(1, self)
+
+    def __call__(self, corpos):
+        self.visual.rate(300)
+        if len(corpos.testes) == 0:
+            return
+        vector = self.visual.vector
+        t = corpos.testes
+        r = vector(*t.r[0])
+        p = vector(*t.p[0])
+        F = vector(*(t.m[0] * corpos.aceleracoes_testes()[0]))
+        self.terra.pos = vector(*corpos.estado.r[0])
+        self.satelite.pos = r
+        self.trajetoria.append(pos=r)
+        self.parr.pos = self.Farr.pos = r
+        self.parr.axis = p * self.escalap
+        self.Farr.axis = F * self.escalaF
+
+def main():
+    # h: sem visualizacao, so calcula o periodo
+    flags = argv[1] if len(argv) > 1 else ""
+    corpos = cria()
+    contador = MeiasVoltas(corpos)
+    if "h" not in flags:
+        cena = Cena(corpos)
+        # inicia pausado
+        cena.visual.scene.mouse.getclick()
+    corpos.integracao(3e7)
+    return contador.periodo
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
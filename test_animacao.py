@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import threading
+
+from numpy import arange, zeros
+
+from animacao import BufferDuplo
+from estado import Estado
+from nbody import Nbody
+
+def test_buffer_duplo_entre_threads():
+    # cada publicacao escreve o numero k em todo o estado: um quadro lido
+    # pela metade teria valores misturados
+    n = 20000
+    corpos = Nbody(headless=True)
+    corpos.estado = Estado.de_arrays(zeros((n, 3)), zeros((n, 3)), zeros(n),
+                                     arange(n).astype("S"))
+    corpos.testes = Estado.de_arrays(zeros((50, 3)), zeros((50, 3)), zeros(50),
+                                     arange(50).astype("S"))
+    buf = BufferDuplo()
+    fim = threading.Event()
+
+    def fisica():
+        e = corpos.estado
+        for k in range(1, 400):
+            e.r[:] = k
+            e.m[:] = k
+            corpos.testes.r[:] = k
+            corpos.t = corpos.passos = k
+            buf.publica(corpos)
+        fim.set()
+
+    def confere(q):
+        k = q.passos
+        return ((q.r == k).all() and (q.m == k).all() and (q.rt == k).all()
+                and q.t == k)
+
+    produtor = threading.Thread(target=fisica)
+    produtor.start()
+    vistos = []
+    while not fim.is_set() or not vistos:
+        q, seq = buf.pega()
+        if seq:
+            assert confere(q)
+            k = q.passos
+            # enquanto reservado, o quadro nao muda
+            for _ in range(50):
+                assert q.passos == k and q.r[-1, 2] == k
+            assert confere(q)
+            vistos.append((seq, k))
+        buf.solta()
+    produtor.join()
+
+    assert [s for s, _ in vistos] == sorted(s for s, _ in vistos)
+    assert [k for _, k in vistos] == sorted(k for _, k in vistos)
+    assert buf.publicados + buf.descartados == 399
+    assert buf.seq == buf.publicados
+    q, seq = buf.pega()
+    assert confere(q) and q.passos <= 399
+    buf.solta()
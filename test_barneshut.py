@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+from numpy import array, sqrt
+from numpy.random import RandomState
+
+from barneshut import BarnesHut, Octree, relatorio_theta
+from forcas import Direta
+from particula import Particula
+from test_forcas import aglomerado, erro_relativo
+
+def test_theta_zero_igual_direta():
+    r, m = aglomerado(500)
+    ref = Direta().aceleracoes(r, m, 1)
+    assert erro_relativo(BarnesHut(theta=0).aceleracoes(r, m, 1), ref) < 1e-12
+
+def test_erro_cresce_com_theta():
+    pts = [Particula("p_%d" % i, x, (0, 0, 0), mi)
+           for i, (x, mi) in enumerate(zip(*aglomerado(2000)))]
+    linhas = relatorio_theta(pts, thetas=(0.3, 0.5, 1.0))
+    erros = [l["erro_p99"] for l in linhas]
+    assert erros == sorted(erros)
+    assert linhas[1]["erro_mediano"] < 1e-2
+    assert linhas[1]["interacoes"] < 2000 * 1999
+
+def test_alvos():
+    r, m = aglomerado(800)
+    bh = BarnesHut(theta=0.5)
+    todos = bh.aceleracoes(r, m, 1)
+    alvos = array([0, 799, 400, 13])
+    assert abs(bh.aceleracoes_alvos(r, m, 1, alvos) - todos[alvos]).max() == 0
+
+def test_potencial():
+    r, m = aglomerado(300)
+    a, phi = Octree(r, m).aceleracoes(1, 0, potencial=True)
+    d = r[:, None, :] - r[None, :, :]
+    d = sqrt((d * d).sum(axis=2))
+    d[range(300), range(300)] = 1
+    ref = -(m[None, :] / d).sum(axis=1) + m
+    assert abs(phi - ref).max() < 1e-12 * abs(ref).max()
+
+def test_reajuste_entre_reconstrucoes():
+    r, m = aglomerado(600)
+    v = RandomState(2).normal(0, 1, r.shape)
+    bh = BarnesHut(theta=0, reconstroi=3)
+    for k in range(6):
+        rk = r + k * v
+        ref = Direta().aceleracoes(rk, m, 1)
+        # com theta = 0 o reajuste dos nos ainda da a soma exata
+        assert erro_relativo(bh.aceleracoes(rk, m, 1), ref) < 1e-12
+    assert bh.avaliacoes == 6
+
+def test_coincidentes_e_corpo_unico():
+    r = array([[1., 2, 3]] * 4 + [[5., 5, 5]])
+    m = array([1., 1, 1, 1, 2])
+    a = BarnesHut(folha=2).aceleracoes(r[4:], m[4:], 1)
+    assert (a == 0).all()
+    # morton nao quebra com a caixa degenerada
+    assert Octree(r[:4], m[:4], folha=2).ordem.shape == (4,)
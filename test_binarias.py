@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+from numpy import pi, sqrt, zeros
+from numpy.random import RandomState
+
+import diagnosticos
+import nbody
+from binarias import elementos, fisicas, ks, oscilador, perturbadas
+from nbody import Nbody
+from particula import Particula
+from trajetoria import Gravador, Trajetoria
+
+@pytest.fixture
+def eps_pequeno(monkeypatch):
+    # binarias apertadas nao podem ser fundidas pelas colisoes
+    monkeypatch.setattr(nbody, "EPS", 1e-3)
+
+def apertada(ks=True):
+    '''(bool) -> Nbody
+    Binaria circular de periodo ~0.0044 (menor que o passo) e dois
+    corpos distantes
+    '''
+    v = sqrt(2 / 0.01) / 2
+    pts = [Particula("a", (0, 0, 0), (0, v, 0), 1),
+           Particula("b", (0.01, 0, 0), (0, -v, 0), 1),
+           Particula("c", (10, 0, 0), (0, 0.5, 0), 1),
+           Particula("d", (-6, 5, 0), (0.2, 0, 0), 0.5)]
+    corpos = Nbody(pts, headless=True, integrador="leapfrog")
+    corpos._dt = corpos.dt = 0.01
+    if ks:
+        corpos.regulariza(0.02)
+    return corpos
+
+def orbitas(n=50, semente=0):
+    '''(int, int) -> (array, array, array)
+    Orbitas relativas ligadas aleatorias, com x dos dois sinais
+    '''
+    aleatorio = RandomState(semente)
+    rel = aleatorio.normal(0, 1, (n, 3))
+    mu = aleatorio.uniform(0.5, 2, n)
+    r = sqrt((rel * rel).sum(axis=1))
+    vel = aleatorio.normal(0, 1, (n, 3))
+    vel *= (aleatorio.uniform(0.2, 1.3, n) * sqrt(mu / r) /
+            sqrt((vel * vel).sum(axis=1)))[:, None]
+    return rel, vel, mu
+
+def test_ks_ida_e_volta():
+    rel, vel, mu = orbitas()
+    assert (rel[:, 0] < 0).any() and (rel[:, 0] > 0).any()
+    u, w = ks(rel, vel)
+    r2, v2 = fisicas(u, w)
+    assert abs(r2 - rel).max() < 1e-13
+    assert abs(v2 - vel).max() < 1e-13
+    assert abs((u * u).sum(axis=1) - sqrt((rel * rel).sum(axis=1))).max() < 1e-13
+
+def test_oscilador_volta_apos_um_periodo():
+    rel, vel, mu = orbitas()
+    h, q, Q = elementos(rel, vel, mu)
+    u, w = ks(rel, vel)
+    for b in range(len(mu)):
+        periodo = 2 * pi * sqrt((-mu[b] / (2 * h[b]))**3 / mu[b])
+        for k in (1, 3):
+            ub, wb = oscilador(u[b:b+1], w[b:b+1], h[b:b+1], k * periodo)
+            r2, v2 = fisicas(ub, wb)
+            assert abs(r2 - rel[b]).max() < 1e-9 * Q[b]
+            assert abs(elementos(r2, v2, mu[b:b+1])[0] - h[b]).max() < 1e-9 * abs(h[b])
+
+def test_perturbadas_sem_mare_igual_oscilador():
+    rel, vel, mu = orbitas(10)
+    h = elementos(rel, vel, mu)[0]
+    u, w = ks(rel, vel)
+    dt = 0.7
+    ue, we = oscilador(u, w, h, dt)
+    up, wp, hp, k = perturbadas(u, w, h, zeros((len(h), 3, 3)), dt, passos=256)
+    assert k > 0
+    assert abs(hp - h).max() < 1e-8
+    assert abs(fisicas(up, wp)[0] - fisicas(ue, we)[0]).max() < 1e-6
+
+def test_binaria_apertada(eps_pequeno):
+    corpos = apertada()
+    E0 = diagnosticos.energia(corpos)
+    p0 = diagnosticos.momento(corpos.estado)
+    corpos.integracao(2)
+    assert len(corpos.ks) == 1 and corpos.n == 3
+    # sem perturbacao relevante a orbita e a de Kepler, sem passos de RK4
+    assert corpos.ks.passos_ks == 0
+    assert abs(diagnosticos.energia(corpos) - E0) < 1e-7 * abs(E0)
+    assert abs(diagnosticos.momento(corpos.estado) - p0).max() < 1e-12
+
+    # sem KS o passo e maior que o periodo da binaria
+    corpos = apertada(ks=False)
+    corpos.integracao(0.5)
+    assert abs(diagnosticos.energia(corpos) - E0) > 1e-2 * abs(E0)
+
+def test_desfaz_conserva(eps_pequeno):
+    corpos = apertada()
+    corpos.binarias(0)
+    assert corpos.n == 3
+    E0 = diagnosticos.energia(corpos)
+    p0 = diagnosticos.momento(corpos.estado)
+    # com raio menor a separacao passa de 2 raio e a binaria e desfeita
+    corpos.ks.raio = 0.004
+    corpos.binarias(0.001)
+    assert len(corpos.ks) == 0 and corpos.n == 4
+    assert sorted(corpos.estado.labels()) == ["a", "b", "c", "d"]
+    assert sorted(corpos.estado.ids.tolist()) == [0, 1, 2, 3]
+    assert abs(diagnosticos.energia(corpos) - E0) < 1e-6 * abs(E0)
+    assert abs(diagnosticos.momento(corpos.estado) - p0).max() < 1e-12
+
+def test_checkpoint_com_binaria(eps_pequeno, tmp_path):
+    corpos = apertada()
+    corpos.integracao(0.5)
+    nome = str(tmp_path / "ks.ckpt")
+    corpos.salva_checkpoint(nome)
+    corpos.integracao(0.5)
+
+    retomado = Nbody(headless=True, integrador="leapfrog")
+    retomado.carrega_checkpoint(nome)
+    assert len(retomado.ks) == 1
+    retomado.integracao(0.5)
+    assert retomado.passos == corpos.passos
+    assert (retomado.estado.r == corpos.estado.r).all()
+    assert (retomado.ks.u == corpos.ks.u).all()
+    assert retomado.ks.segundos.labels() == ["b"]
+
+def test_momento_angular_na_captura(eps_pequeno):
+    corpos = apertada()
+    L0 = diagnosticos.momento_angular(corpos.estado, corpos.ks)
+    corpos.integracao(0.5)
+    assert len(corpos.ks) == 1
+    L = diagnosticos.momento_angular(corpos.estado, corpos.ks)
+    assert abs(L - L0).max() < 1e-9 * abs(L0).max()
+    # sem o momento interno das binarias a diferenca e visivel
+    assert abs(diagnosticos.momento_angular(corpos.estado) - L0).max() > 1e-2
+
+def test_saidas_com_os_dois_componentes(eps_pequeno, tmp_path):
+    corpos = apertada()
+    corpos.integracao(0.5)
+    assert corpos.n == 3
+    linhas = str(corpos).splitlines()[2:]
+    massas = dict((l.split(", ")[0], float(l.split(", ")[7])) for l in linhas)
+    assert massas == {"a": 1, "b": 1, "c": 1, "d": 0.5}
+    r1, v1, r2, v2 = corpos.ks.componentes(corpos)
+    assert "b, %s" % Particula("b", r2[0]).r in str(corpos)
+
+    nome = str(tmp_path / "ks.traj")
+    g = Gravador(corpos, nome, a_cada=1)
+    corpos.integracao(0.1)
+    g.fechar()
+    traj = Trajetoria(nome)
+    assert sorted(traj.labels) == ["a", "b", "c", "d"]
+    ids, r, m, t = traj.quadro(len(traj) - 1)
+    assert sorted(ids.tolist()) == [0, 1, 2, 3]
+    assert abs(m.sum() - 3.5) < 1e-6
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import random
+
+from numpy import memmap
+
+import checkpoint
+from nbody import Nbody, gera_aleatorias
+
+def corpos_aleatorios(n=20, integrador="leapfrog"):
+    '''(int, str) -> Nbody'''
+    random.seed(7)
+    return Nbody(gera_aleatorias(n), headless=True, integrador=integrador)
+
+def test_salva_carrega(tmp_path):
+    corpos = corpos_aleatorios()
+    corpos.integracao(20 * corpos.dt)
+    nome = str(tmp_path / "a.ckpt")
+    corpos.salva_checkpoint(nome, rotulo="teste")
+
+    e, meta = checkpoint.carrega(nome)
+    assert meta["rotulo"] == "teste"
+    assert meta["passos"] == corpos.passos
+    assert (e.r == corpos.estado.r).all()
+    assert (e.v == corpos.estado.v).all()
+    assert (e.m == corpos.estado.m).all()
+    assert (e.ids == corpos.estado.ids).all()
+    assert e.labels() == corpos.estado.labels()
+
+def test_carrega_nao_mantem_mapeamento(tmp_path):
+    corpos = corpos_aleatorios()
+    nome = str(tmp_path / "a.ckpt")
+    corpos.salva_checkpoint(nome)
+    e, meta = checkpoint.carrega(nome)
+    for a in [e.r, e.v, e.p, e.m, e.ids] + list(meta["extras"].values()):
+        assert not isinstance(a, memmap)
+        assert a.base is None or not isinstance(a.base, memmap)
+    # o estado carregado e gravado por cima do proprio arquivo
+    checkpoint.salva(nome, e, meta["extras"], G=meta["G"])
+    assert (checkpoint.carrega(nome)[0].r == e.r).all()
+
+def test_le_somente_leitura(tmp_path):
+    corpos = corpos_aleatorios()
+    nome = str(tmp_path / "a.ckpt")
+    corpos.salva_checkpoint(nome)
+    meta, a = checkpoint.le(nome)
+    assert meta["n"] == corpos.n
+    assert isinstance(a["r"], memmap)
+    assert not a["r"].flags.writeable
+
+def test_retomada_bit_a_bit(tmp_path):
+    for integrador in ("leapfrog", "yoshida4", "blocos"):
+        corpos = corpos_aleatorios(integrador=integrador)
+        corpos.integracao(10 * corpos.dt)
+        nome = str(tmp_path / ("%s.ckpt" % integrador))
+        corpos.salva_checkpoint(nome)
+        corpos.integracao(10 * corpos.dt)
+
+        retomado = Nbody(headless=True, integrador=integrador)
+        retomado.carrega_checkpoint(nome)
+        retomado.integracao(10 * retomado.dt)
+        assert retomado.passos == corpos.passos
+        assert (retomado.estado.r == corpos.estado.r).all()
+        assert (retomado.estado.v == corpos.estado.v).all()
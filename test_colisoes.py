@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+from numpy import array, triu_indices
+from numpy.random import RandomState
+
+from colisoes import contatos, grupos, proximos
+from nbody import Nbody, EPS
+from particula import Particula
+
+def forca_bruta(r, eps):
+    '''(array, float) -> list of tuple
+    Pares (i, j), i < j, a menos de eps, comparando todos com todos
+    '''
+    d = r[:, None, :] - r[None, :, :]
+    perto = (d * d).sum(axis=2) < eps * eps
+    i, j = triu_indices(len(r), 1)
+    sel = perto[i, j]
+    return sorted(zip(i[sel].tolist(), j[sel].tolist()))
+
+def pares(i, j):
+    assert (i < j).all()
+    return sorted(zip(i.tolist(), j.tolist()))
+
+@pytest.mark.parametrize("n, eps", [(2, 0.5), (50, 0.2), (500, 0.05), (2000, 0.03)])
+def test_contatos_igual_forca_bruta(n, eps):
+    r = RandomState(n).uniform(-1, 1, (n, 3))
+    assert pares(*contatos(r, eps)) == forca_bruta(r, eps)
+
+def test_contatos_aglomerado_e_bordas():
+    # muitos corpos na mesma celula e pares exatamente sobre as bordas
+    aleatorio = RandomState(1)
+    r = aleatorio.normal(0, 0.01, (300, 3))
+    grade = array([[x, y, z] for x in range(4) for y in range(4)
+                   for z in range(4)], dtype=float) * 0.1
+    r = r.tolist() + grade.tolist() + (grade + 0.0999).tolist()
+    r = array(r) - 7.3
+    assert pares(*contatos(r, 0.1)) == forca_bruta(r, 0.1)
+
+def test_contatos_sem_pares():
+    assert len(contatos(array([[0., 0, 0]]), 1.)[0]) == 0
+    r = array([[0., 0, 0], [10, 0, 0], [0, 10, 0]])
+    assert len(contatos(r, 1.)[0]) == 0
+
+def test_contatos_jit():
+    pytest.importorskip("numba")
+    r = RandomState(3).uniform(0, 1, (3000, 3))
+    assert pares(*contatos(r, 0.04, jit=True)) == forca_bruta(r, 0.04)
+
+def test_grupos_encadeados():
+    i = array([0, 1, 5, 7])
+    j = array([1, 2, 6, 9])
+    assert sorted(grupos(i, j)) == [[0, 1, 2], [5, 6], [7, 9]]
+
+def test_proximos():
+    aleatorio = RandomState(2)
+    for ns in (10, 200):
+        r = aleatorio.uniform(-1, 1, (ns, 3))
+        rt = aleatorio.uniform(-1, 1, (500, 3))
+        d = rt[:, None, :] - r[None, :, :]
+        esperado = ((d * d).sum(axis=2) < 0.1**2).any(axis=1)
+        assert (proximos(rt, r, 0.1) == esperado).all()
+    assert not proximos(rt, r[:0], 0.1).any()
+
+def test_fusao_conserva_massa_e_momento():
+    pts = [Particula("a", (0, 0, 0), (1, 0, 0), 1),
+           Particula("b", (EPS / 3, 0, 0), (0, 1, 0), 2),
+           Particula("c", (2 * EPS / 3, 0, 0), (0, 0, 1), 3),
+           Particula("d", (10 * EPS, 0, 0), (0, 0, 0), 1)]
+    corpos = Nbody(pts, headless=True)
+    e = corpos.estado
+    m, p = e.m.sum(), e.p.sum(axis=0)
+    corpos.colisoes()
+    assert corpos.n == 2
+    assert abs(corpos.estado.m.sum() - m) < 1e-12
+    assert abs(corpos.estado.p.sum(axis=0) - p).max() < 1e-12
+    # fica o corpo de maior momento do grupo
+    assert sorted(corpos.estado.labels()) == ["c", "d"]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+from numpy import sqrt
+
+from condicoes import MODELOS, gera, rotulos
+from diagnosticos import cinetica, potencial
+
+@pytest.mark.parametrize("n", [1, 9, 10, 11, 99, 100, 101, 1000, 12345])
+def test_rotulos(n):
+    assert rotulos(n).tolist() == [("p_%d" % k).encode("utf-8") for k in range(1, n + 1)]
+
+def test_rotulos_prefixo():
+    assert rotulos(3, "estrela ").tolist() == [b"estrela 1", b"estrela 2", b"estrela 3"]
+
+@pytest.mark.parametrize("modelo", sorted(MODELOS))
+def test_semente(modelo):
+    a = gera(modelo, 500, semente=7)
+    b = gera(modelo, 500, semente=7)
+    c = gera(modelo, 500, semente=8)
+    assert (a.r == b.r).all() and (a.v == b.v).all() and (a.m == b.m).all()
+    assert not (a.r == c.r).all()
+
+@pytest.mark.parametrize("modelo", sorted(MODELOS))
+def test_massa_e_centro_de_massa(modelo):
+    e = gera(modelo, 3000, M=3., escala=2., G=1.5, semente=1)
+    # o disco tem ainda a massa central (padrao M) no corpo 0
+    M = 6. if modelo == "disco" else 3.
+    assert len(e) == (3001 if modelo == "disco" else 3000)
+    assert abs(e.m.sum() - M) < 1e-12
+    assert sqrt((e.m.dot(e.r)**2).sum()) < 1e-12 * M
+    assert sqrt((e.p.sum(axis=0)**2).sum()) < 1e-12 * M
+    assert e.labels()[:2] == ["p_1", "p_2"]
+
+@pytest.mark.parametrize("modelo", ["plummer", "king", "uniforme"])
+def test_equilibrio_virial(modelo):
+    G = 1.5
+    e = gera(modelo, 4000, M=3., escala=2., G=G, semente=1)
+    Q = 2 * cinetica(e) / abs(potencial(e, G))
+    assert abs(Q - 1) < 0.05
+
+def test_uniforme_frio():
+    e = gera("uniforme", 1000, semente=1, virial=0)
+    assert abs(e.v).max() == 0
+
+def test_modelo_desconhecido():
+    with pytest.raises(ValueError):
+        gera("nenhum", 10)
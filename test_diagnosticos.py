@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import warnings
+
+import pytest
+
+import nbody
+from diagnosticos import Diagnosticos, energia, le_serie, momento, momento_angular
+from nbody import Nbody, sistema_solar
+
+@pytest.fixture
+def eps_solar(monkeypatch):
+    # raio de colisao do modo Sistema Solar
+    monkeypatch.setattr(nbody, "EPS", 0.2)
+
+def test_serie(eps_solar, tmp_path):
+    corpos = Nbody(sistema_solar(), headless=True, integrador="leapfrog")
+    nome = str(tmp_path / "a.diag")
+    diag = Diagnosticos(corpos, a_cada=10, arquivo=nome)
+    E0 = energia(corpos)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        corpos.integracao(float("inf"), ate=55)
+    diag.fechar()
+    s = diag.serie()
+    # o estado inicial e um registro a cada 10 passos
+    assert len(s) == 6
+    assert s["passo"].tolist() == [0, 10, 20, 30, 40, 50]
+    assert s["E"][0] == E0
+    assert abs(s["dE"] - abs(s["E"] / E0 - 1)).max() < 1e-15
+    assert s["dE"].max() < 1e-6
+    assert abs(s["P"][-1] - momento(corpos.estado)).max() < 1e-15
+    assert abs(s["L"] - momento_angular(corpos.estado)).max() < 1e-9
+    assert (s["n"] == 5).all()
+    assert (le_serie(nome) == s).all()
+
+def test_aviso_de_deriva(eps_solar):
+    # Euler com passo grande: a deriva chega a ~7e-4
+    corpos = Nbody(sistema_solar(), headless=True)
+    corpos.dt = 0.2
+    diag = Diagnosticos(corpos, a_cada=5, limite=1e-5)
+    with pytest.warns(RuntimeWarning, match="deriva de energia") as avisos:
+        corpos.integracao(float("inf"), ate=200)
+    s = diag.serie()
+    assert s["dE"].max() > 1e-5
+    # um novo aviso so quando a deriva dobra desde o anterior
+    assert 1 <= len(avisos) < len(s)
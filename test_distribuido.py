@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+
+import distribuido
+import nbody
+from distribuido import Distribuida
+from forcas import Direta
+from test_forcas import aglomerado
+
+def test_distribuida_igual_direta():
+    forca = Distribuida(locais=2)
+    try:
+        for n in (400, 90):
+            r, m = aglomerado(n, semente=n)
+            ref = Direta().aceleracoes(r, m, 1)
+            assert abs(forca.aceleracoes(r, m, 1) - ref).max() == 0
+        # um trabalhador cai: os blocos dele sao refeitos pelo outro
+        forca.processos[0].kill()
+        forca.processos[0].wait()
+        r, m = aglomerado(300)
+        with pytest.warns(RuntimeWarning):
+            a = forca.aceleracoes(r, m, 1)
+        assert abs(a - Direta().aceleracoes(r, m, 1)).max() == 0
+        assert len(forca.ativos) == 1
+        # e um novo entra no passo seguinte
+        forca.inicia_locais(1, espera=30)
+        forca.aceleracoes(r, m, 1)
+        assert abs(forca.aceleracoes(r, m, 1) - Direta().aceleracoes(r, m, 1)).max() == 0
+        assert len(forca.ativos) == 2
+    finally:
+        forca.fechar()
+
+def test_integracao_com_queda_e_entrada(monkeypatch):
+    # teste() troca nbody.EPS para unidades de N corpos
+    monkeypatch.setattr(nbody, "EPS", nbody.EPS)
+    with pytest.warns(RuntimeWarning):
+        forca = distribuido.teste(n=300, locais=2, passos=8, derruba=3, entra=5)
+    # a conferencia inicial, a forca inicial do leapfrog e uma por passo
+    assert len(forca.tempos) == 10
+    assert forca.processos == []
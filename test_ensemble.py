@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+
+import nbody
+from ensemble import ensemble, expande, roda
+
+@pytest.fixture(autouse=True)
+def restaura_eps(monkeypatch):
+    # cada realizacao troca nbody.EPS
+    monkeypatch.setattr(nbody, "EPS", nbody.EPS)
+
+VARREDURA = {"semente": [1, 2, 3], "n": 12, "T": 2., "integrador": "leapfrog"}
+
+def sem_tempo(resultados):
+    '''(list of dict) -> dict
+    Resultados por id, sem o tempo de parede
+    '''
+    return dict((r["id"], dict((k, v) for k, v in r.items() if k != "tempo"))
+                for r in resultados)
+
+def test_expande():
+    confs = expande({"semente": [1, 2], "dt": [0.01, 0.02, 0.04]})
+    assert len(confs) == 6
+    assert [c["id"] for c in confs] == list(range(6))
+    assert set((c["semente"], c["dt"]) for c in confs) == set(
+        (s, d) for s in (1, 2) for d in (0.01, 0.02, 0.04))
+    with pytest.raises(ValueError):
+        expande({"nenhum": [1]})
+
+def test_semente_determina_resultado(tmp_path):
+    a = sem_tempo(ensemble(VARREDURA, str(tmp_path / "a"), processos=2, verbose=False))
+    b = sem_tempo(ensemble(VARREDURA, str(tmp_path / "b"), processos=3, verbose=False))
+    assert a == b
+    # em processo, fora do pool, o resultado e o mesmo
+    c = expande(VARREDURA)[1]
+    assert sem_tempo([roda(c, str(tmp_path))]) == {1: a[1]}
+    # sementes diferentes, sistemas diferentes
+    assert len(set(r["E0"] for r in a.values())) == 3
+
+def test_retoma_varredura(tmp_path):
+    saida = str(tmp_path / "a")
+    a = ensemble(VARREDURA, saida, processos=2, verbose=False)
+    # tudo ja gravado: nada e refeito
+    b = ensemble(VARREDURA, saida, processos=2, verbose=False)
+    assert sorted(a, key=lambda r: r["id"]) == sorted(b, key=lambda r: r["id"])
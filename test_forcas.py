@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+from numpy import array, sqrt, zeros
+from numpy.random import RandomState
+
+from forcas import Direta, Direta32, acel_fontes, cria_forca, relatorio_precisao
+
+def aglomerado(n, semente=0):
+    '''(int, int) -> (array, array)
+    Posicoes e massas aleatorias, como no modo [G]erar particulas
+    '''
+    aleatorio = RandomState(semente)
+    return (aleatorio.triangular(-100, 0, 100, (n, 3)),
+            aleatorio.triangular(0.7, 35, 70, n))
+
+def soma_laco(r, m, G):
+    '''(array, array, float) -> array
+    Soma direta par a par, em laco, como no codigo original
+    '''
+    a = zeros((len(m), 3))
+    for i in range(len(m)):
+        for j in range(len(m)):
+            if i != j:
+                d = r[j] - r[i]
+                a[i] += G * m[j] * d / sqrt(d.dot(d))**3
+    return a
+
+def erro_relativo(a, ref):
+    '''(array, array) -> float
+    Maior erro relativo da aceleracao de um corpo
+    '''
+    return (sqrt(((a - ref)**2).sum(axis=1) / (ref * ref).sum(axis=1))).max()
+
+def test_direta_igual_laco():
+    r, m = aglomerado(40)
+    assert erro_relativo(Direta().aceleracoes(r, m, 2.), soma_laco(r, m, 2.)) < 1e-13
+
+def test_direta_em_blocos():
+    r, m = aglomerado(300)
+    ref = Direta().aceleracoes(r, m, 1)
+    for bloco in (1, 300, 1000, 300 * 299):
+        assert abs(Direta(bloco).aceleracoes(r, m, 1) - ref).max() == 0
+
+def test_direta_alvos():
+    r, m = aglomerado(200)
+    alvos = array([3, 0, 199, 57])
+    ref = Direta().aceleracoes(r, m, 1)[alvos]
+    assert erro_relativo(Direta().aceleracoes_alvos(r, m, 1, alvos), ref) < 1e-13
+
+def test_terceira_lei():
+    r, m = aglomerado(500)
+    f = Direta().aceleracoes(r, m, 1) * m[:, None]
+    assert sqrt((f.sum(axis=0)**2).sum()) < 1e-12 * sqrt((f * f).sum(axis=1)).sum()
+
+def test_fontes_igual_direta():
+    # particulas de teste nas posicoes de corpos de massa nula
+    r, m = aglomerado(150)
+    rt = RandomState(1).uniform(-150, 150, (70, 3))
+    for ns in (20, 150):
+        rr = r[:ns].tolist() + rt.tolist()
+        mm = m[:ns].tolist() + [0.] * len(rt)
+        ref = Direta().aceleracoes(array(rr), array(mm), 1)[ns:]
+        assert erro_relativo(acel_fontes(rt, r[:ns], m[:ns], 1, bloco=500), ref) < 1e-13
+
+def test_direta32_longe_da_origem():
+    # a origem local das posicoes mantem o erro de float32 pequeno
+    r, m = aglomerado(1000)
+    r += 1000
+    ref = Direta().aceleracoes(r, m, 1)
+    a = Direta32(bloco=10**5).aceleracoes(r, m, 1)
+    assert a.dtype == ref.dtype
+    assert erro_relativo(a, ref) < 1e-4
+    alvos = array([5, 999, 0, 700])
+    assert erro_relativo(Direta32().aceleracoes_alvos(r, m, 1, alvos), ref[alvos]) < 1e-4
+
+def test_relatorio_precisao():
+    r, m = aglomerado(300)
+    linhas = relatorio_precisao(r, m)
+    assert [l["forca"] for l in linhas] == ["direto", "direto32"]
+    assert linhas[0]["erro_max"] == 0
+    assert linhas[1]["erro_max"] < 1e-4
+    assert linhas[1]["terceira_lei"] < 1e-6
+
+def test_cria_forca():
+    assert cria_forca().nome == "direto"
+    assert cria_forca("direto32").nome == "direto32"
+    with pytest.raises(ValueError):
+        cria_forca("nenhum")
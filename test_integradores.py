@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+
+import nbody
+from diagnosticos import energia
+from integradores import cria_integrador
+from nbody import Nbody, sistema_solar
+from perfil import Perfil
+
+@pytest.fixture
+def eps_solar(monkeypatch):
+    # raio de colisao do modo Sistema Solar
+    monkeypatch.setattr(nbody, "EPS", 0.2)
+
+def solar(integrador, dt=20/120):
+    '''(str, float) -> Nbody'''
+    corpos = Nbody(sistema_solar(), headless=True, integrador=integrador)
+    corpos.dt = dt
+    return corpos
+
+def erro_energia(corpos, tempo):
+    '''(Nbody, float) -> float
+    Erro relativo de energia ao integrar por tempo
+    '''
+    e0 = energia(corpos)
+    corpos.integracao(tempo)
+    return abs(energia(corpos) / e0 - 1)
+
+@pytest.mark.parametrize("nome, limite", [("euler", 1e-3), ("leapfrog", 1e-6),
+                                          ("yoshida4", 1e-8), ("rk4", 1e-4)])
+def test_energia_sistema_solar(eps_solar, nome, limite):
+    corpos = solar(nome)
+    assert erro_energia(corpos, 20) < limite
+    assert corpos.n == 5
+
+def posicoes(integrador, dt, passos):
+    '''(str, float, int) -> array
+    Posicoes no Sistema Solar apos um numero fixo de passos
+    '''
+    corpos = solar(integrador, dt)
+    corpos.integracao(float("inf"), ate=passos)
+    return corpos.estado.r
+
+@pytest.mark.parametrize("nome, ordem", [("leapfrog", 2), ("yoshida4", 4), ("rk4", 4)])
+def test_ordem(eps_solar, nome, ordem):
+    # com metade do passo o erro em 5 anos cai por 2^ordem
+    ref = posicoes("yoshida4", 1/96, 480)
+    e1 = abs(posicoes(nome, 1/6, 30) - ref).max()
+    e2 = abs(posicoes(nome, 1/12, 60) - ref).max()
+    assert 0.7 * 2**ordem < e1 / e2 < 1.4 * 2**ordem
+
+def test_leapfrog_reversivel(eps_solar):
+    corpos = solar("leapfrog")
+    r0, v0 = corpos.estado.r.copy(), corpos.estado.v.copy()
+    corpos.integracao(10)
+    # inverte as velocidades e integra o mesmo tempo
+    corpos.integrador.reinicia()
+    corpos.estado.v[:] *= -1
+    corpos.estado.p[:] *= -1
+    corpos.integracao(10)
+    assert abs(corpos.estado.r - r0).max() < 1e-9
+    assert abs(-corpos.estado.v - v0).max() < 1e-9
+
+def test_cria_integrador():
+    assert cria_integrador("leapfrog").nome == "leapfrog"
+    with pytest.raises(ValueError):
+        cria_integrador("nenhum")
+
+def test_blocos(eps_solar):
+    corpos = solar("blocos")
+    assert erro_energia(corpos, 10) < 1e-7
+    b = corpos.integrador
+    # cada corpo no seu nivel: menos forcas que todos no nivel mais fino
+    assert b.avaliacoes < b.avaliacoes_global
+    assert len(set(b.nivel_id.tolist())) > 1
+
+def test_wisdom_holman_no_perfil(eps_solar):
+    corpos = solar("wh")
+    corpos.perfil = Perfil(0)
+    assert erro_energia(corpos, 10) < 1e-7
+    cont = corpos.perfil.cont_janela
+    # uma forca por passo entre os 4 corpos nao centrais
+    assert cont["forcas"] == corpos.forcas == cont["passos"] + 1
+    assert cont["pares"] == cont["forcas"] * 4 * 3
+    assert corpos.perfil.janela["forca"] > 0
+
+def afastado():
+    '''() -> list of Particula
+    Outro Sistema Solar com os mesmos 5 corpos em raios maiores
+    '''
+    pts = sistema_solar()
+    for p in pts[1:]:
+        p.r = p.r.multiply(1.3)
+    return pts
+
+@pytest.mark.parametrize("nome", ["leapfrog", "yoshida4", "wh", "blocos"])
+def test_troca_estado_mesmo_n(eps_solar, nome):
+    ref = solar(nome)
+    ref.set_bodies(afastado())
+    ref.integracao(float("inf"), ate=1)
+
+    # o integrador nao pode partir das aceleracoes dos corpos anteriores
+    corpos = solar(nome)
+    corpos.integracao(float("inf"), ate=3)
+    corpos.passos = 0
+    corpos.set_bodies(afastado())
+    corpos.integracao(float("inf"), ate=1)
+    assert (corpos.estado.r == ref.estado.r).all()
+
+    # nem com a troca direta do estado
+    corpos = solar(nome)
+    corpos.integracao(float("inf"), ate=3)
+    corpos.passos = 0
+    corpos.estado = Nbody(afastado(), headless=True).estado
+    corpos.integracao(float("inf"), ate=1)
+    assert (corpos.estado.r == ref.estado.r).all()
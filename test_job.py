@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import os
+import signal
+
+import pytest
+
+import checkpoint
+import job
+import nbody
+
+@pytest.fixture(autouse=True)
+def restaura(monkeypatch):
+    # roda troca nbody.EPS e o Salvador, os tratadores de SIGTERM / SIGINT
+    monkeypatch.setattr(nbody, "EPS", nbody.EPS)
+    tratadores = dict((s, signal.getsignal(s)) for s in (signal.SIGTERM, signal.SIGINT))
+    yield
+    for s, f in tratadores.items():
+        signal.signal(s, f)
+
+def parametros(saida, **outros):
+    '''(Path, ...) -> dict'''
+    args = dict(modo="aleatorio", n=15, T=1., integrador="leapfrog",
+                saida=str(saida), checkpoint_passos=50)
+    args.update(outros)
+    return job.le_job(**args)
+
+def test_interrompe_e_retoma(tmp_path, monkeypatch):
+    ref = job.roda(parametros(tmp_path / "ref"))
+    assert ref["passos"] == job.total_passos(1., 1 / 120)
+
+    # SIGTERM no passo 37: o Salvador grava o checkpoint e encerra
+    inicia = job.inicia
+    def inicia_e_interrompe(params):
+        corpos = inicia(params)
+        corpos.a_cada(37, lambda c: c.passos == 37 and os.kill(os.getpid(), signal.SIGTERM))
+        return corpos
+    monkeypatch.setattr(job, "inicia", inicia_e_interrompe)
+    params = parametros(tmp_path / "job")
+    with pytest.raises(SystemExit) as saida:
+        job.roda(params)
+    assert saida.value.code == 128 + signal.SIGTERM
+    nome = str(tmp_path / "job" / "estado.ckpt")
+    assert checkpoint.carrega(nome)[1]["passos"] == 37
+
+    res = job.roda(params)
+    assert res["passos"] == ref["passos"]
+    assert res["deriva_energia"] == ref["deriva_energia"]
+    e, _ = checkpoint.carrega(str(tmp_path / "job" / "final.ckpt"))
+    e_ref, _ = checkpoint.carrega(str(tmp_path / "ref" / "final.ckpt"))
+    assert (e.r == e_ref.r).all() and (e.v == e_ref.v).all()
+    assert e.labels() == e_ref.labels()
+    arq = open(str(tmp_path / "job" / "final.txt"))
+    txt = arq.read()
+    arq.close()
+    arq = open(str(tmp_path / "ref" / "final.txt"))
+    assert txt == arq.read()
+    arq.close()
+
+def test_outro_job_na_mesma_saida(tmp_path):
+    job.roda(parametros(tmp_path, T=0.1))
+    with pytest.raises(ValueError):
+        job.roda(parametros(tmp_path, T=0.1, semente=2))
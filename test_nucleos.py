@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import os
+import subprocess
+import sys
+
+import pytest
+from numpy import array
+
+import nucleos
+from forcas import Direta, cria_forca
+from test_forcas import aglomerado, erro_relativo
+
+def test_nbody_nao_importa_numba():
+    # o Numba so e importado com forca="numba" ou contatos(..., jit=True)
+    saida = subprocess.check_output([sys.executable, "-c",
+        "import sys, nbody; print('numba' in sys.modules or 'nucleos' in sys.modules)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert saida.strip() == b"False"
+
+def test_sem_numba_usa_direta(monkeypatch):
+    monkeypatch.setattr(nucleos, "NUMBA", False)
+    r, m = aglomerado(200)
+    forca = cria_forca("numba")
+    assert forca.nome == "numba"
+    assert abs(forca.aceleracoes(r, m, 1) - Direta().aceleracoes(r, m, 1)).max() == 0
+
+@pytest.mark.skipif(not nucleos.NUMBA, reason="Numba nao instalado")
+@pytest.mark.parametrize("n", [2, 129, 1000])
+def test_compara_forcas(n):
+    assert nucleos.compara_forcas(n) < 1e-12
+
+@pytest.mark.skipif(not nucleos.NUMBA, reason="Numba nao instalado")
+def test_compara_contatos():
+    assert nucleos.compara_contatos(5000, 0.06)
+
+@pytest.mark.skipif(not nucleos.NUMBA, reason="Numba nao instalado")
+def test_diretajit_igual_direta():
+    r, m = aglomerado(700)
+    ref = Direta().aceleracoes(r, m, 2)
+    forca = cria_forca("numba", ladrilho=64)
+    assert erro_relativo(forca.aceleracoes(r, m, 2), ref) < 1e-12
+    alvos = array([699, 0, 350])
+    assert erro_relativo(forca.aceleracoes_alvos(r, m, 2, alvos), ref[alvos]) < 1e-12
+
+@pytest.mark.skipif(not nucleos.NUMBA, reason="Numba nao instalado")
+def test_fork_depois_dos_nucleos():
+    # como no benchmark.py: nucleos paralelos e depois o backend paralelo
+    # no mesmo processo; com o TBB a saida do processo travava
+    codigo = ("import nucleos, forcas\n"
+              "from test_forcas import aglomerado\n"
+              "nucleos.compara_forcas(300)\n"
+              "f = forcas.cria_forca('paralelo', processos=2)\n"
+              "r, m = aglomerado(100)\n"
+              "f.aceleracoes(r, m, 1)\n"
+              "f.fechar()\n")
+    subprocess.check_call([sys.executable, "-c", codigo], timeout=120,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+
+import paralelo
+from forcas import Direta, cria_forca
+from test_forcas import aglomerado
+
+def test_paralela_igual_direta():
+    forca = cria_forca("paralelo", processos=2, blocos=5)
+    try:
+        # n cresce (realoca) e depois diminui (reaproveita a memoria)
+        for n in (300, 700, 50):
+            r, m = aglomerado(n, semente=n)
+            ref = Direta().aceleracoes(r, m, 1.5)
+            assert abs(forca.aceleracoes(r, m, 1.5) - ref).max() == 0
+    finally:
+        forca.fechar()
+    assert forca.shm == {} and forca.pool is None
+
+def test_sem_memoria_compartilhada(monkeypatch):
+    monkeypatch.setattr(paralelo, "shared_memory", None)
+    with pytest.raises(RuntimeError):
+        cria_forca("paralelo")
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+from numpy import array, concatenate, sqrt
+from numpy.random import RandomState
+
+from forcas import Direta
+from pm import ParticulaMalha, relatorio
+from test_forcas import aglomerado
+
+def test_p3m_proximo_da_direta():
+    r, m = aglomerado(2000)
+    pm, p3m = relatorio(r, m, malhas=(32,))
+    assert pm["pares"] == 0
+    assert 0 < p3m["pares"] < 2000 * 1999 // 2
+    assert p3m["erro_mediano"] < 5e-3
+    assert p3m["erro_p99"] < 2e-2
+    assert p3m["erro_mediano"] < pm["erro_mediano"] / 10
+
+def test_pm_campo_distante():
+    # dois aglomerados afastados: a forca de um sobre o outro e suave e a
+    # malha, mesmo sem correcao, acerta a aceleracao do centro de massa
+    aleatorio = RandomState(4)
+    r = concatenate((aleatorio.normal(0, 1, (300, 3)),
+                     aleatorio.normal(0, 1, (300, 3)) + array([60., 0, 0])))
+    m = aleatorio.uniform(0.5, 1.5, 600)
+    ref = Direta().aceleracoes(r, m, 1)
+    a = ParticulaMalha(64).aceleracoes(r, m, 1)
+    for k in (slice(0, 300), slice(300, 600)):
+        cm = (m[k, None] * a[k]).sum(axis=0) / m[k].sum()
+        cm_ref = (m[k, None] * ref[k]).sum(axis=0) / m[k].sum()
+        assert sqrt(((cm - cm_ref)**2).sum() / (cm_ref**2).sum()) < 1e-3
+
+def test_momento_total():
+    # a funcao de Green e simetrica: a malha respeita a 3a lei
+    r, m = aglomerado(1000)
+    for p3m in (False, True):
+        f = ParticulaMalha(32, p3m=p3m).aceleracoes(r, m, 1) * m[:, None]
+        assert sqrt((f.sum(axis=0)**2).sum()) < 1e-12 * sqrt((f * f).sum(axis=1)).sum()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import pytest
+from numpy import cos, pi, sin, sqrt
+
+import nbody
+import satelite
+from nbody import Nbody, sistema_solar
+from particula import Particula
+
+@pytest.fixture
+def eps_solar(monkeypatch):
+    # raio de colisao do modo Sistema Solar
+    monkeypatch.setattr(nbody, "EPS", 0.2)
+
+def anel(n=40, raio=2.5):
+    '''(int, float) -> list of Particula
+    Particulas de teste em orbitas circulares em torno do Sol (massa 1)
+    '''
+    pts = []
+    for k in range(n):
+        a = 2 * pi * k / n
+        pts.append(Particula("t_%d" % k, (raio * cos(a), 0, raio * sin(a)),
+                             (-sin(a) / sqrt(raio), 0, cos(a) / sqrt(raio)), 1e-12))
+    return pts
+
+@pytest.mark.parametrize("nome, limite", [("leapfrog", 1e-3), ("wh", 1e-9)])
+def test_orbita_circular(eps_solar, nome, limite):
+    # Sol e particula de teste: a orbita de Kepler e exata
+    corpos = Nbody([Particula("Sol", (0, 0, 0), (0, 0, 0), 1)],
+                   headless=True, integrador=nome)
+    corpos.dt = 0.01
+    corpos.set_testes(anel(4))
+    r0 = corpos.testes.r.copy()
+    T = 2 * pi * 2.5**1.5
+    corpos.integracao(float("inf"), ate=300)
+    wt = 2 * pi * corpos.t / T
+    # rotacao de r0 por wt em torno de y, no sentido de z para x
+    x = r0[:, 0] * cos(wt) - r0[:, 2] * sin(wt)
+    z = r0[:, 0] * sin(wt) + r0[:, 2] * cos(wt)
+    assert abs(corpos.testes.r[:, 0] - x).max() < limite * 2.5
+    assert abs(corpos.testes.r[:, 2] - z).max() < limite * 2.5
+    assert abs(corpos.testes.r[:, 1]).max() == 0
+
+@pytest.mark.parametrize("nome", ["leapfrog", "yoshida4", "wh"])
+def test_testes_nao_mudam_os_corpos(eps_solar, nome):
+    ref = Nbody(sistema_solar(), headless=True, integrador=nome)
+    ref.integracao(3)
+    corpos = Nbody(sistema_solar(), headless=True, integrador=nome)
+    corpos.set_testes(anel())
+    corpos.integracao(3)
+    assert len(corpos.testes) == 40
+    assert (corpos.estado.r == ref.estado.r).all()
+    assert (corpos.estado.v == ref.estado.v).all()
+
+def test_colisao_com_particula_de_teste(eps_solar):
+    corpos = Nbody(sistema_solar(), headless=True, integrador="leapfrog")
+    pts = anel(4, raio=1.1)
+    # uma delas cai em direcao ao Sol
+    pts[0] = Particula("cai", (1.1, 0, 0), (0, 0, 0), 1e-12)
+    corpos.set_testes(pts)
+    corpos.integracao(2)
+    assert sorted(corpos.testes.labels()) == ["t_1", "t_2", "t_3"]
+    assert corpos.n == 5
+
+def test_checkpoint_com_testes(eps_solar, tmp_path):
+    corpos = Nbody(sistema_solar(), headless=True, integrador="leapfrog")
+    corpos.set_testes(anel())
+    corpos.integracao(1)
+    nome = str(tmp_path / "testes.ckpt")
+    corpos.salva_checkpoint(nome)
+    corpos.integracao(1)
+
+    retomado = Nbody(headless=True, integrador="leapfrog")
+    retomado.carrega_checkpoint(nome)
+    assert retomado.testes.labels() == ["t_%d" % k for k in range(40)]
+    retomado.integracao(1)
+    for campo in ("r", "v", "p", "m"):
+        assert (getattr(retomado.testes, campo) == getattr(corpos.testes, campo)).all()
+    assert (retomado.estado.r == corpos.estado.r).all()
+
+@pytest.mark.parametrize("nome", ["leapfrog", "wh"])
+def test_periodo_do_satelite(monkeypatch, nome):
+    # satelite.cria troca nbody.EPS para o raio da Terra
+    monkeypatch.setattr(nbody, "EPS", nbody.EPS)
+    corpos = satelite.cria(integrador=nome)
+    # 2 periodos bastam: o passo de 60 s erra o periodo em ~0.01 h
+    contador = satelite.MeiasVoltas(corpos, N=2)
+    corpos.integracao(3e7)
+    assert abs(contador.periodo / 3600 - 14.82) < 0.02
+    assert corpos.n == 1 and len(corpos.testes) == 1
+
+def test_satelite_colide(monkeypatch):
+    monkeypatch.setattr(nbody, "EPS", nbody.EPS)
+    corpos = satelite.cria(v0=1e3)
+    contador = satelite.MeiasVoltas(corpos)
+    corpos.integracao(3e7)
+    assert contador.periodo is None
+    assert len(corpos.testes) == 0 and corpos.t < 3e7
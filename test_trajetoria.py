@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import random
+
+import pytest
+from numpy import float32
+
+from nbody import Nbody, EPS, gera_aleatorias
+from particula import Particula
+from trajetoria import Gravador, Trajetoria
+
+def fundidos():
+    '''() -> Nbody
+    Corpos afastados, com pares a menos de EPS que se fundem no 1o passo,
+    deixando ids salteados
+    '''
+    pts = []
+    for k in range(8):
+        pts.append(Particula("p_%d" % k, (20. * EPS * k, 0, 0), (0, 0, 0), 1))
+        if k % 2 == 0:
+            pts.append(Particula("q_%d" % k, (20. * EPS * k + EPS / 2, 0, 0), (0, 0, 0), 1))
+    corpos = Nbody(pts, headless=True, integrador="leapfrog")
+    corpos.integracao(corpos.dt, ate=1)
+    return corpos
+
+def grava_retomado(pasta):
+    '''(Path) -> (Nbody, str)
+    Salva e recarrega o checkpoint dos corpos fundidos e grava a
+    trajetoria a partir dele, retornando os corpos e o arquivo
+    '''
+    corpos = fundidos()
+    assert corpos.n == 8
+    assert corpos.estado.ids.max() >= corpos.n
+    ckpt = str(pasta / "fusoes.ckpt")
+    corpos.salva_checkpoint(ckpt)
+
+    retomado = Nbody(headless=True, integrador="leapfrog")
+    retomado.carrega_checkpoint(ckpt)
+    nome = str(pasta / "fusoes.traj")
+    g = Gravador(retomado, nome, a_cada=2)
+    retomado.integracao(10 * retomado.dt)
+    g.fechar()
+    return corpos, nome
+
+def test_grava_checkpoint_com_fusoes(tmp_path):
+    corpos, nome = grava_retomado(tmp_path)
+    traj = Trajetoria(nome)
+    assert traj.ids == corpos.estado.ids.tolist()
+    assert traj.labels == corpos.estado.labels()
+    assert len(traj) == 6
+    for f in range(len(traj)):
+        ids, r, m, t = traj.quadro(f)
+        assert set(ids.tolist()) <= set(traj.ids)
+    ids, r, m, t = traj.quadro(0)
+    assert (r == corpos.estado.r.astype(float32)).all()
+
+def test_reproduz_checkpoint_com_fusoes(tmp_path):
+    pytest.importorskip("visual")
+    from trajetoria import Reprodutor
+    corpos, nome = grava_retomado(tmp_path)
+    rep = Reprodutor(nome)
+    for f in range(len(rep.traj)):
+        rep.desenha(f)
+    assert sorted(rep.pontos) == sorted(rep.traj.ids)
+
+def test_ida_e_volta(tmp_path):
+    random.seed(5)
+    corpos = Nbody(gera_aleatorias(12), headless=True, integrador="leapfrog")
+    nome = str(tmp_path / "a.traj")
+    quadros = []
+    corpos.a_cada(3, lambda c: quadros.append((c.estado.ids.copy(),
+                                               c.estado.r.copy(),
+                                               c.estado.m.copy(), c.t)))
+    g = Gravador(corpos, nome, a_cada=3, bloco=4)
+    corpos.integracao(30 * corpos.dt)
+    g.fechar()
+
+    traj = Trajetoria(nome)
+    assert len(traj) == len(quadros) + 1
+    for f, (ids0, r0, m0, t0) in enumerate(quadros):
+        ids, r, m, t = traj.quadro(f + 1)
+        assert (ids == ids0).all()
+        assert (r == r0.astype(float32)).all()
+        assert (m == m0.astype(float32)).all()
+        assert t == t0
+
+def test_le_enquanto_grava(tmp_path):
+    random.seed(5)
+    corpos = Nbody(gera_aleatorias(5), headless=True)
+    nome = str(tmp_path / "a.traj")
+    g = Gravador(corpos, nome, a_cada=1, bloco=4)
+    traj = Trajetoria(nome)
+    # nada descarregado ainda: o indice nunca aponta para dados pendentes
+    assert len(traj) == 0
+    corpos.integracao(4 * corpos.dt)
+    traj.atualiza()
+    assert len(traj) == 4
+    g.fechar()
+    traj.atualiza()
+    assert len(traj) == 5
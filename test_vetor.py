@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+from numpy import array
+
+from forcas import Direta
+from particula import Particula
+from vetor import Vetor
+
+def test_operacoes_no_lugar():
+    a, b = Vetor((1.5, -2., 0.25)), Vetor((0.1, 3., -7.))
+    u = Vetor(a.to_list())
+    u += b
+    assert u == a + b
+    u = Vetor(a.to_list())
+    u -= b
+    assert u == a - b
+    u = Vetor(a.to_list())
+    u *= -0.3
+    assert u == a.multiply(-0.3)
+    u = Vetor(a.to_list())
+    assert u.axpy(2.5, b) is u
+    assert u == a + b.multiply(2.5)
+    # os operandos nao mudam
+    assert a.to_list() == [1.5, -2., 0.25] and b.to_list() == [0.1, 3., -7.]
+
+def test_slots():
+    assert not hasattr(Vetor(), "__dict__")
+    assert not hasattr(Particula("a"), "__dict__")
+
+def test_gravity_into_igual_direta():
+    p = Particula("a", (1., 2., -1.), mass=3.)
+    q = Particula("b", (-2., 0.5, 4.), mass=0.7)
+    acel = Direta().aceleracoes(array([p._r, q._r]), array([p.m, q.m]), 1.3)
+    f = Vetor((0.5, 0., 0.))
+    assert p.gravity_into(q, 1.3, f) is f
+    # gravity_into soma em f a forca (massa x aceleracao)
+    ref = acel[0] * p.m + array([0.5, 0., 0.])
+    assert abs(array(f.to_list()) - ref).max() < 1e-15 * abs(ref).max()
+    g = q.gravity(p, 1.3)
+    assert abs(array(g.to_list()) - acel[1] * q.m).max() < 1e-15 * abs(ref).max()
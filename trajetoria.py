@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+import json
+import os
+import struct
+from math import pi
+
+from numpy import dtype, float32, int32, isnan, memmap, ndarray, zeros
+
+# assinatura do arquivo de trajetoria
+MAGICO = b"NBODYTR1"
+
+# registro do indice de quadros: posicao no arquivo, corpos, tempo e passo
+INDICE = dtype([("pos", "<i8"), ("n", "<i8"), ("t", "<f8"), ("passo", "<i8")])
+
+class Gravador(object):
+    """Grava quadros da simulacao a cada k passos num arquivo de trajetoria"""
+
+    def __init__(self, corpos, nome, a_cada=10, bloco=64):
+        '''(Gravador, Nbody, str, int, int) -> None
+        Cria o arquivo `nome` (dados) e `nome.idx` (indice de quadros),
+        grava o quadro inicial e passa a gravar a cada `a_cada` passos;
+        os quadros sao escritos em blocos de `bloco` quadros
+        '''
+        # binarias regularizadas sao gravadas nos seus dois componentes
+        e = corpos.completo()
+        cab = {"labels": e.labels(), "cores": e.cores().tolist(),
+               "ids": e.ids.tolist(), "G": corpos.G, "a_cada": a_cada}
+        txt = json.dumps(cab).encode("utf-8")
+        self.dados = open(nome, "wb")
+        self.dados.write(MAGICO)
+        self.dados.write(struct.pack("<Q", len(txt)))
+        self.dados.write(txt)
+        # o cabecalho vai logo para o disco: um Reprodutor ja pode abrir o
+        # arquivo antes do primeiro bloco de quadros
+        self.dados.flush()
+        self.indice = open(nome + ".idx", "wb")
+        self.pos = self.dados.tell()
+        self.bloco = bloco
+        self.quadros = []
+        self.grava(corpos)
+        corpos.a_cada(a_cada, self.grava)
+
+    def grava(self, corpos):
+        '''(Gravador, Nbody) -> None
+        Guarda o quadro atual: ids, posicoes e massas em precisao simples
+        '''
+        e = corpos.completo()
+        n = len(e)
+        q = (e.ids.astype(int32).tobytes() + e.r.astype(float32).tobytes() +
+             e.m.astype(float32).tobytes())
+        reg = zeros(1, dtype=INDICE)
+        reg["pos"], reg["n"], reg["t"], reg["passo"] = self.pos, n, corpos.t, corpos.passos
+        self.quadros.append((q, reg.tobytes()))
+        self.pos += len(q)
+        if len(self.quadros) >= self.bloco:
+            self.descarrega()
+
+    def descarrega(self):
+        '''(Gravador) -> None
+        Escreve os quadros pendentes, primeiro os dados e depois o indice,
+        de modo que o indice nunca aponta para dados incompletos
+        '''
+        self.dados.write(b"".join([q for q, _ in self.quadros]))
+        self.dados.flush()
+        self.indice.write(b"".join([i for _, i in self.quadros]))
+        self.indice.flush()
+        self.quadros = []
+
+    def fechar(self):
+        '''(Gravador) -> None
+        Escreve os quadros pendentes e fecha os arquivos
+        '''
+        self.descarrega()
+        self.dados.close()
+        self.indice.close()
+
+class Trajetoria(object):
+    """Leitura por mmap de um arquivo de trajetoria"""
+
+    def __init__(self, nome):
+        '''(Trajetoria, str) -> None
+        Le o cabecalho e mapeia dados e indice
+        '''
+        self.nome = nome
+        arq = open(nome, "rb")
+        if arq.read(len(MAGICO)) != MAGICO:
+            arq.close()
+            raise ValueError("Arquivo de trajetoria invalido: %s" % nome)
+        k = struct.unpack("<Q", arq.read(8))[0]
+        cab = json.loads(arq.read(k).decode("utf-8"))
+        arq.close()
+        self.labels = cab["labels"]
+        self.cores = cab["cores"]
+        # arquivos antigos nao guardam os ids: eram 0..n-1
+        self.ids = cab.get("ids", list(range(len(self.labels))))
+        self.G = cab["G"]
+        self.atualiza()
+
+    def atualiza(self):
+        '''(Trajetoria) -> None
+        Remapeia o arquivo, vendo os quadros gravados desde a ultima leitura
+        '''
+        nq = os.path.getsize(self.nome + ".idx") // INDICE.itemsize
+        self.indice = zeros(0, dtype=INDICE)
+        if nq > 0:
+            self.indice = memmap(self.nome + ".idx", dtype=INDICE, mode="r",
+                                 shape=(nq,))
+            self.mm = memmap(self.nome, dtype="u1", mode="r")
+
+    def __len__(self):
+        return len(self.indice)
+
+    def quadro(self, f):
+        '''(Trajetoria, int) -> (array, array, array, float)
+        Retorna ids, posicoes, massas e tempo do quadro f, sem copias
+        '''
+        pos, n, t = int(self.indice[f]["pos"]), int(self.indice[f]["n"]), self.indice[f]["t"]
+        ids = ndarray((n,), dtype=int32, buffer=self.mm, offset=pos)
+        r = ndarray((n, 3), dtype=float32, buffer=self.mm, offset=pos + 4*n)
+        m = ndarray((n,), dtype=float32, buffer=self.mm, offset=pos + 16*n)
+        return ids, r, m, float(t)
+
+class Reprodutor(object):
+    """Reproduz uma trajetoria gravada nas esferas do VPython, sem fisica"""
+
+    def __init__(self, nome, velocidade=1, fps=60):
+        '''(Reprodutor, str, int, int) -> None
+        velocidade: quadros avancados por atualizacao da tela
+        (negativa reproduz de tras para frente)
+        '''
+        from nbody import carrega_visual, RHO
+        self.visual = carrega_visual()
+        self.rho = RHO
+        self.traj = Trajetoria(nome)
+        self.velocidade = velocidade
+        self.fps = fps
+        self.f = 0
+        self.pause = False
+        self.trail = False
+        self.center = 0
+        self.verbose = False
+        # esferas indexadas pelo id do corpo, que deixa de ser 0..n-1
+        # depois de fusoes
+        self.pontos = {}
+        for i, cor in zip(self.traj.ids, self.traj.cores):
+            self.pontos[i] = self.esfera(cor)
+
+    def esfera(self, cor=None):
+        '''(Reprodutor, list) -> sphere
+        Cria uma esfera invisivel ate o primeiro quadro em que aparece
+        '''
+        if cor is None or isnan(cor[0]):
+            cor = self.visual.color.white
+        return self.visual.sphere(radius=0, make_trail=self.trail, retain=100,
+                                  color=tuple(cor), material=self.visual.materials.marble)
+
+    def raio(self, m):
+        '''(Reprodutor, float) -> float
+        Raio da esfera, o mesmo usado em Nbody.make_stars
+        '''
+        return 15 * (m * 3. / self.rho / 4. / (pi**2))**(1/3)
+
+    def desenha(self, f):
+        '''(Reprodutor, int) -> None
+        Posiciona as esferas no quadro f
+        '''
+        vs = self.visual
+        ids, r, m, t = self.traj.quadro(f)
+        vivos = set(ids.tolist())
+        for i, s in self.pontos.items():
+            s.visible = i in vivos
+        for k, i in enumerate(ids.tolist()):
+            if i not in self.pontos:
+                # corpo ausente do cabecalho
+                self.pontos[i] = self.esfera()
+            s = self.pontos[i]
+            s.pos = vs.vector(float(r[k, 0]), float(r[k, 1]), float(r[k, 2]))
+            s.radius = self.raio(float(m[k]))
+        if self.verbose:
+            print("::%d Corpos - (%.2f anos) - quadro %d/%d::" % (
+                  len(ids), t, f + 1, len(self.traj)))
+            self.verbose = False
+        if self.center == 1:
+            c = (m[:, None] * r).sum(axis=0) / m.sum()
+            vs.scene.center = c.tolist()
+        elif self.center == 2:
+            vs.scene.center = r[m.argmax()].tolist()
+
+    def key_input(self, ev):
+        '''(Reprodutor, event) -> None
+        Mesmas teclas de Nbody.key_input:
+        p/r pausa e continua, t/T diminuem/aumentam a velocidade (abaixo
+        de 1 inverte o sentido), g/G voltam/avancam 10% da trajetoria
+        '''
+        vs = self.visual
+        if ev.key == "o":
+            self.trail = not self.trail
+            for s in self.pontos.values():
+                s.make_trail = self.trail
+        elif ev.key == "c":
+            self.center = 0 if self.center == 1 else 1
+            print("Center: ", self.center)
+        elif ev.key == "C":
+            self.center = 0 if self.center == 2 else 2
+            print("Center: ", self.center)
+        elif ev.key in ("v", "V"):
+            self.verbose = True
+        elif ev.key == "Z":
+            vs.scene.range -= vs.vector(vs.scene.range.x / 10)
+        elif ev.key == "z":
+            vs.scene.range += vs.vector(vs.scene.range.x / 10)
+        elif ev.key == "p":
+            self.pause = True
+        elif ev.key == "r":
+            self.pause = False
+        elif ev.key == "g":
+            self.f = max(0, self.f - max(1, len(self.traj) // 10))
+        elif ev.key == "G":
+            self.f = min(len(self.traj) - 1, self.f + max(1, len(self.traj) // 10))
+        elif ev.key == "t":
+            self.velocidade -= 1
+            if self.velocidade == 0:
+                self.velocidade = -1
+            print("Velocidade: ", self.velocidade)
+        elif ev.key == "T":
+            self.velocidade += 1
+            if self.velocidade == 0:
+                self.velocidade = 1
+            print("Velocidade: ", self.velocidade)
+
+    def reproduz(self):
+        '''(Reprodutor) -> None
+        Laco de reproducao; ao chegar ao fim procura quadros novos,
+        permitindo acompanhar uma simulacao que ainda esta gravando
+        '''
+        vs = self.visual
+        vs.scene.bind('keydown', self.key_input)
+        while True:
+            vs.rate(self.fps)
+            if len(self.traj) == 0:
+                self.traj.atualiza()
+                continue
+            if not self.pause:
+                self.f += self.velocidade
+                if self.f >= len(self.traj):
+                    self.traj.atualiza()
+                self.f = min(max(self.f, 0), len(self.traj) - 1)
+            self.desenha(self.f)
+
+###############################################################################
+
+if __name__ == "__main__":
+    from sys import argv
+    if len(argv) < 2:
+        print("Uso: python trajetoria.py <arquivo.traj> [velocidade]")
+    else:
+        vel = int(argv[2]) if len(argv) > 2 else 1
+        Reprodutor(argv[1], vel).reproduz()
@@ -3,9 +3,11 @@ from __future__ import division
 
 from numpy import sqrt
 
-class Vetor:
+class Vetor(object):
     """Classe Vetor, representa um vetor do R^3"""
 
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, u=(0, 0, 0)):
         self.x = u[0]
         self.y = u[1]
@@ -30,6 +32,33 @@ class Vetor:
         soma.z = self.z + other.z
         return soma
 
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def __imul__(self, real):
+        self.x *= real
+        self.y *= real
+        self.z *= real
+        return self
+
+    def axpy(self, a, other):
+        '''(Vetor, float, Vetor) -> Vetor
+        Soma a * other em self, sem criar vetores; retorna self
+        '''
+        self.x += a * other.x
+        self.y += a * other.y
+        self.z += a * other.z
+        return self
+
     def to_list(self):
         return [self.x, self.y, self.z]
 
@@ -41,7 +70,11 @@ class Vetor:
         return novo
 
     def __sub__(self, other):
-        return self + other.multiply(-1)
+        dif = Vetor()
+        dif.x = self.x - other.x
+        dif.y = self.y - other.y
+        dif.z = self.z - other.z
+        return dif
 
     def modulo2(self):
         return self.x*self.x + self.y*self.y + self.z*self.z
@@ -61,13 +94,14 @@ class Vetor:
         Recebe referências `self` e `other` a objetos vetor e
         retorna a distância euclidiana entre os pontos representados
         por `self` e `other`.'''
-        d = self - other
-        return d.modulo()
+        return sqrt(self.distancia2(other))
 
     def distancia2(self, other):
         '''(Vetor, Vetor) -> float
         Recebe referências `self` e `other` a objetos vetor e
         retorna a distância quadrática euclidiana entre os pontos representados
         por `self` e `other`.'''
-        d = self - other
-        return d.modulo2()
+        dx = self.x - other.x
+        dy = self.y - other.y
+        dz = self.z - other.z
+        return dx*dx + dy*dy + dz*dz